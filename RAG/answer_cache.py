@@ -0,0 +1,185 @@
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+from config import (
+    ANSWER_CACHE_SIZE,
+    ANSWER_CACHE_SEMANTIC_SIZE,
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_SIMILARITY
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRAILING_PUNCTUATION = re.compile(r'[\s?!.…]+$')
+WORD = re.compile(r'\w+')
+
+def normalize_question(question: str) -> str:
+    """Key của tầng exact: NFC, chữ thường, gộp khoảng trắng, bỏ dấu ? ! . ở cuối"""
+    question = " ".join(unicodedata.normalize("NFC", question).lower().split())
+    return TRAILING_PUNCTUATION.sub('', question)
+
+def entity_tokens(question: str) -> frozenset:
+    """
+    Tên riêng / số trong câu hỏi: từ viết hoa và từ có chữ số (chữ thường, NFC).
+    "Giá vé Vịnh Hạ Long?" và "Giá vé Vịnh Lan Hạ?" có embedding rất gần nhau nhưng khác tập này
+    """
+    words = WORD.findall(unicodedata.normalize("NFC", question))
+    return frozenset(word.lower() for word in words if word[0].isupper() or any(c.isdigit() for c in word))
+
+class AnswerCache:
+    """
+    Cache câu trả lời hai tầng, trong bộ nhớ:
+      - exact: LRU theo câu hỏi đã chuẩn hóa
+      - semantic: câu hỏi cũ có embedding tương tự (inner product ≥ similarity) với embedding
+        query vừa tính và cùng tập tên riêng / số (entity_tokens) → dùng lại câu trả lời,
+        không cần search + gọi Gemini. semantic_size = 0 → tắt tầng này
+    Mỗi tầng có giới hạn số entry (LRU) và TTL. Cache gắn với version của vector store:
+    index đổi (build lại / load lại / thêm, xóa vectors) → toàn bộ cache bị xóa.
+    Thread-safe (server gọi từ nhiều worker thread).
+    """
+
+    def __init__(self, max_size: int = ANSWER_CACHE_SIZE, semantic_size: int = ANSWER_CACHE_SEMANTIC_SIZE,
+                 ttl: float = ANSWER_CACHE_TTL, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.semantic_size = semantic_size
+        self.ttl = ttl
+        self.similarity = similarity
+
+        self._lock = threading.Lock()
+        self._index_version = None
+        self._exact = OrderedDict()     # key → (expires_at, result)
+        self._semantic = OrderedDict()  # key → (expires_at, embedding, result, entity_tokens)
+        self._matrix = None             # embeddings của _semantic xếp chồng, build lại khi có thay đổi
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # ==================== TRA CỨU ====================
+    def get(self, question: str, index_version) -> dict:
+        """Tầng exact: kết quả đã cache cho đúng câu hỏi (sau chuẩn hóa), hoặc None"""
+        key = normalize_question(question)
+        with self._lock:
+            self._sync(index_version)
+            entry = self._exact.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._exact[key]
+                self.expirations += 1
+                return None
+
+            self._exact.move_to_end(key)
+            self.exact_hits += 1
+            return entry[1]
+
+    def get_similar(self, question: str, query_embedding: np.ndarray, index_version) -> dict:
+        """
+        Tầng semantic: kết quả của câu hỏi cũ giống nhất có similarity ≥ ngưỡng và cùng entity_tokens,
+        hoặc None. Trúng thì câu hỏi mới cũng được thêm vào tầng exact.
+        """
+        with self._lock:
+            self._sync(index_version)
+            self._drop_expired_semantic()
+            if not self._semantic:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix = np.stack([entry[1] for entry in self._semantic.values()])
+            scores = self._matrix @ np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            keys = list(self._semantic)
+            entities = entity_tokens(question)
+            best = next((int(i) for i in np.argsort(-scores)
+                         if scores[i] >= self.similarity and self._semantic[keys[i]][3] == entities), None)
+            if best is None:
+                self.misses += 1
+                return None
+
+            key = keys[best]
+            result = self._semantic[key][2]
+            self._semantic.move_to_end(key)
+            self._matrix = None
+            self._put_exact(normalize_question(question), result)
+            self.semantic_hits += 1
+            logger.info(f"♻️  Semantic cache hit (sim {scores[best]:.4f}): '{key}'")
+            return result
+
+    # ==================== GHI ====================
+    def put(self, question: str, query_embedding: np.ndarray, result: dict, index_version):
+        """Lưu kết quả vào cả hai tầng; bỏ qua nếu index đã đổi kể từ lúc tra cứu"""
+        key = normalize_question(question)
+        with self._lock:
+            if index_version != self._index_version:
+                return
+
+            self._put_exact(key, result)
+            if query_embedding is None or not self.semantic_size:
+                return
+
+            embedding = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+            self._semantic[key] = (time.monotonic() + self.ttl, embedding, result, entity_tokens(question))
+            self._semantic.move_to_end(key)
+            while len(self._semantic) > self.semantic_size:
+                self._semantic.popitem(last=False)
+                self.evictions += 1
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # ==================== NỘI BỘ (gọi khi đang giữ lock) ====================
+    def _sync(self, index_version):
+        if index_version != self._index_version:
+            if self._exact or self._semantic:
+                self.invalidations += 1
+                logger.info("🧹 Index đã thay đổi → xóa answer cache")
+            self._clear()
+            self._index_version = index_version
+
+    def _clear(self):
+        self._exact.clear()
+        self._semantic.clear()
+        self._matrix = None
+
+    def _put_exact(self, key: str, result: dict):
+        if not self.max_size:
+            return
+        self._exact[key] = (time.monotonic() + self.ttl, result)
+        self._exact.move_to_end(key)
+        while len(self._exact) > self.max_size:
+            self._exact.popitem(last=False)
+            self.evictions += 1
+
+    def _drop_expired_semantic(self):
+        now = time.monotonic()
+        expired = [key for key, entry in self._semantic.items() if entry[0] < now]
+        for key in expired:
+            del self._semantic[key]
+        if expired:
+            self.expirations += len(expired)
+            self._matrix = None
+
+    # ==================== THỐNG KÊ ====================
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "exact_entries": len(self._exact),
+                "semantic_entries": len(self._semantic),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations
+            }
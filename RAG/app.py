@@ -5,11 +5,8 @@ Dùng Gemini + FAISS + Semantic Search
 
 import logging
 import sys
-from pathlib import Path
-from config import FAISS_INDEX_PATH, FAISS_METADATA_PATH
-from embedding_service import EmbeddingService
-from vector_store import FAISSVectorStore
-from gemini_rag import GeminiRAG
+from startup import StartupTimer, load_services
+from config import INDEX_HOT_SWAP
 
 # ==================== LOGGING ====================
 logging.basicConfig(
@@ -19,8 +16,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 def check_vector_store():
-    """Kiểm tra xem vector store đã được training chưa"""
-    if not Path(FAISS_INDEX_PATH).exists() or not Path(FAISS_METADATA_PATH).exists():
+    """Kiểm tra xem vector store đã được training chưa (chỉ kiểm tra file, không import faiss)"""
+    from index_versions import index_exists
+    if not index_exists():
         logger.error("\n❌ FAISS vector store chưa được tạo!")
         logger.info("\n💡 Hãy chạy lệnh sau trước:")
         logger.info("   python train_rag.py")
@@ -32,26 +30,32 @@ def main():
     logger.info("="*60)
     
     try:
-        # Kiểm tra vector store
-        check_vector_store()
-        
-        # Load services
-        logger.info("\n🔄 Khởi tạo hệ thống...")
-        
-        logger.info("  1️⃣  Load embedding service...")
-        embedding_service = EmbeddingService()
+        timer = StartupTimer()
         
-        logger.info("  2️⃣  Load vector store...")
-        vector_store = FAISSVectorStore()
-        vector_store.load()
+        # Kiểm tra vector store
+        with timer.span("check vector store"):
+            check_vector_store()
         
-        logger.info("  3️⃣  Khởi tạo RAG chain...")
-        rag = GeminiRAG(vector_store, embedding_service)
+        # Load services: embedding model, vector store và Gemini song song trên thread nền
+        logger.info("\n🔄 Khởi tạo hệ thống (embedding model + vector store + Gemini song song)...")
+        _, _, rag = load_services(timer)
         
         logger.info("\n✅ Hệ thống sẵn sàng!\n")
+        timer.report()
+        
+        # Train lại trong lúc chat → index mới được load nền và thay vào giữa hai câu hỏi
+        if INDEX_HOT_SWAP:
+            from index_watcher import IndexWatcher
+            IndexWatcher(rag.vector_store, rag.swap_vector_store).start()
         
         # Interactive chat
         rag.interactive_chat()
+        
+        # Latency từng stage của phiên chat
+        try:
+            rag.dump_metrics()
+        except OSError as e:
+            logger.warning(f"⚠️ Không ghi được metrics: {str(e)}")
     
     except Exception as e:
         logger.error(f"❌ Lỗi: {str(e)}")
@@ -0,0 +1,63 @@
+"""
+BENCHMARK CHUNKING - So sánh chunker native (StreamingChunker) với vòng lặp LangChain
+(RecursiveCharacterTextSplitter gọi cho từng trang) trên chính các file PDF đã cấu hình.
+Text được trích xuất trước, chỉ đo thời gian chunking.
+"""
+
+import logging
+import time
+import numpy as np
+from pdf_loader import load_pdfs, pdf_files
+from semantic_chunker import StreamingChunker, iter_chunks, iter_native_chunks, make_text_splitter
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+REPEATS = 3  # Lấy thời gian tốt nhất trong số lần chạy
+
+def run(name: str, chunk_fn, documents: list) -> dict:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        chunks = chunk_fn(documents)
+        best = min(best, time.perf_counter() - start)
+
+    lengths = np.array([len(chunk.page_content) for chunk in chunks])
+    spanning = sum(1 for chunk in chunks if chunk.metadata.get("page_end", chunk.metadata["page"]) != chunk.metadata["page"])
+    return {
+        "name": name,
+        "seconds": best,
+        "pages_per_s": len(documents) / best if best else 0.0,
+        "chunks": len(chunks),
+        "avg_len": float(lengths.mean()) if len(lengths) else 0.0,
+        "min_len": int(lengths.min()) if len(lengths) else 0,
+        "spanning": spanning
+    }
+
+def main():
+    logger.info("📖 Trích xuất text...")
+    documents = load_pdfs(pdf_files())
+    logger.info(f"🔬 Benchmark chunking: {len(documents)} trang, tốt nhất / {REPEATS} lần\n")
+
+    text_splitter = make_text_splitter()
+    rows = [
+        run("langchain", lambda docs: list(iter_chunks(docs, text_splitter)), documents),
+        run("native/page", lambda docs: list(iter_native_chunks(docs, StreamingChunker(across_pages=False))), documents),
+        run("native", lambda docs: list(iter_native_chunks(docs)), documents)
+    ]
+
+    baseline = rows[0]["seconds"]
+    logger.info(f"\n{'='*90}")
+    logger.info(f"{'Chunker':<14}{'Time s':>10}{'Pages/s':>12}{'Speedup':>10}{'Chunks':>10}{'Avg len':>10}{'Min len':>10}{'Qua trang':>12}")
+    logger.info(f"{'='*90}")
+    for row in rows:
+        speedup = baseline / row["seconds"] if row["seconds"] else 0.0
+        logger.info(
+            f"{row['name']:<14}{row['seconds']:>10.3f}{row['pages_per_s']:>12.0f}{speedup:>9.1f}x"
+            f"{row['chunks']:>10}{row['avg_len']:>10.0f}{row['min_len']:>10}{row['spanning']:>12}"
+        )
+    logger.info(f"{'='*90}")
+    logger.info("• native/page: không chunk qua ranh giới trang (CHUNK_ACROSS_PAGES = False)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+BENCHMARK EMBEDDING BACKEND - So sánh các backend embedding (int8 / ONNX) với model fp32
+trên chính chunk set đã train: độ khớp cosine từng vector, độ khớp top-k láng giềng, tốc độ
+encode batch và latency encode query (có prefix query / passage của model). Backend đạt EMBEDDING_MIN_AGREEMENT mới nên dùng.
+"""
+
+import logging
+import time
+import numpy as np
+from embedding_models import model_spec
+from sharded_store import load_chunk_stores
+from config import EMBEDDING_MIN_AGREEMENT
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+SAMPLE = 1000  # Số chunk dùng để so sánh
+NUM_QUERIES = 100  # Số chunk (cắt ngắn) dùng làm query
+QUERY_CHARS = 120
+K = 10
+
+def encode(model, texts: list) -> np.ndarray:
+    return model.encode(texts, batch_size=32, show_progress_bar=False, convert_to_numpy=True, normalize_embeddings=True)
+
+def measure(model, texts: list, queries: list) -> dict:
+    start = time.perf_counter()
+    vectors = encode(model, texts)
+    batch_s = time.perf_counter() - start
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        start = time.perf_counter()
+        query_vectors.append(encode(model, [query])[0])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "vectors": vectors,
+        "queries": np.stack(query_vectors),
+        "texts_per_s": len(texts) / batch_s if batch_s else 0.0,
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95))
+    }
+
+def topk_agreement(ref: dict, cand: dict) -> float:
+    """Tỉ lệ top-K láng giềng (query → chunk) trùng với fp32"""
+    ref_top = np.argsort(-(ref["queries"] @ ref["vectors"].T), axis=1)[:, :K]
+    cand_top = np.argsort(-(cand["queries"] @ cand["vectors"].T), axis=1)[:, :K]
+    return float(np.mean([len(set(a) & set(b)) / K for a, b in zip(ref_top.tolist(), cand_top.tolist())]))
+
+def sample_chunks(size: int = SAMPLE, paths=None) -> list:
+    """Nội dung size chunk ngẫu nhiên (cố định theo seed) của version paths, kể cả version chia shard"""
+    stores = load_chunk_stores(paths)
+    total = sum(len(store) for store in stores)
+    rng = np.random.default_rng(0)
+    rows = np.sort(rng.choice(total, size=min(size, total), replace=False)).tolist()
+    return [stores[row % len(stores)].content(row // len(stores)) for row in rows]
+
+def main():
+    from embedding_service import BACKENDS, load_model
+
+    chunks = sample_chunks()
+    spec = model_spec()
+    texts = [spec["passage_prefix"] + content for content in chunks]
+    queries = [spec["query_prefix"] + content[:QUERY_CHARS] for content in chunks[:NUM_QUERIES]]
+    logger.info(f"🔬 Benchmark embedding: {len(texts)} chunks, {len(queries)} queries, top-{K}\n")
+
+    logger.info("⏳ torch (fp32, tham chiếu)...")
+    reference = measure(load_model("torch"), texts, queries)
+
+    results = [("torch", reference, 1.0, 1.0, 1.0)]
+    for backend in BACKENDS[1:]:
+        logger.info(f"⏳ {backend}...")
+        try:
+            result = measure(load_model(backend), texts, queries)
+        except Exception as e:
+            logger.warning(f"   ⚠️ Bỏ qua {backend}: {str(e)}")
+            continue
+        cosines = np.einsum('ij,ij->i', result["vectors"], reference["vectors"])
+        results.append((backend, result, float(cosines.mean()), float(cosines.min()), topk_agreement(reference, result)))
+
+    logger.info(f"\n{'='*92}")
+    logger.info(f"{'Backend':<12}{'Cos mean':>10}{'Cos min':>10}{'Top-' + str(K):>8}{'Texts/s':>10}{'Query p50':>12}{'Query p95':>12}{'Speedup':>10}{'':>8}")
+    logger.info(f"{'='*92}")
+    for backend, result, cos_mean, cos_min, agreement in results:
+        speedup = reference["query_p50_ms"] / result["query_p50_ms"] if result["query_p50_ms"] else 0.0
+        verdict = "✅" if cos_mean >= EMBEDDING_MIN_AGREEMENT else "❌"
+        logger.info(
+            f"{backend:<12}{cos_mean:>10.4f}{cos_min:>10.4f}{agreement:>8.3f}{result['texts_per_s']:>10.1f}"
+            f"{result['query_p50_ms']:>10.2f}ms{result['query_p95_ms']:>10.2f}ms{speedup:>9.2f}x{verdict:>8}"
+        )
+    logger.info(f"{'='*92}")
+    logger.info(f"• ✅ = cosine trung bình với fp32 ≥ {EMBEDDING_MIN_AGREEMENT}")
+    logger.info("  → đặt EMBEDDING_BACKEND / EMBEDDING_THREADS trong config.py rồi chạy lại train_rag.py")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+BENCHMARK ANN INDEX - So sánh recall@k / latency của các loại FAISS index
+với flat index trên chính dữ liệu đã train, để chọn FAISS_INDEX_TYPE + nprobe/efSearch.
+Index nén (sq8, sq_fp16, *_pq) được đo thêm với re-score chính xác (EXACT_RESCORE, RESCORE_FACTOR).
+"""
+
+import logging
+import numpy as np
+from sharded_store import load_vector_store
+from index_factory import INDEX_TYPES, benchmark_index_types
+from config import RESCORE_FACTOR
+
+logging.basicConfig(level=logging.INFO, format='%(message)s')
+logger = logging.getLogger(__name__)
+
+NUM_QUERIES = 500  # Số chunk giữ lại làm query (không nằm trong index benchmark)
+K = 10
+NPROBES = [1, 4, 8, 16, 32, 64]
+EF_SEARCHES = [16, 32, 64, 128, 256]
+
+def main():
+    logger.info("📂 Load vector store...")
+    vector_store = load_vector_store()
+    try:
+        embeddings = vector_store.embeddings()
+    finally:
+        vector_store.close()
+
+    # Tách ngẫu nhiên NUM_QUERIES chunk làm query, phần còn lại làm dữ liệu
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(embeddings))
+    num_queries = min(NUM_QUERIES, len(embeddings) // 10)
+    queries = embeddings[order[:num_queries]]
+    database = embeddings[np.sort(order[num_queries:])]
+
+    logger.info(f"🔬 Benchmark: {len(database)} vectors, {num_queries} queries, recall@{K}\n")
+    rows = benchmark_index_types(database, queries, K, INDEX_TYPES, NPROBES, EF_SEARCHES, RESCORE_FACTOR)
+
+    logger.info(f"\n{'='*92}")
+    logger.info(f"{'Index':<12}{'Param':<22}{'Recall@' + str(K):>10}{'p50 ms':>10}{'p95 ms':>10}{'Size MB':>10}{'Build s':>10}")
+    logger.info(f"{'='*92}")
+    for row in rows:
+        logger.info(
+            f"{row['index_type']:<12}{row['param']:<22}{row['recall']:>10.4f}"
+            f"{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}{row['memory_mb']:>10.1f}{row['build_s']:>10.1f}"
+        )
+    logger.info(f"{'='*92}")
+    logger.info("• Chọn cấu hình có recall đủ cao (vd. ≥ 0.95) với latency thấp nhất")
+    logger.info("  → đặt FAISS_INDEX_TYPE, FAISS_NPROBE / HNSW_EF_SEARCH trong config.py rồi chạy lại train_rag.py")
+    logger.info("• Dòng rescore: Size MB chỉ gồm index trong RAM, vectors float32 được mmap từ đĩa")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+import math
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+import numpy as np
+from chunk_store import _make_tmp_dir, _replace_dir
+from config import BM25_K1, BM25_B, BM25_BIGRAMS
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Bỏ dấu tiếng Việt: sau NFD dấu thanh / dấu mũ là ký tự combining (U+0300-U+036F); "đ" không tách được nên map riêng
+_FOLD_TABLE = {code: None for code in range(0x300, 0x370)}
+_FOLD_TABLE[ord("đ")] = "d"
+
+def fold_diacritics(text: str) -> str:
+    """"Đà Lạt" → "da lat" (chữ thường, không dấu)"""
+    return unicodedata.normalize("NFD", text.lower()).translate(_FOLD_TABLE)
+
+def tokenize(text: str, bigrams: bool = BM25_BIGRAMS) -> list:
+    """
+    Tách âm tiết (tiếng Việt viết tách âm tiết bằng khoảng trắng) sau khi bỏ dấu.
+    bigrams=True: thêm cặp âm tiết liền nhau ("da_lat") để địa danh nhiều âm tiết khớp chính xác hơn
+    """
+    tokens = TOKEN_PATTERN.findall(fold_diacritics(text))
+    if bigrams:
+        tokens += [f"{a}_{b}" for a, b in zip(tokens, tokens[1:])]
+    return tokens
+
+class BM25Index:
+    """
+    Inverted index BM25 trên nội dung chunks, doc id = vị trí chunk (trùng id trong FAISS index).
+
+    Thư mục index gồm:
+      - terms.json: từ điển term (term id = vị trí)
+      - offsets.npy: int64 (n_terms + 1), postings của term t = [offsets[t], offsets[t + 1])
+      - doc_ids.npy / tfs.npy: postings (doc id, tần suất term trong doc)
+      - doc_lengths.npy: số token mỗi chunk
+      - params.json: k1, b, bigrams (tokenize query giống lúc build)
+    """
+
+    def __init__(self, terms: list, offsets: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                 doc_lengths: np.ndarray, params: dict):
+        self._vocab = {term: i for i, term in enumerate(terms)}
+        self._offsets = offsets
+        self._doc_ids = doc_ids
+        self._tfs = tfs
+        self._doc_lengths = doc_lengths
+        self.params = params
+
+        # Phần mẫu số BM25 chỉ phụ thuộc độ dài doc → tính trước một lần
+        k1, b = params["k1"], params["b"]
+        avgdl = float(np.mean(doc_lengths)) if len(doc_lengths) else 0.0
+        self._norm = (k1 * (1 - b + b * doc_lengths / avgdl)).astype(np.float32) if avgdl else np.full(len(doc_lengths), k1, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    @property
+    def num_terms(self) -> int:
+        return len(self._vocab)
+
+    # ==================== BUILD ====================
+    @classmethod
+    def build(cls, texts, k1: float = BM25_K1, b: float = BM25_B, bigrams: bool = BM25_BIGRAMS) -> "BM25Index":
+        """Build từ iterator nội dung chunks (theo thứ tự id)"""
+        postings = {}  # term → (doc ids, tfs)
+        doc_lengths = array('i')
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text, bigrams)
+            doc_lengths.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array('i'), array('i'))
+                entry[0].append(doc_id)
+                entry[1].append(tf)
+
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        if terms:
+            offsets[1:] = np.cumsum([len(postings[term][0]) for term in terms])
+        doc_ids = np.zeros(offsets[-1], dtype=np.int32)
+        tfs = np.zeros(offsets[-1], dtype=np.int32)
+        for i, term in enumerate(terms):
+            doc_ids[offsets[i]:offsets[i + 1]] = postings[term][0]
+            tfs[offsets[i]:offsets[i + 1]] = postings[term][1]
+
+        params = {"k1": k1, "b": b, "bigrams": bigrams}
+        return cls(terms, offsets, doc_ids, tfs, np.array(doc_lengths, dtype=np.int32), params)
+
+    # ==================== SEARCH ====================
+    def search(self, query: str, k: int, mask: np.ndarray = None) -> tuple:
+        """
+        Top-k chunk theo điểm BM25 → (doc ids int64, scores float32), chỉ gồm chunk có khớp term
+        mask: bitmap (bool, n) chunk được phép trả về (SearchFilter), None = mọi chunk
+        """
+        n = len(self)
+        scores = np.zeros(n, dtype=np.float32)
+        k1 = self.params["k1"]
+
+        for term in set(tokenize(query, self.params["bigrams"])):
+            term_id = self._vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self._offsets[term_id], self._offsets[term_id + 1]
+            docs = self._doc_ids[start:end]
+            tf = self._tfs[start:end].astype(np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            # Mỗi doc xuất hiện tối đa một lần trong postings của một term → cộng trực tiếp
+            scores[docs] += idf * tf * (k1 + 1) / (tf + self._norm[docs])
+
+        if mask is not None:
+            scores[~mask] = 0
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return order.astype(np.int64), scores[order]
+
+    # ==================== LƯU / LOAD ====================
+    def save(self, path: str):
+        """Ghi vào thư mục tạm rồi thay thế (như ChunkStore.save)"""
+        # Nhả các file đang map trước khi thay thư mục đích
+        self._offsets = np.array(self._offsets)
+        self._doc_ids = np.array(self._doc_ids)
+        self._tfs = np.array(self._tfs)
+
+        tmp = _make_tmp_dir(path)
+        with open(tmp / "terms.json", 'w', encoding='utf-8') as f:
+            json.dump(sorted(self._vocab, key=self._vocab.get), f, ensure_ascii=False)
+        with open(tmp / "params.json", 'w', encoding='utf-8') as f:
+            json.dump(self.params, f)
+        np.save(tmp / "offsets.npy", self._offsets)
+        np.save(tmp / "doc_ids.npy", self._doc_ids)
+        np.save(tmp / "tfs.npy", self._tfs)
+        np.save(tmp / "doc_lengths.npy", self._doc_lengths)
+        _replace_dir(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """Postings được map từ đĩa, chỉ từ điển term được đọc vào bộ nhớ"""
+        root = Path(path)
+        with open(root / "terms.json", 'r', encoding='utf-8') as f:
+            terms = json.load(f)
+        with open(root / "params.json", 'r', encoding='utf-8') as f:
+            params = json.load(f)
+        return cls(
+            terms,
+            np.load(root / "offsets.npy", mmap_mode='r'),
+            np.load(root / "doc_ids.npy", mmap_mode='r'),
+            np.load(root / "tfs.npy", mmap_mode='r'),
+            np.load(root / "doc_lengths.npy"),
+            params
+        )
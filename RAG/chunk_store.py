@@ -0,0 +1,320 @@
+import json
+import os
+import shutil
+from array import array
+import numpy as np
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+MISSING = -1  # Giá trị cột khi chunk không có key metadata đó
+
+def _value_kind(value) -> str:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return "int"
+    return "category" if isinstance(value, str) else "json"
+
+def _as_int(key: str, value) -> int:
+    """Giá trị filter cho cột int: "5" / 5.0 → 5, giá trị không phải số nguyên → ValueError"""
+    try:
+        number = int(value)
+        exact = number == float(value)
+    except (TypeError, ValueError):
+        exact = False
+    if not exact:
+        raise ValueError(f"where.{key}: cần số nguyên, nhận {value!r}")
+    return number
+
+class _ColumnBuilder:
+    """
+    Mã hóa một cột metadata theo từng dòng. Kiểu cột được chọn theo giá trị đầu tiên
+    và chuyển sang "json" nếu gặp giá trị khác kiểu (kết quả giống hệt khi mã hóa cả cột một lần).
+    """
+
+    def __init__(self, rows_before: int = 0):
+        self.kind = None
+        self.codes = array('q', [MISSING]) * rows_before
+        self.table = {}
+
+    def append(self, value):
+        if value is None:
+            self.codes.append(MISSING)
+            return
+
+        kind = _value_kind(value)
+        if self.kind is None:
+            self.kind = kind
+        elif kind != self.kind and self.kind != "json":
+            self._to_json()
+
+        if self.kind == "int":
+            self.codes.append(value)
+            return
+        token = value if self.kind == "category" else json.dumps(value, ensure_ascii=False)
+        self.codes.append(self.table.setdefault(token, len(self.table)))
+
+    def _to_json(self):
+        if self.kind == "int":
+            table = {}
+            self.codes = array('q', (
+                MISSING if code == MISSING else table.setdefault(json.dumps(code), len(table))
+                for code in self.codes
+            ))
+        else:
+            table = {json.dumps(token, ensure_ascii=False): code for token, code in self.table.items()}
+        self.table = table
+        self.kind = "json"
+
+    def finish(self) -> tuple:
+        """(cột numpy, spec schema)"""
+        if self.kind in (None, "int"):
+            return np.array(self.codes, dtype=np.int32), {"type": "int"}
+        dtype = np.int16 if len(self.table) < np.iinfo(np.int16).max else np.int32
+        return np.array(self.codes, dtype=dtype), {"type": self.kind, "values": list(self.table)}
+
+class _MetadataColumns:
+    """Các _ColumnBuilder theo thứ tự key xuất hiện lần đầu"""
+
+    def __init__(self):
+        self.rows = 0
+        self.builders = {}
+
+    def append(self, metadata: dict):
+        for key in metadata:
+            if key not in self.builders:
+                self.builders[key] = _ColumnBuilder(self.rows)
+        for key, builder in self.builders.items():
+            builder.append(metadata.get(key))
+        self.rows += 1
+
+    def finish(self) -> tuple:
+        """(columns, schema)"""
+        columns = {}
+        schema = {}
+        for key, builder in self.builders.items():
+            columns[key], schema[key] = builder.finish()
+        return columns, schema
+
+class ChunkStore:
+    """
+    Lưu nội dung + metadata chunks dạng cột, đọc lazy qua mmap.
+
+    Thư mục store gồm:
+      - text.bin: nội dung UTF-8 của mọi chunk nối liền nhau
+      - offsets.npy: int64 (n + 1), chunk i = text[offsets[i]:offsets[i + 1]]
+      - col_<key>.npy: một cột số nguyên cho mỗi key metadata
+      - schema.json: kiểu cột ("int" hoặc "category" kèm bảng giá trị, vd. tên source)
+
+    store[i] trả về {"content": ..., "metadata": {...}} giống phần tử của list metadata cũ,
+    chỉ decode đúng dòng được truy cập.
+    """
+
+    def __init__(self, text, offsets: np.ndarray, columns: dict, schema: dict):
+        self._text = text
+        self._offsets = offsets
+        self._columns = columns
+        self._schema = schema
+
+    # ==================== BUILD ====================
+    @classmethod
+    def from_records(cls, records: list) -> "ChunkStore":
+        """Tạo store trong bộ nhớ từ list {"content": str, "metadata": dict}"""
+        encoded = [record["content"].encode("utf-8") for record in records]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(data) for data in encoded])
+        text = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+        metadata = _MetadataColumns()
+        for record in records:
+            metadata.append(record["metadata"])
+        columns, schema = metadata.finish()
+
+        return cls(text, offsets, columns, schema)
+
+    # ==================== ĐỌC ====================
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"chunk {i} ngoài phạm vi ({len(self)})")
+        return {"content": self.content(i), "metadata": self.chunk_metadata(i)}
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def content(self, i: int) -> str:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._text[start:end]).decode("utf-8")
+
+    def chunk_metadata(self, i: int) -> dict:
+        metadata = {}
+        for key, column in self._columns.items():
+            value = int(column[i])
+            if value == MISSING:
+                continue
+            spec = self._schema[key]
+            if spec["type"] == "int":
+                metadata[key] = value
+            elif spec["type"] == "category":
+                metadata[key] = spec["values"][value]
+            else:
+                metadata[key] = json.loads(spec["values"][value])
+        return metadata
+
+    def to_records(self) -> list:
+        return list(self)
+
+    def sources(self) -> list:
+        return list(self._schema.get("source", {}).get("values", []))
+
+    def rows_for_pages(self, page_keys: set) -> np.ndarray:
+        """Vị trí các chunk thuộc các trang (source, page), tính trên cột không cần decode text"""
+        if not len(self) or not page_keys or "source" not in self._columns or "page" not in self._columns:
+            return np.zeros(0, dtype=np.int64)
+
+        source_codes = {name: code for code, name in enumerate(self.sources())}
+        wanted = {}
+        for source, page in page_keys:
+            if source in source_codes:
+                wanted.setdefault(source_codes[source], []).append(page)
+
+        source_column = self._columns["source"]
+        page_column = self._columns["page"]
+        mask = np.zeros(len(self), dtype=bool)
+        for code, pages in wanted.items():
+            mask |= (source_column == code) & np.isin(page_column, pages)
+        return np.flatnonzero(mask)
+
+    def mask(self, search_filter) -> np.ndarray:
+        """Bitmap (bool, n) các chunk thỏa SearchFilter, tính trên cột không cần decode text"""
+        mask = np.ones(len(self), dtype=bool)
+        if search_filter.sources:
+            mask &= self._column_isin("source", search_filter.sources)
+        if search_filter.pages:
+            first, last = search_filter.pages
+            page = self._columns.get("page")
+            if page is None:
+                return np.zeros(len(self), dtype=bool)
+            # Chunk qua nhiều trang (page → page_end) được chọn nếu giao với khoảng trang
+            page_end = self._columns.get("page_end")
+            page_end = page if page_end is None else np.where(page_end == MISSING, page, page_end)
+            mask &= (page != MISSING) & (page <= last) & (page_end >= first)
+        for key, values in search_filter.where:
+            mask &= self._column_isin(key, values)
+        return mask
+
+    def _column_isin(self, key: str, values) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            return np.zeros(len(self), dtype=bool)
+
+        spec = self._schema[key]
+        if spec["type"] == "int":
+            codes = [_as_int(key, value) for value in values]
+        elif spec["type"] == "category":
+            codes = [code for code, value in enumerate(spec["values"]) if value in values]
+        else:
+            codes = [code for code, value in enumerate(spec["values"]) if json.loads(value) in values]
+        return np.isin(column, codes)
+
+    # ==================== THAY ĐỔI ====================
+    def select(self, rows) -> "ChunkStore":
+        """Store mới (trong bộ nhớ) chỉ gồm các dòng rows theo thứ tự đã cho"""
+        return ChunkStore.from_records([self[int(i)] for i in rows])
+
+    def extend(self, records: list) -> "ChunkStore":
+        """Store mới (trong bộ nhớ) = các chunk hiện có + records"""
+        return ChunkStore.from_records(self.to_records() + list(records))
+
+    # ==================== LƯU / LOAD ====================
+    def save(self, path: str):
+        """Ghi vào thư mục tạm rồi thay thế, không bao giờ để lại store ghi dở"""
+        # Đọc hết vào bộ nhớ trước: nếu store đang map chính thư mục đích thì phải nhả file
+        # (Windows không cho xóa file đang được map)
+        self._text = np.frombuffer(bytes(self._text), dtype=np.uint8)
+        self._offsets = np.array(self._offsets)
+        self._columns = {key: np.array(column) for key, column in self._columns.items()}
+
+        tmp = _make_tmp_dir(path)
+        with open(tmp / "text.bin", 'wb') as f:
+            f.write(self._text.tobytes())
+        _write_columns(tmp, self._offsets, self._columns, self._schema)
+        _replace_dir(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkStore":
+        """Map store từ đĩa - không đọc nội dung chunk cho tới khi được truy cập"""
+        root = Path(path)
+        with open(root / "schema.json", 'r', encoding='utf-8') as f:
+            schema = json.load(f)["columns"]
+
+        offsets = np.load(root / "offsets.npy", mmap_mode='r')
+        text_path = root / "text.bin"
+        text = (
+            np.memmap(text_path, dtype=np.uint8, mode='r')
+            if text_path.stat().st_size else np.zeros(0, dtype=np.uint8)
+        )
+        columns = {key: np.load(root / f"col_{key}.npy", mmap_mode='r') for key in schema}
+        return cls(text, offsets, columns, schema)
+
+def _make_tmp_dir(path: str) -> Path:
+    tmp = Path(str(path) + ".tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    return tmp
+
+def _write_columns(root: Path, offsets: np.ndarray, columns: dict, schema: dict):
+    np.save(root / "offsets.npy", offsets)
+    for key, column in columns.items():
+        np.save(root / f"col_{key}.npy", column)
+    with open(root / "schema.json", 'w', encoding='utf-8') as f:
+        json.dump({"count": len(offsets) - 1, "columns": schema}, f, ensure_ascii=False)
+
+def _replace_dir(tmp: Path, path: str):
+    target = Path(path)
+    if target.exists():
+        shutil.rmtree(target)
+    os.replace(tmp, target)
+
+class ChunkStoreWriter:
+    """
+    Ghi chunk store thẳng ra đĩa theo từng batch records: text được ghi nối tiếp vào text.bin,
+    trong bộ nhớ chỉ giữ offsets + mã cột (vài byte mỗi chunk).
+    Store chỉ thay thế thư mục đích khi close() thành công.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp = _make_tmp_dir(path)
+        self._text = open(self._tmp / "text.bin", 'wb')
+        self._offsets = array('q', [0])
+        self._metadata = _MetadataColumns()
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def append(self, records: list):
+        for record in records:
+            data = record["content"].encode("utf-8")
+            self._text.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            self._metadata.append(record["metadata"])
+
+    def close(self) -> ChunkStore:
+        """Hoàn tất store và trả về ChunkStore đã map từ đĩa"""
+        self._text.close()
+        columns, schema = self._metadata.finish()
+        _write_columns(self._tmp, np.array(self._offsets, dtype=np.int64), columns, schema)
+        _replace_dir(self._tmp, self.path)
+        return ChunkStore.load(self.path)
+
+    def abort(self):
+        self._text.close()
+        shutil.rmtree(self._tmp, ignore_errors=True)
@@ -6,32 +6,131 @@ load_dotenv()
 # ==================== PDF PATHS ====================
 PDF_FILE_1 = r"E:\Sỹ\archive (1)\Đề án.pdf"  # 536 trang
 PDF_FILE_2 = r"E:\Sỹ\archive (1)\vietnam_tourism_data.pdf"  # 2807 trang
+PDF_CORPUS = ""  # Thư mục (quét đệ quy *.pdf) hoặc glob, vd. r"E:\brochures\**\*.pdf"; rỗng = PDF_FILE_1 + PDF_FILE_2
+
+# ==================== PDF EXTRACTION SETTINGS ====================
+PDF_EXTRACT_WORKERS = 0  # Số process trích xuất song song (0 = số CPU, 1 = tuần tự)
+PDF_PAGES_PER_SHARD = 64  # Số trang mỗi shard gửi cho một worker
+PDF_EXTRACT_CACHE_DIR = r"e:\pdf_extract_cache"  # Text đã trích xuất của từng file (theo size + mtime), "" = tắt
+INGEST_REPORT_PATH = r"e:\ingest_report.json"  # Báo cáo trích xuất từng file: số trang, thời gian, lỗi
 
 # ==================== CHUNK SETTINGS ====================
 CHUNK_SIZE = 1500  # ký tự
 CHUNK_OVERLAP = 150  # 10% của 1500
-SEMANTIC_CHUNKING = True
+SEMANTIC_CHUNKING = True  # Cắt chunk tại chỗ chủ đề đổi (embedding câu), False = cắt theo CHUNK_SIZE / separators
+SEMANTIC_BREAKPOINT_PERCENTILE = 90  # Khoảng cách giữa hai câu liền nhau vượt percentile này → điểm cắt
+SEMANTIC_BREAKPOINT_WINDOW = 256  # Percentile tính trên chừng này khoảng cách gần nhất của file (không phụ thuộc batch)
+SEMANTIC_MIN_CHUNK_SIZE = 300  # ký tự, chunk ngắn hơn không bị cắt tại điểm chủ đề
+SEMANTIC_SENTENCE_BATCH = 1024  # Số câu mỗi lần embed trong pipeline
+CHUNK_ACROSS_PAGES = True  # Chunk được vắt qua ranh giới trang (đoạn văn dài hai trang không bị cắt)
 
 # ==================== EMBEDDING SETTINGS ====================
 # Using publicly available model from sentence-transformers
 EMBEDDING_MODEL = "intfloat/multilingual-e5-base"
 EMBEDDING_DIMENSION = 768
+USE_EMBEDDING_CACHE = True  # Cache embedding chunks trên đĩa, bỏ qua model với chunk đã embed
+EMBEDDING_CACHE_DIR = r"e:\embedding_cache"
+EMBEDDING_BACKEND = "torch"  # torch (fp32) | torch_int8 | onnx | onnx_int8 (kiểm tra bằng benchmark_embedding.py)
+EMBEDDING_THREADS = 0  # Số thread intra-op khi encode trên CPU (0 = mặc định của torch / onnxruntime)
+EMBEDDING_ONNX_DIR = r"e:\embedding_onnx"  # Model ONNX đã export + quantize (tạo lần đầu dùng onnx_int8)
+ONNX_QUANTIZATION = "avx512_vnni"  # Cấu hình quantize int8 theo CPU: arm64 | avx2 | avx512 | avx512_vnni
+EMBEDDING_MIN_AGREEMENT = 0.99  # Cosine trung bình tối thiểu so với fp32, kiểm tra lúc load; thấp hơn → quay về torch
+
+# ==================== QUERY BATCHING SETTINGS ====================
+USE_QUERY_BATCHING = True  # Gom query embedding của các request đồng thời thành một lần encode
+QUERY_BATCH_MAX_WAIT_MS = 5.0  # Thời gian tối đa chờ thêm query cho một batch (0 = chỉ gom query đã chờ sẵn)
+QUERY_BATCH_MAX_SIZE = 32  # Số query tối đa mỗi batch (thực tế ≤ SERVER_WORKER_THREADS)
+
+# ==================== INGEST PIPELINE SETTINGS ====================
+INGEST_BATCH_SIZE = 256  # Số chunks mỗi batch embedding → index.add
+INGEST_PAGE_QUEUE_SIZE = 64  # Số trang tối đa chờ chunking
+INGEST_BATCH_QUEUE_SIZE = 4  # Số batch chunks tối đa chờ embedding
 
 # ==================== VECTOR DB SETTINGS ====================
 # Store index in a simple ASCII path to avoid encoding issues
+FAISS_VERSIONS_DIR = r"e:\faiss_versions"  # Mỗi version: index.faiss + chunks (mmap) + bm25 + info.json, file CURRENT trỏ tới version đang dùng
+INDEX_KEEP_VERSIONS = 3  # Số version giữ lại trên đĩa (gồm CURRENT)
+FAISS_MANIFEST_PATH = r"e:\faiss_manifest.json"  # Hash nội dung từng (source, page) đã index
+# Bố cục cũ (trước khi có version): vẫn load được, lần lưu tiếp theo ghi sang FAISS_VERSIONS_DIR
 FAISS_INDEX_PATH = r"e:\faiss_index\index.faiss"
-FAISS_METADATA_PATH = r"e:\faiss_metadata.pkl"
+FAISS_CHUNKS_PATH = r"e:\faiss_chunks"  # Chunk store dạng cột (mmap), thay cho pickle metadata
+FAISS_METADATA_PATH = r"e:\faiss_metadata.pkl"  # Định dạng cũ, chỉ dùng để chuyển đổi sang chunk store
+FAISS_BM25_PATH = r"e:\faiss_bm25"  # Inverted index BM25 trên cùng chunks (id trùng FAISS)
+FAISS_INFO_PATH = r"e:\faiss_index\info.json"  # Model + prefix query / passage đã dùng để build index
+INCREMENTAL_INDEXING = True  # Chỉ re-embed các trang thay đổi khi train lại
+
+# ==================== ANN INDEX SETTINGS ====================
+FAISS_INDEX_TYPE = "flat"  # flat | ivf_flat | ivf_pq | hnsw | opq_ivf_pq | sq8 (4x nhỏ hơn) | sq_fp16 (2x)
+IVF_NLIST = 0  # Số cluster IVF (0 = tự chọn ~4*sqrt(n))
+PQ_M = 48  # Số sub-quantizer PQ (phải chia hết EMBEDDING_DIMENSION)
+PQ_NBITS = 8  # Bits mỗi mã PQ
+HNSW_M = 32  # Số cạnh mỗi node HNSW
+HNSW_EF_CONSTRUCTION = 200
+INDEX_TRAIN_SAMPLE = 50000  # Số vectors tối đa dùng để train IVF/PQ
+FAISS_NPROBE = 16  # Số cluster IVF quét khi search
+HNSW_EF_SEARCH = 64  # Độ rộng beam HNSW khi search
+EXACT_RESCORE = True  # Index nén (sq8, sq_fp16, *_pq): lưu thêm vectors float32 (mmap, không nằm trong RAM) để re-score chính xác
+RESCORE_FACTOR = 4  # Shortlist = k * RESCORE_FACTOR ứng viên từ index nén trước khi re-score
+
+# ==================== SHARDING SETTINGS ====================
+NUM_SHARDS = 1  # > 1: train_rag.py chia chunks thành N shard, khi serve mỗi shard chạy trong một worker process
+SHARD_THREADS = 0  # Số thread FAISS mỗi worker (0 = số CPU / NUM_SHARDS)
 
 # ==================== SEMANTIC SEARCH SETTINGS ====================
 TOP_K = 5  # Number of top results to retrieve
 SIMILARITY_THRESHOLD = 0.45  # Balanced threshold to filter out irrelevant results
 USE_SIMILARITY_THRESHOLD = False  # Boolean bật/tắt
+FILTER_CACHE_SIZE = 64  # Số SearchFilter (source / trang) gần nhất giữ sẵn bitmap + FAISS IDSelector
+
+# ==================== HYBRID SEARCH SETTINGS ====================
+SEARCH_MODE = "hybrid"  # dense | hybrid (dense + BM25, gộp bằng Reciprocal Rank Fusion)
+BM25_K1 = 1.5
+BM25_B = 0.75
+BM25_BIGRAMS = True  # Thêm cặp âm tiết liền nhau ("da_lat") làm term
+HYBRID_CANDIDATES = 50  # Số ứng viên mỗi nhánh (dense / BM25) trước khi gộp
+RRF_K = 60  # Hằng số RRF: score = sum 1 / (RRF_K + rank)
+
+# ==================== RERANK SETTINGS ====================
+USE_RERANKER = False  # Chấm lại ứng viên bằng cross-encoder local trước khi đưa vào prompt
+RERANK_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Đa ngôn ngữ, có tiếng Việt
+RERANK_CANDIDATES = 50  # Số ứng viên lấy từ search để rerank
+RERANK_TOP_K = 3  # Số chunk giữ lại sau rerank (thay cho TOP_K)
+RERANK_BATCH_SIZE = 64
+RERANK_MAX_LENGTH = 512  # Token tối đa mỗi cặp (câu hỏi, chunk)
+RERANK_CACHE_SIZE = 20000  # Số điểm (câu hỏi, chunk) giữ trong cache LRU
+
+# ==================== CONTEXT SETTINGS ====================
+CONTEXT_TOKEN_BUDGET = 3000  # Token tối đa của phần tài liệu trong prompt
+CONTEXT_CHARS_PER_TOKEN = 3.0  # Ước lượng ký tự / token (tiếng Việt có dấu)
 
 # ==================== GEMINI SETTINGS ====================
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = "models/gemini-2.5-flash"  # updated to available model (<list_models>)
 GEMINI_TEMPERATURE = 0.3
 GEMINI_MAX_TOKENS = 2048
+GEMINI_BATCH_CONCURRENCY = 4  # Số request Gemini song song trong query_batch
+
+# ==================== ANSWER CACHE SETTINGS ====================
+USE_ANSWER_CACHE = True  # Cache câu trả lời cho câu hỏi lặp lại / gần giống
+ANSWER_CACHE_SIZE = 1000  # Số câu hỏi tối đa ở tầng exact (LRU)
+ANSWER_CACHE_SEMANTIC_SIZE = 0  # Số câu hỏi tối đa ở tầng semantic (LRU), 0 = tắt (chưa kiểm chứng đủ trên cặp câu gần giống)
+ANSWER_CACHE_TTL = 3600  # giây
+ANSWER_CACHE_SIMILARITY = 0.95  # Ngưỡng cosine để coi hai câu hỏi là một (kèm điều kiện trùng tên riêng / số)
+
+# ==================== METRICS SETTINGS ====================
+METRICS_WINDOW = 2048  # Số query gần nhất dùng để tính p50/p95/p99
+METRICS_PATH = r"e:\rag_metrics.prom"  # File text Prometheus (textfile collector)
+METRICS_DUMP_INTERVAL = 15  # giây, server ghi lại METRICS_PATH theo chu kỳ
+
+# ==================== SERVER SETTINGS ====================
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 8000
+SERVER_WORKER_THREADS = 4  # Thread pool cho embedding + FAISS search
+SERVER_MAX_CONCURRENT = 16  # Số request xử lý đồng thời
+SERVER_MAX_QUEUE = 64  # Số request chờ tối đa, vượt quá → HTTP 503
+SERVER_REQUEST_TIMEOUT = 60  # giây
+INDEX_HOT_SWAP = True  # Theo dõi CURRENT, load version mới trên thread nền và thay index không cần restart
+INDEX_WATCH_INTERVAL = 5  # giây giữa hai lần kiểm tra CURRENT
 
 # ==================== RAG SETTINGS ====================
 CHAIN_TYPE = "stuff"  # Q&A chain type
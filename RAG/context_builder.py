@@ -0,0 +1,101 @@
+import math
+from config import CHUNK_OVERLAP, CONTEXT_TOKEN_BUDGET, CONTEXT_CHARS_PER_TOKEN
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_HEADER = "=== THÔNG TIN TỪ TÀI LIỆU ===\n\n"
+MIN_OVERLAP = 16  # Phần trùng ngắn hơn mức này coi như trùng ngẫu nhiên, không gộp
+MIN_TRUNCATED_CHARS = 200  # Ngân sách còn lại ít hơn mức này → bỏ hẳn block thay vì cắt
+GAP_MARKER = "\n…\n"  # Giữa hai chunk cùng trang nhưng không liền nhau
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token (không gọi API đếm token): ~CONTEXT_CHARS_PER_TOKEN ký tự / token"""
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+def _overlap(left: str, right: str) -> int:
+    """Độ dài phần cuối của left trùng với phần đầu của right (chunk overlap), 0 nếu không có"""
+    prefix = right[:MIN_OVERLAP]
+    if len(prefix) < MIN_OVERLAP:
+        return 0
+    # Splitter chỉ cắt tại separator nên overlap có thể dài hơn CHUNK_OVERLAP một chút
+    start = left.find(prefix, max(0, len(left) - 2 * CHUNK_OVERLAP))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(prefix, start + 1)
+    return 0
+
+def _merge_page(docs: list) -> str:
+    """
+    Gộp các chunk của cùng (source, page) theo thứ tự trong trang (id trong index):
+    chunk liền nhau bỏ phần overlap, chunk nằm trong chunk khác bị bỏ, chunk cách xa nối bằng GAP_MARKER
+    """
+    docs = sorted(docs, key=lambda doc: doc.get("id", 0))
+    text = docs[0]["content"]
+    prev_id = docs[0].get("id")
+    for doc in docs[1:]:
+        content = doc["content"]
+        if content in text:
+            continue
+        overlap = _overlap(text, content)
+        if overlap:
+            text += content[overlap:]
+        elif prev_id is not None and doc.get("id") == prev_id + 1:
+            text += "\n" + content
+        else:
+            text += GAP_MARKER + content
+        prev_id = doc.get("id")
+    return text
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cắt tại khoảng trắng gần nhất trước max_chars"""
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars].rstrip() + "…"
+
+def build_context(retrieved_docs: list, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Context cho prompt từ kết quả search (đã sắp theo độ liên quan):
+      - chunks cùng (source, page) được gộp thành một block, bỏ phần overlap trùng lặp
+      - block xếp theo chunk liên quan nhất của nó
+      - thêm block tới khi hết token_budget; block đầu tiên vượt ngân sách bị cắt, các block sau bị bỏ
+    """
+    pages = {}  # (source, page) → docs, giữ thứ tự liên quan của chunk đầu tiên
+    for doc in retrieved_docs:
+        key = (doc["metadata"]["source"], doc["metadata"]["page"])
+        pages.setdefault(key, []).append(doc)
+
+    parts = [CONTEXT_HEADER]
+    remaining = token_budget * CONTEXT_CHARS_PER_TOKEN - len(CONTEXT_HEADER)
+    dropped = 0
+    for i, ((source, page), docs) in enumerate(pages.items(), 1):
+        similarities = [doc["similarity"] for doc in docs if doc["similarity"] is not None]
+        header = (
+            f"[{i}] ({source} - Trang {page})\n"
+            f"Độ tương tự: {max(similarities) if similarities else None}\n"
+            f"Nội dung: "
+        )
+        text = _merge_page(docs)
+
+        available = int(remaining) - len(header) - 2
+        if available < len(text):
+            if available < MIN_TRUNCATED_CHARS and i > 1:
+                dropped = len(pages) - i + 1
+                break
+            text = _truncate(text, max(available, MIN_TRUNCATED_CHARS))
+
+        block = f"{header}{text}\n\n"
+        parts.append(block)
+        remaining -= len(block)
+        if remaining <= 0:
+            dropped = len(pages) - i
+            break
+
+    context = "".join(parts)
+    logger.debug(
+        f"Context: {len(retrieved_docs)} chunks → {len(pages) - dropped} blocks "
+        f"(bỏ {dropped}), ~{estimate_tokens(context)} tokens"
+    )
+    return context
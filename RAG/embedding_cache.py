@@ -0,0 +1,119 @@
+import hashlib
+import re
+import unicodedata
+import numpy as np
+from pathlib import Path
+from config import EMBEDDING_CACHE_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 32  # sha256 digest
+
+class EmbeddingCache:
+    """
+    Cache embedding trên đĩa, key = sha256(model + text đã chuẩn hóa).
+    Mỗi model có một thư mục riêng gồm:
+      - vectors.f32: ma trận float32 (n, dim) ghi nối tiếp, đọc qua np.memmap
+      - keys.bin: n digest 32 byte, dòng i ứng với vector i
+    """
+
+    def __init__(self, model_name: str, dimension: int, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        self.dimension = dimension
+        self.hits = 0
+        self.misses = 0
+
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.dir = Path(cache_dir) / f"{slug}_{dimension}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "vectors.f32"
+        self.keys_path = self.dir / "keys.bin"
+
+        self._rows = {}
+        self._vectors = None  # memmap các dòng [0, số dòng đã map), map lại khi cần dòng mới hơn
+        self._load()
+        logger.info(f"🗄️  Embedding cache: {len(self)} vectors ({self.dir})")
+
+    def _load(self):
+        keys = self.keys_path.read_bytes() if self.keys_path.exists() else b''
+        row_bytes = 4 * self.dimension
+        stored_rows = self.vectors_path.stat().st_size // row_bytes if self.vectors_path.exists() else 0
+
+        # Vectors được ghi trước keys → chỉ tin các dòng có đủ cả hai (an toàn khi bị ngắt giữa chừng)
+        n = min(len(keys) // KEY_SIZE, stored_rows)
+        self._rows = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(n)}
+        self._map(n)
+
+    def _map(self, n: int):
+        self._vectors = (
+            np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(n, self.dimension))
+            if n else None
+        )
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def key(self, text: str) -> bytes:
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(f"{self.model_name}\0{normalized}".encode("utf-8")).digest()
+
+    def lookup(self, texts: list) -> tuple:
+        """
+        Tra cache cho danh sách texts.
+        Trả về (embeddings, keys, missing) với embeddings (n, dim) đã điền các dòng hit,
+        missing = {key: [vị trí...]} cho các text chưa có trong cache.
+        """
+        embeddings = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        keys = [self.key(text) for text in texts]
+        missing = {}
+
+        hit_positions = []
+        hit_rows = []
+        for i, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                hit_positions.append(i)
+                hit_rows.append(row)
+
+        if hit_rows:
+            if self._vectors is None or max(hit_rows) >= len(self._vectors):
+                self._map(len(self._rows))  # Dòng được add sau lần map gần nhất
+            embeddings[hit_positions] = self._vectors[hit_rows]
+
+        self.hits += len(hit_rows)
+        self.misses += len(texts) - len(hit_rows)
+        return embeddings, keys, missing
+
+    def add(self, keys: list, vectors: np.ndarray):
+        """Ghi nối tiếp các vectors mới vào cache; file chỉ được map lại khi lookup trúng dòng mới"""
+        new = {}
+        for key, vector in zip(keys, vectors):
+            if key not in self._rows and key not in new:
+                new[key] = vector
+        if not new:
+            return
+
+        # Đóng memmap trước khi ghi thêm (Windows không cho mở rộng file đang được map)
+        self._vectors = None
+        n = len(self._rows)
+        # truncate bỏ phần ghi dở của lần chạy bị ngắt trước đó để vectors và keys luôn thẳng hàng
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(n * 4 * self.dimension)
+            f.write(np.asarray(list(new.values()), dtype=np.float32).tobytes())
+        with open(self.keys_path, 'ab') as f:
+            f.truncate(n * KEY_SIZE)
+            f.write(b''.join(new))
+
+        self._rows.update((key, n + i) for i, key in enumerate(new))
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self)
+        }
@@ -0,0 +1,33 @@
+from config import EMBEDDING_MODEL
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Instruction từng model đặt trước text khi encode. Model E5 được train với "query: " / "passage: ",
+# thiếu prefix (hoặc dùng lẫn) làm giảm rõ chất lượng retrieval.
+MODEL_REGISTRY = {
+    "intfloat/multilingual-e5-small": {"query_prefix": "query: ", "passage_prefix": "passage: "},
+    "intfloat/multilingual-e5-base": {"query_prefix": "query: ", "passage_prefix": "passage: "},
+    "intfloat/multilingual-e5-large": {"query_prefix": "query: ", "passage_prefix": "passage: "},
+    "intfloat/multilingual-e5-large-instruct": {
+        "query_prefix": "Instruct: Given a question, retrieve passages that answer the question\nQuery: ",
+        "passage_prefix": ""
+    },
+    "BAAI/bge-m3": {"query_prefix": "", "passage_prefix": ""},
+    "sentence-transformers/paraphrase-multilingual-mpnet-base-v2": {"query_prefix": "", "passage_prefix": ""},
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2": {"query_prefix": "", "passage_prefix": ""}
+}
+
+NO_PREFIX = {"query_prefix": "", "passage_prefix": ""}
+
+def model_spec(model_name: str = EMBEDDING_MODEL) -> dict:
+    """Prefix query / passage của model; model không có trong registry → không prefix"""
+    spec = MODEL_REGISTRY.get(model_name)
+    if spec is None:
+        logger.warning(f"⚠️ Model {model_name} không có trong MODEL_REGISTRY, encode không prefix")
+        return dict(NO_PREFIX)
+    return dict(spec)
+
+def index_signature(model_name: str = EMBEDDING_MODEL) -> dict:
+    """Model + prefix scheme ghi kèm index: query chỉ so sánh được với vectors encode cùng cách"""
+    return {"embedding_model": model_name, **model_spec(model_name)}
@@ -1,47 +1,244 @@
+import json
+from pathlib import Path
+import torch
 from sentence_transformers import SentenceTransformer
-from config import EMBEDDING_MODEL, EMBEDDING_DIMENSION
+from config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSION,
+    USE_EMBEDDING_CACHE,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_BACKEND,
+    EMBEDDING_THREADS,
+    EMBEDDING_ONNX_DIR,
+    ONNX_QUANTIZATION,
+    EMBEDDING_MIN_AGREEMENT
+)
+from embedding_cache import EmbeddingCache
+from embedding_models import model_spec
 import logging
 import numpy as np
 
 logger = logging.getLogger(__name__)
 
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+AGREEMENT_PATH = Path(EMBEDDING_CACHE_DIR) / "backend_agreement.json"
+# Câu mẫu để so backend nhanh với fp32 lúc load (benchmark_embedding.py so trên chunk thật)
+AGREEMENT_PROBES = [
+    "Vịnh Hạ Long là di sản thiên nhiên thế giới với hàng nghìn đảo đá vôi.",
+    "Giá vé tham quan Vịnh Hạ Long cho người lớn là bao nhiêu?",
+    "Phố cổ Hội An nổi tiếng với đèn lồng và những ngôi nhà cổ.",
+    "Mùa khô ở Phú Quốc kéo dài từ tháng 11 đến tháng 4 năm sau.",
+    "Đề án phát triển du lịch bền vững giai đoạn 2021-2030.",
+    "Sapa có ruộng bậc thang và đỉnh Fansipan cao 3.143 mét.",
+    "Bánh mì, phở và bún chả là những món ăn đường phố được yêu thích.",
+    "Hà Nội có Văn Miếu - Quốc Tử Giám, trường đại học đầu tiên của Việt Nam.",
+    "Cố đô Huế với hệ thống lăng tẩm của các vua triều Nguyễn.",
+    "Tổng lượng khách quốc tế đến Việt Nam năm 2019 đạt 18 triệu lượt.",
+    "Đà Lạt có khí hậu mát mẻ quanh năm, nhiều hoa và đồi thông.",
+    "Thủ tục xin visa điện tử cho khách nước ngoài vào Việt Nam."
+]
+
+def _onnx_model(file_name: str = None, threads: int = EMBEDDING_THREADS) -> SentenceTransformer:
+    """Model chạy trên ONNX Runtime (sentence-transformers>=3.2 + optimum[onnxruntime])"""
+    try:
+        import onnxruntime
+    except ImportError:
+        raise ImportError('EMBEDDING_BACKEND onnx cần: pip install "sentence-transformers>=3.2" "optimum[onnxruntime]"')
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if threads:
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = threads
+        model_kwargs["session_options"] = session_options
+    if file_name is None:
+        return SentenceTransformer(EMBEDDING_MODEL, backend="onnx", model_kwargs=model_kwargs)
+
+    model_kwargs["file_name"] = file_name
+    return SentenceTransformer(EMBEDDING_ONNX_DIR, backend="onnx", model_kwargs=model_kwargs)
+
+def _local_first(**kwargs) -> SentenceTransformer:
+    """Model từ cache HuggingFace trên máy (không hỏi Hub mỗi lần khởi động), chưa có thì tải về"""
+    try:
+        return SentenceTransformer(EMBEDDING_MODEL, local_files_only=True, **kwargs)
+    except (OSError, ValueError):
+        logger.info("   Chưa có model trong cache, tải từ HuggingFace Hub...")
+        return SentenceTransformer(EMBEDDING_MODEL, **kwargs)
+
+def load_model(backend: str = EMBEDDING_BACKEND, threads: int = EMBEDDING_THREADS) -> SentenceTransformer:
+    """
+    Load model embedding theo backend:
+      - torch: PyTorch fp32 (mặc định)
+      - torch_int8: PyTorch, quantize động int8 các lớp Linear (CPU)
+      - onnx: ONNX Runtime, fp32
+      - onnx_int8: ONNX Runtime, quantize động int8 theo ONNX_QUANTIZATION (export một lần vào EMBEDDING_ONNX_DIR)
+    threads > 0: số thread intra-op của torch / onnxruntime
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"EMBEDDING_BACKEND không hợp lệ: {backend} (chọn: {', '.join(BACKENDS)})")
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    if backend == "torch":
+        return _local_first()
+    if backend == "torch_int8":
+        model = _local_first(device="cpu")
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        return _onnx_model(threads=threads)
+
+    file_name = f"onnx/model_qint8_{ONNX_QUANTIZATION}.onnx"
+    if not (Path(EMBEDDING_ONNX_DIR) / file_name).exists():
+        logger.info(f"   Export + quantize ONNX ({ONNX_QUANTIZATION}) → {EMBEDDING_ONNX_DIR}")
+        model = _onnx_model(threads=threads)
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        model.save(EMBEDDING_ONNX_DIR)
+        export_dynamic_quantized_onnx_model(model, ONNX_QUANTIZATION, EMBEDDING_ONNX_DIR)
+    return _onnx_model(file_name, threads)
+
+def _agreement_key(backend: str) -> str:
+    return f"{EMBEDDING_MODEL}@{backend}" + (f"/{ONNX_QUANTIZATION}" if backend == "onnx_int8" else "")
+
+def check_agreement(model: SentenceTransformer, backend: str) -> tuple:
+    """
+    So backend nhanh với fp32 trên AGREEMENT_PROBES (kết quả lưu ở AGREEMENT_PATH, chỉ đo một lần).
+    Cosine trung bình < EMBEDDING_MIN_AGREEMENT → cảnh báo và dùng lại torch fp32.
+    Trả về (model, backend) thực sự dùng
+    """
+    if backend == "torch":
+        return model, backend
+
+    key = _agreement_key(backend)
+    try:
+        verdicts = json.loads(AGREEMENT_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        verdicts = {}
+
+    reference = None
+    if key not in verdicts:
+        logger.info(f"   So {backend} với fp32 trên {len(AGREEMENT_PROBES)} câu mẫu...")
+        reference = _local_first()
+        encode = lambda m: m.encode(AGREEMENT_PROBES, convert_to_numpy=True, normalize_embeddings=True,
+                                    show_progress_bar=False)
+        verdicts[key] = float(np.einsum('ij,ij->i', encode(model), encode(reference)).mean())
+        try:
+            AGREEMENT_PATH.parent.mkdir(parents=True, exist_ok=True)
+            AGREEMENT_PATH.write_text(json.dumps(verdicts, indent=2), encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"⚠️ Không lưu được kết quả so backend: {str(e)}")
+
+    cosine = verdicts[key]
+    if cosine >= EMBEDDING_MIN_AGREEMENT:
+        logger.info(f"   Khớp fp32: cosine {cosine:.4f} ≥ {EMBEDDING_MIN_AGREEMENT}")
+        return model, backend
+
+    logger.warning(f"⚠️ Backend {backend} lệch fp32 (cosine {cosine:.4f} < {EMBEDDING_MIN_AGREEMENT}) → dùng torch fp32")
+    return reference if reference is not None else _local_first(), "torch"
+
+def model_id(backend: str = EMBEDDING_BACKEND) -> str:
+    """Định danh model cho embedding cache: vectors của backend khác fp32 không dùng chung cache"""
+    return EMBEDDING_MODEL if backend == "torch" else f"{EMBEDDING_MODEL}@{backend}"
+
 class EmbeddingService:
-    def __init__(self):
+    def __init__(self, use_cache: bool = USE_EMBEDDING_CACHE, backend: str = EMBEDDING_BACKEND):
         logger.info("🧠 KHỞI TẠO EMBEDDING SERVICE")
         logger.info(f"   Model: {EMBEDDING_MODEL}")
-        
+        logger.info(f"   Backend: {backend}" + (f", {EMBEDDING_THREADS} threads" if EMBEDDING_THREADS else ""))
+
         try:
-            self.model = SentenceTransformer(EMBEDDING_MODEL)
+            self.model, backend = check_agreement(load_model(backend), backend)
             logger.info(f"   Dimension: {EMBEDDING_DIMENSION}")
             logger.info("✅ Load model thành công\n")
         except Exception as e:
             logger.error(f"❌ Lỗi load model: {str(e)}")
             raise
-    
-    def embed_documents(self, texts: list) -> np.ndarray:
-        """Embedding batch documents"""
-        logger.info(f"📊 Embedding {len(texts)} chunks...")
-        
+
+        spec = model_spec(EMBEDDING_MODEL)
+        self.query_prefix = spec["query_prefix"]
+        self.passage_prefix = spec["passage_prefix"]
+        logger.info(f"   Prefix: query={self.query_prefix!r}, passage={self.passage_prefix!r}")
+
+        self.backend = backend
+        self.use_cache = use_cache
+        self._cache = None
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension() or EMBEDDING_DIMENSION
+
+    @property
+    def cache(self):
+        """Embedding cache trên đĩa, chỉ mở khi embed documents lần đầu"""
+        if self.use_cache and self._cache is None:
+            self._cache = EmbeddingCache(model_id(self.backend), self.dimension)
+        return self._cache
+
+    def _encode(self, texts: list, show_progress: bool = True, batch_size: int = 32) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=batch_size,
+            show_progress_bar=show_progress,
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        )
+
+    def encode_passages(self, texts: list, verbose: bool = True) -> np.ndarray:
+        """
+        Embedding batch passages (chunk / câu) với passage prefix của model;
+        text đã có trong cache không đi qua model (key cache gồm cả prefix)
+        verbose=False: không log / progress bar (pipeline gọi cho từng batch nhỏ)
+        """
+        log = logger.info if verbose else logger.debug
+        log(f"📊 Embedding {len(texts)} chunks...")
+
         try:
-            embeddings = self.model.encode(
-                texts,
-                batch_size=32,
-                show_progress_bar=True,
-                convert_to_numpy=True,
-                normalize_embeddings=True
-            )
-            logger.info(f"✅ Embedding thành công: shape {embeddings.shape}\n")
+            texts = [self.passage_prefix + text for text in texts]
+            cache = self.cache
+            if cache is None:
+                embeddings = self._encode(texts, verbose)
+            else:
+                embeddings, _, missing = cache.lookup(texts)
+                hits = len(texts) - sum(len(positions) for positions in missing.values())
+                log(f"   Cache hit: {hits}/{len(texts)}, cần encode: {len(missing)}")
+
+                if missing:
+                    # Mỗi text trùng nhau chỉ encode một lần
+                    miss_keys = list(missing)
+                    encoded = self._encode([texts[missing[key][0]] for key in miss_keys], verbose)
+                    for key, vector in zip(miss_keys, encoded):
+                        embeddings[missing[key]] = vector
+                    cache.add(miss_keys, encoded)
+
+            log(f"✅ Embedding thành công: shape {embeddings.shape}\n")
             return embeddings
-        
+
         except Exception as e:
             logger.error(f"❌ Lỗi embedding: {str(e)}")
             raise
-    
-    def embed_query(self, query: str) -> np.ndarray:
-        """Embedding một query"""
+
+    def encode_queries(self, queries: list) -> np.ndarray:
+        """Embedding nhiều query (query prefix của model) trong một lần gọi model → (n_queries, dim)"""
+        if not queries:
+            return np.empty((0, self.dimension), dtype=np.float32)
         try:
-            embedding = self.model.encode(query, convert_to_numpy=True,normalize_embeddings=True)
-            return embedding
+            return self._encode([self.query_prefix + query for query in queries], show_progress=False, batch_size=64)
         except Exception as e:
             logger.error(f"❌ Lỗi embedding query: {str(e)}")
             raise
+
+    def cache_stats(self) -> dict:
+        """Thống kê hit/miss của embedding cache (None nếu cache tắt hoặc chưa dùng)"""
+        return self._cache.stats() if self._cache is not None else None
+
+    def embed_documents(self, texts: list, verbose: bool = True) -> np.ndarray:
+        """Tương thích ngược: như encode_passages"""
+        return self.encode_passages(texts, verbose)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embedding một query → (dim,)"""
+        return self.encode_queries([query])[0]
+
+    def embed_queries(self, queries: list) -> np.ndarray:
+        """Tương thích ngược: như encode_queries"""
+        return self.encode_queries(queries)
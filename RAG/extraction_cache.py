@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from config import PDF_EXTRACT_CACHE_DIR
+import logging
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+
+class ExtractionCache:
+    """
+    Cache text trích xuất của từng file PDF trên đĩa: mỗi file một JSON
+    (total_pages, [(số trang, text)], số trang lỗi) gắn với size + mtime của file lúc trích xuất.
+    File có size + mtime không đổi không cần parse lại; file được ghi ngay khi trích xuất xong
+    nên train bị ngắt giữa chừng chạy lại sẽ tiếp tục từ file còn dở.
+    """
+
+    def __init__(self, cache_dir: str = PDF_EXTRACT_CACHE_DIR):
+        self.dir = Path(cache_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def signature(pdf_path: str) -> tuple:
+        """(size, mtime_ns) của file, lấy trước khi trích xuất"""
+        stat = os.stat(pdf_path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def _path(self, pdf_path: str) -> Path:
+        digest = hashlib.sha1(os.path.abspath(pdf_path).encode("utf-8")).hexdigest()
+        return self.dir / f"{digest}.json"
+
+    def get(self, pdf_path: str, signature: tuple):
+        """(total_pages, pages, page_errors) nếu cache khớp signature, ngược lại None"""
+        try:
+            with open(self._path(pdf_path), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is None or entry.get("version") != CACHE_VERSION or tuple(entry["signature"]) != tuple(signature):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["total_pages"], [tuple(page) for page in entry["pages"]], entry["page_errors"]
+
+    def put(self, pdf_path: str, signature: tuple, total_pages: int, pages: list, page_errors: int):
+        """Ghi file tạm rồi thay thế (không để lại cache ghi dở)"""
+        path = self._path(pdf_path)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": CACHE_VERSION,
+                "path": os.path.abspath(pdf_path),
+                "signature": list(signature),
+                "total_pages": total_pages,
+                "pages": pages,
+                "page_errors": page_errors
+            }, f, ensure_ascii=False)
+        os.replace(tmp, path)
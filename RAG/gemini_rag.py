@@ -1,16 +1,79 @@
+import asyncio
 import re
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
+from answer_cache import AnswerCache
+from query_batcher import QueryBatcher
+from context_builder import build_context
+from metrics import QueryMetrics, QueryTrace
 from config import (
     GEMINI_API_KEY,
     GEMINI_MODEL,
     GEMINI_TEMPERATURE,
     GEMINI_MAX_TOKENS,
+    GEMINI_BATCH_CONCURRENCY,
+    USE_ANSWER_CACHE,
+    METRICS_PATH,
+    SEARCH_MODE,
+    USE_RERANKER,
+    RERANK_CANDIDATES,
+    USE_QUERY_BATCHING,
     TOP_K
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
+CITATION_PATTERN = re.compile(r'\s*\([^)]*-\s*Trang\s*\d+\)')
+EXTRA_SPACES_PATTERN = re.compile(r'  +')
+
+# Ngoặc mở chưa đóng dài hơn mức này chắc chắn không phải trích dẫn → không giữ lại nữa
+MAX_PENDING_CITATION = 300
+
+class CitationStreamFilter:
+    """
+    Phiên bản incremental của _clean_answer cho câu trả lời stream.
+    Giữ lại phần đuôi có thể là đầu của một trích dẫn "(file - Trang X)" (từ dấu "(" chưa đóng,
+    kể cả khoảng trắng đứng trước) và khoảng trắng cuối; phần còn lại được làm sạch và trả về ngay.
+    Nối mọi phần trả về của feed() + flush() cho đúng kết quả của _clean_answer trên toàn bộ text.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._started = False  # Đã trả về ký tự nào chưa (để bỏ khoảng trắng đầu câu trả lời)
+
+    def feed(self, text: str) -> str:
+        self._buffer = CITATION_PATTERN.sub('', self._buffer + text)
+
+        # Trích dẫn chỉ có thể bắt đầu từ dấu "(" đầu tiên sau dấu ")" cuối cùng
+        hold = len(self._buffer)
+        open_at = self._buffer.find('(', self._buffer.rfind(')') + 1)
+        if open_at != -1 and len(self._buffer) - open_at <= MAX_PENDING_CITATION:
+            hold = open_at
+        while hold and self._buffer[hold - 1].isspace():
+            hold -= 1
+
+        ready, self._buffer = self._buffer[:hold], self._buffer[hold:]
+        return self._emit(ready)
+
+    def flush(self) -> str:
+        ready, self._buffer = self._buffer, ""
+        return self._emit(ready).rstrip()
+
+    def _emit(self, text: str) -> str:
+        text = EXTRA_SPACES_PATTERN.sub(' ', text)
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+def _chunk_text(chunk) -> str:
+    """Text của một chunk stream; chunk không có text (vd. chỉ có finish_reason) → chuỗi rỗng"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
 class GeminiRAG:
     def __init__(self, vector_store, embedding_service):
         logger.info("🚀 KHỞI TẠO GEMINI RAG")
@@ -23,20 +86,20 @@ class GeminiRAG:
         self.model = genai.GenerativeModel(GEMINI_MODEL)
         self.vector_store = vector_store
         self.embedding_service = embedding_service
+        self.answer_cache = AnswerCache() if USE_ANSWER_CACHE else None
+        self.reranker = None
+        if USE_RERANKER:
+            from reranker import Reranker  # Chỉ import cross-encoder khi bật rerank
+            self.reranker = Reranker()
+        self.metrics = QueryMetrics()
+        # Query của các request đồng thời được encode chung batch; query_batch đã tự gom nên gọi thẳng service
+        self.query_encoder = QueryBatcher(embedding_service, self.metrics) if USE_QUERY_BATCHING else embedding_service
         
         logger.info("✅ Khởi tạo thành công\n")
     
     def _build_context(self, retrieved_docs: list) -> str:
-        """Xây dựng context từ retrieved documents"""
-        context = "=== THÔNG TIN TỪ TÀI LIỆU ===\n\n"
-        
-        for i, doc in enumerate(retrieved_docs, 1):
-            context += f"[{i}] ({doc['metadata']['source']} - Trang {doc['metadata']['page']})\n"
-            context += f"Độ tương tự: {doc['similarity']}\n"
-            # include full content so model can see all relevant text
-            context += f"Nội dung: {doc['content']}\n\n"
-        
-        return context
+        """Xây dựng context từ retrieved documents (gộp chunk trùng trang, giới hạn CONTEXT_TOKEN_BUDGET)"""
+        return build_context(retrieved_docs)
     
     def _build_prompt(self, context: str, query: str) -> str:
         """Xây dựng prompt cho Gemini"""
@@ -55,75 +118,397 @@ YÊU CẦU:
 """
         return prompt
     
-    def query(self, question: str) -> dict:
+    def _clean_answer(self, answer: str) -> str:
+        """Loại bỏ thông tin trích dẫn dạng (file.pdf - Trang X) trong câu trả lời"""
+        # Loại bỏ (file - Trang X) hoặc (file.pdf - Trang X)
+        answer = CITATION_PATTERN.sub('', answer)
+        return EXTRA_SPACES_PATTERN.sub(' ', answer).strip()  # Chuẩn hóa khoảng trắng thừa
+    
+    def _generation_config(self):
+        return genai.types.GenerationConfig(
+            temperature=GEMINI_TEMPERATURE,
+            max_output_tokens=GEMINI_MAX_TOKENS
+        )
+    
+    def _no_results(self, question: str) -> dict:
+        logger.warning("⚠️ Không tìm thấy tài liệu phù hợp!")
+        return {
+            "status": "no_results",
+            "question": question,
+            "answer": "Xin lỗi, tôi không tìm thấy thông tin phù hợp với câu hỏi của bạn.",
+            "retrieved_docs": []
+        }
+    
+    def _error(self, question: str, error: Exception) -> dict:
+        logger.error(f"❌ Lỗi trong Q&A chain: {str(error)}")
+        return {
+            "status": "error",
+            "question": question,
+            "error": str(error)
+        }
+    
+    def _success(self, question: str, raw_answer: str, retrieved_docs: list) -> dict:
+        return self._answer(question, self._clean_answer(raw_answer), retrieved_docs)
+
+    def _answer(self, question: str, answer: str, retrieved_docs: list) -> dict:
+        logger.info("✅ Sinh câu trả lời thành công\n")
+        return {
+            "status": "success",
+            "question": question,
+            "answer": answer,
+            "retrieved_docs": retrieved_docs,
+            "num_results": len(retrieved_docs)
+        }
+    
+    def _prepare_prompt(self, question: str, retrieved_docs: list, trace: QueryTrace) -> str:
+        with trace.span("context"):
+            # 3. Xây dựng context
+            context = self._build_context(retrieved_docs)
+            
+            # 4. Xây dựng prompt
+            prompt = self._build_prompt(context, question)
+        trace.prompt_chars = len(prompt)
+        logger.info(f"📝 Prompt length: {len(prompt)} chars")
+        return prompt
+    
+    def _retrieve(self, question: str, vector_store, trace: QueryTrace, search_filter=None) -> tuple:
         """
-        Full Q&A RAG chain
+        Tra answer cache (exact → semantic), miss thì embedding query + semantic search.
+        vector_store: store của query (lấy một lần lúc bắt đầu, không đổi nếu index được swap giữa chừng)
+        search_filter: SearchFilter giới hạn tài liệu / trang (không dùng answer cache)
+        Trả về (cached, query_embedding, retrieved_docs), cached = kết quả đã cache hoặc None
         """
-        logger.info("\n" + "="*60)
-        logger.info("❓ CÂU HỎI: " + question)
-        logger.info("="*60)
+        index_version = vector_store.version
+        cache = self.answer_cache if not search_filter else None
+        if cache is not None:
+            with trace.span("cache"):
+                cached = cache.get(question, index_version)
+            if cached is not None:
+                logger.info("♻️  Exact cache hit")
+                return self._cached(question, cached, "exact"), None, []
         
-        try:
-            # 1. Embedding query
-            logger.info("🔍 Embedding query...")
-            query_embedding = self.embedding_service.embed_query(question)
-            
-            # 2. Semantic search
-            logger.info(f"🔎 Semantic search (Top-{TOP_K})...")
-            retrieved_docs = self.vector_store.search(query_embedding)
-            
-            if not retrieved_docs:
-                logger.warning("⚠️ Không tìm thấy tài liệu phù hợp!")
-                return {
-                    "status": "no_results",
-                    "question": question,
-                    "answer": "Xin lỗi, tôi không tìm thấy thông tin phù hợp với câu hỏi của bạn.",
-                    "retrieved_docs": []
-                }
-            
+        # 1. Embedding query
+        logger.info("🔍 Embedding query...")
+        with trace.span("embed"):
+            query_embedding = self.query_encoder.encode_queries([question])[0]
+        
+        if cache is not None:
+            with trace.span("cache"):
+                cached = cache.get_similar(question, query_embedding, index_version)
+            if cached is not None:
+                return self._cached(question, cached, "semantic"), query_embedding, []
+        
+        # 2. Semantic search (hybrid: + BM25, gộp bằng RRF)
+        k = self._search_k()
+        logger.info(f"🔎 Search {SEARCH_MODE} (Top-{k})" + (f", {search_filter}" if search_filter else "") + "...")
+        with trace.span("search"):
+            if SEARCH_MODE == "hybrid":
+                retrieved_docs = vector_store.search_hybrid(question, query_embedding, k, search_filter)
+            else:
+                retrieved_docs = vector_store.search(query_embedding, k, search_filter)
+        
+        # 2b. Rerank ứng viên bằng cross-encoder, giữ RERANK_TOP_K chunk tốt nhất
+        if self.reranker is not None and retrieved_docs:
+            with trace.span("rerank"):
+                retrieved_docs = self.reranker.rerank(question, retrieved_docs)
+        trace.num_docs = len(retrieved_docs)
+        
+        if retrieved_docs:
             logger.info(f"✅ Tìm thấy {len(retrieved_docs)} documents:")
             for doc in retrieved_docs:
                 logger.info(f"   - {doc['metadata']['source']} (Trang {doc['metadata']['page']}) - Sim: {doc['similarity']}")
-            
-            # 3. Xây dựng context
-            context = self._build_context(retrieved_docs)
-            
-            # 4. Xây dựng prompt
-            prompt = self._build_prompt(context, question)
-            logger.info(f"📝 Prompt length: {len(prompt)} chars")
+        return None, query_embedding, retrieved_docs
+    
+    def _search_k(self) -> int:
+        """Số kết quả lấy từ vector store: rộng hơn khi có rerank phía sau"""
+        return RERANK_CANDIDATES if self.reranker is not None else TOP_K
+    
+    def _cached(self, question: str, result: dict, tier: str) -> dict:
+        return {**result, "question": question, "cache": tier}
+    
+    def _remember(self, question: str, query_embedding, result: dict, index_version, search_filter=None) -> dict:
+        """Lưu câu trả lời thành công vào answer cache (lỗi / không tìm thấy / có filter thì không cache)"""
+        if self.answer_cache is not None and result["status"] == "success" and not search_filter:
+            self.answer_cache.put(question, query_embedding, result, index_version)
+        return result
+    
+    def cache_stats(self) -> dict:
+        return self.answer_cache.stats() if self.answer_cache is not None else {}
+    
+    def rerank_stats(self) -> dict:
+        return self.reranker.stats() if self.reranker is not None else {}
+    
+    def swap_vector_store(self, vector_store):
+        """Thay index đang dùng (IndexWatcher): query mới dùng store mới, query đang chạy giữ store cũ"""
+        self.vector_store = vector_store
+    
+    def batching_stats(self) -> dict:
+        return self.query_encoder.stats() if USE_QUERY_BATCHING else {}
+    
+    def _finish(self, trace: QueryTrace, result: dict) -> dict:
+        """Gắn timings / prompt size / số docs vào result và cộng vào histogram"""
+        result["metrics"] = trace.finish()
+        self.metrics.observe(result["metrics"], result["status"])
+        logger.info(f"⏱️  {result['metrics']['timings_ms']}")
+        return result
+    
+    def dump_metrics(self, path: str = METRICS_PATH):
+        """Log p50/p95/p99 từng stage và ghi file text Prometheus"""
+        for stage, stats in self.metrics.summary().items():
+            logger.info(
+                f"   {stage:<12} n={stats['count']:<6} p50={stats['p50_ms']:.1f}ms "
+                f"p95={stats['p95_ms']:.1f}ms p99={stats['p99_ms']:.1f}ms"
+            )
+        self.metrics.write_prometheus(path)
+        logger.info(f"📈 Metrics: {path}")
+    
+    def _generate_answer(self, question: str, retrieved_docs: list, trace: QueryTrace) -> dict:
+        """Xây dựng context + prompt từ retrieved docs và gọi Gemini"""
+        if not retrieved_docs:
+            return self._no_results(question)
+        
+        try:
+            prompt = self._prepare_prompt(question, retrieved_docs, trace)
             
             # 5. Gọi Gemini
             logger.info("🤖 Gọi Gemini để sinh câu trả lời...")
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=GEMINI_TEMPERATURE,
-                    max_output_tokens=GEMINI_MAX_TOKENS
+            with trace.span("llm"):
+                response = self.model.generate_content(
+                    prompt,
+                    generation_config=self._generation_config()
+                )
+                raw_answer = response.text
+            with trace.span("postprocess"):
+                return self._success(question, raw_answer, retrieved_docs)
+        
+        except Exception as e:
+            return self._error(question, e)
+    
+    def query(self, question: str, search_filter=None) -> dict:
+        """
+        Full Q&A RAG chain
+        search_filter: SearchFilter chỉ trả lời từ các tài liệu / trang được chọn
+        """
+        logger.info("\n" + "="*60)
+        logger.info("❓ CÂU HỎI: " + question)
+        logger.info("="*60)
+        
+        trace = QueryTrace()
+        vector_store = self.vector_store  # Snapshot: index có thể được hot-swap trong lúc query chạy
+        index_version = vector_store.version
+        try:
+            cached, query_embedding, retrieved_docs = self._retrieve(question, vector_store, trace, search_filter)
+        except Exception as e:
+            return self._finish(trace, self._error(question, e))
+        if cached is not None:
+            return self._finish(trace, cached)
+        
+        result = self._generate_answer(question, retrieved_docs, trace)
+        return self._finish(trace, self._remember(question, query_embedding, result, index_version, search_filter))
+    
+    async def aquery(self, question: str, executor=None, search_filter=None) -> dict:
+        """
+        Phiên bản async của query cho server: embedding + search (CPU) chạy trên
+        executor, Gemini được await qua generate_content_async nên event loop không bị chặn.
+        """
+        loop = asyncio.get_running_loop()
+        
+        trace = QueryTrace()
+        vector_store = self.vector_store
+        index_version = vector_store.version
+        try:
+            cached, query_embedding, retrieved_docs = await loop.run_in_executor(
+                executor, self._retrieve, question, vector_store, trace, search_filter
+            )
+        except Exception as e:
+            return self._finish(trace, self._error(question, e))
+        if cached is not None:
+            return self._finish(trace, cached)
+        
+        if not retrieved_docs:
+            return self._finish(trace, self._no_results(question))
+        
+        try:
+            prompt = self._prepare_prompt(question, retrieved_docs, trace)
+            with trace.span("llm"):
+                response = await self.model.generate_content_async(
+                    prompt,
+                    generation_config=self._generation_config()
                 )
+                raw_answer = response.text
+            with trace.span("postprocess"):
+                result = self._success(question, raw_answer, retrieved_docs)
+            return self._finish(trace, self._remember(question, query_embedding, result, index_version, search_filter))
+
+        except Exception as e:
+            return self._finish(trace, self._error(question, e))
+
+    def query_stream(self, question: str, search_filter=None):
+        """
+        Phiên bản stream của query: yield {"event": "token", "text": ...} ngay khi Gemini
+        trả về từng đoạn (đã lọc trích dẫn), cuối cùng yield {"event": "done", **result}
+        với result cùng dạng kết quả của query.
+        """
+        logger.info("\n" + "="*60)
+        logger.info("❓ CÂU HỎI: " + question)
+        logger.info("="*60)
+
+        trace = QueryTrace()
+        vector_store = self.vector_store
+        index_version = vector_store.version
+        try:
+            cached, query_embedding, retrieved_docs = self._retrieve(question, vector_store, trace, search_filter)
+        except Exception as e:
+            yield {"event": "done", **self._finish(trace, self._error(question, e))}
+            return
+
+        if cached is not None:
+            yield {"event": "token", "text": cached["answer"]}
+            yield {"event": "done", **self._finish(trace, cached)}
+            return
+
+        if not retrieved_docs:
+            result = self._no_results(question)
+            yield {"event": "token", "text": result["answer"]}
+            yield {"event": "done", **self._finish(trace, result)}
+            return
+
+        try:
+            prompt = self._prepare_prompt(question, retrieved_docs, trace)
+            logger.info("🤖 Gọi Gemini (stream)...")
+            stream_filter = CitationStreamFilter()
+            parts = []
+            # llm: từ lúc gọi tới chunk cuối (gồm cả thời gian client đọc stream)
+            with trace.span("llm"):
+                response = self.model.generate_content(
+                    prompt,
+                    generation_config=self._generation_config(),
+                    stream=True
+                )
+                for chunk in response:
+                    text = stream_filter.feed(_chunk_text(chunk))
+                    if text:
+                        trace.mark("first_token")
+                        parts.append(text)
+                        yield {"event": "token", "text": text}
+            text = stream_filter.flush()
+            if text:
+                parts.append(text)
+                yield {"event": "token", "text": text}
+
+            result = self._answer(question, "".join(parts), retrieved_docs)
+            result = self._remember(question, query_embedding, result, index_version, search_filter)
+            yield {"event": "done", **self._finish(trace, result)}
+
+        except Exception as e:
+            yield {"event": "done", **self._finish(trace, self._error(question, e))}
+
+    async def aquery_stream(self, question: str, executor=None, search_filter=None):
+        """Phiên bản async của query_stream cho server (cùng dạng event)"""
+        loop = asyncio.get_running_loop()
+
+        trace = QueryTrace()
+        vector_store = self.vector_store
+        index_version = vector_store.version
+        try:
+            cached, query_embedding, retrieved_docs = await loop.run_in_executor(
+                executor, self._retrieve, question, vector_store, trace, search_filter
             )
-            
-            answer = response.text
-            # Loại bỏ thông tin trích dẫn dạng (file.pdf - Trang X) trong câu trả lời
-            # Loại bỏ (file - Trang X) hoặc (file.pdf - Trang X)
-            answer = re.sub(r'\s*\([^)]*-\s*Trang\s*\d+\)', '', answer)
-            answer = re.sub(r'  +', ' ', answer).strip()  # Chuẩn hóa khoảng trắng thừa
-            logger.info("✅ Sinh câu trả lời thành công\n")
-            
-            return {
-                "status": "success",
-                "question": question,
-                "answer": answer,
-                "retrieved_docs": retrieved_docs,
-                "num_results": len(retrieved_docs)
-            }
+        except Exception as e:
+            yield {"event": "done", **self._finish(trace, self._error(question, e))}
+            return
+
+        if cached is not None:
+            yield {"event": "token", "text": cached["answer"]}
+            yield {"event": "done", **self._finish(trace, cached)}
+            return
+
+        if not retrieved_docs:
+            result = self._no_results(question)
+            yield {"event": "token", "text": result["answer"]}
+            yield {"event": "done", **self._finish(trace, result)}
+            return
+
+        try:
+            prompt = self._prepare_prompt(question, retrieved_docs, trace)
+            stream_filter = CitationStreamFilter()
+            parts = []
+            # llm: từ lúc gọi tới chunk cuối (gồm cả thời gian client đọc stream)
+            with trace.span("llm"):
+                response = await self.model.generate_content_async(
+                    prompt,
+                    generation_config=self._generation_config(),
+                    stream=True
+                )
+                async for chunk in response:
+                    text = stream_filter.feed(_chunk_text(chunk))
+                    if text:
+                        trace.mark("first_token")
+                        parts.append(text)
+                        yield {"event": "token", "text": text}
+            text = stream_filter.flush()
+            if text:
+                parts.append(text)
+                yield {"event": "token", "text": text}
+
+            result = self._answer(question, "".join(parts), retrieved_docs)
+            result = self._remember(question, query_embedding, result, index_version, search_filter)
+            yield {"event": "done", **self._finish(trace, result)}
+
+        except Exception as e:
+            yield {"event": "done", **self._finish(trace, self._error(question, e))}
+
+    def query_batch(self, questions: list, generate: bool = True, search_filter=None) -> list:
+        """
+        Q&A cho nhiều câu hỏi: embed tất cả trong một lần gọi model, search một lần
+        trên cả ma trận query, sau đó gọi Gemini song song (GEMINI_BATCH_CONCURRENCY).
+        generate=False: chỉ trả về kết quả retrieval (dùng cho đánh giá offline).
+        search_filter: SearchFilter áp dụng cho mọi câu hỏi
+        """
+        logger.info(f"📦 BATCH Q&A: {len(questions)} câu hỏi")
+        
+        if not questions:
+            return []
         
+        batch_trace = QueryTrace()
+        vector_store = self.vector_store
+        try:
+            with batch_trace.span("embed"):
+                query_embeddings = self.embedding_service.encode_queries(questions)
+            with batch_trace.span("search"):
+                k = self._search_k()
+                if SEARCH_MODE == "hybrid":
+                    batch_docs = vector_store.search_hybrid_batch(questions, query_embeddings, k, search_filter)
+                else:
+                    batch_docs = vector_store.search_batch(query_embeddings, k, search_filter)
+            if self.reranker is not None:
+                with batch_trace.span("rerank"):
+                    batch_docs = self.reranker.rerank_batch(questions, batch_docs)
         except Exception as e:
-            logger.error(f"❌ Lỗi trong Q&A chain: {str(e)}")
-            return {
-                "status": "error",
-                "question": question,
-                "error": str(e)
-            }
+            logger.error(f"❌ Lỗi trong batch Q&A: {str(e)}")
+            return [
+                self._finish(batch_trace.fork(), {"status": "error", "question": question, "error": str(e)})
+                for question in questions
+            ]
+        
+        traces = [batch_trace.fork() for _ in questions]
+        for trace, retrieved_docs in zip(traces, batch_docs):
+            trace.num_docs = len(retrieved_docs)
+        
+        if not generate:
+            return [
+                self._finish(trace, {
+                    "status": "success" if retrieved_docs else "no_results",
+                    "question": question,
+                    "retrieved_docs": retrieved_docs,
+                    "num_results": len(retrieved_docs)
+                })
+                for question, retrieved_docs, trace in zip(questions, batch_docs, traces)
+            ]
+        
+        with ThreadPoolExecutor(max_workers=GEMINI_BATCH_CONCURRENCY) as executor:
+            results = list(executor.map(self._generate_answer, questions, batch_docs, traces))
+        return [self._finish(trace, result) for trace, result in zip(traces, results)]
     
     def interactive_chat(self):
         """Interactive chatbot mode"""
@@ -143,14 +528,24 @@ YÊU CẦU:
                 if not question:
                     continue
                 
-                result = self.query(question)
-                
                 print("\n" + "="*60)
                 print("🤖 Chatbot:")
                 print("="*60)
-                print(result["answer"])
+
+                # In từng đoạn ngay khi Gemini trả về
+                result = {}
+                for event in self.query_stream(question):
+                    if event["event"] == "token":
+                        print(event["text"], end="", flush=True)
+                    else:
+                        result = event
+                print()
+                if result.get("status") == "error":
+                    print(f"❌ Lỗi: {result['error']}")
                 print("\n" + "-"*60)
                 print(f"📊 Số tài liệu tìm được: {result.get('num_results', 0)}")
+                if result.get("cache"):
+                    print(f"♻️  Câu trả lời từ cache ({result['cache']})")
                 
                 if result.get("retrieved_docs"):
                     print("\n📚 Nguồn tham khảo:")
@@ -0,0 +1,292 @@
+import math
+import time
+import faiss
+import numpy as np
+from config import (
+    IVF_NLIST,
+    PQ_M,
+    PQ_NBITS,
+    HNSW_M,
+    HNSW_EF_CONSTRUCTION,
+    INDEX_TRAIN_SAMPLE,
+    FAISS_NPROBE,
+    HNSW_EF_SEARCH
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ["flat", "ivf_flat", "ivf_pq", "hnsw", "opq_ivf_pq", "sq8", "sq_fp16"]
+# Index lưu vector dạng nén (mất thông tin): kết quả được re-score chính xác từ file float32 (EXACT_RESCORE)
+COMPRESSED_TYPES = ("ivf_pq", "opq_ivf_pq", "sq8", "sq_fp16")
+
+# Số điểm train tối thiểu cho mỗi centroid (khuyến nghị của FAISS)
+MIN_POINTS_PER_CENTROID = 39
+# Giới hạn efSearch khi search có lọc (HNSW) để query lọc rất hẹp không duyệt cả đồ thị
+MAX_FILTERED_EF_SEARCH = 1024
+
+def _auto_nlist(n: int) -> int:
+    nlist = IVF_NLIST or int(4 * math.sqrt(n))
+    return max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+
+def _auto_pq_nbits(n: int) -> int:
+    """Giảm số bits PQ khi không đủ dữ liệu train 2^nbits centroid"""
+    nbits = PQ_NBITS
+    while nbits > 4 and n < MIN_POINTS_PER_CENTROID * (1 << nbits):
+        nbits -= 1
+    return nbits
+
+def factory_string(index_type: str, dimension: int, n: int) -> str:
+    """Chuỗi faiss.index_factory tương ứng với index_type cho n vectors"""
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_M},Flat"
+    if index_type == "sq8":
+        return "SQ8"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+
+    nlist = _auto_nlist(n)
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+
+    if dimension % PQ_M:
+        raise ValueError(f"PQ_M={PQ_M} không chia hết dimension {dimension}")
+    nbits = _auto_pq_nbits(n)
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{PQ_M}x{nbits}"
+    if index_type == "opq_ivf_pq":
+        return f"OPQ{PQ_M},IVF{nlist},PQ{PQ_M}x{nbits}"
+
+    raise ValueError(f"Index type không hỗ trợ: {index_type} (chọn một trong {INDEX_TYPES})")
+
+def new_index(index_type: str, dimension: int, n: int):
+    """Index rỗng (inner product) theo index_type, kích thước IVF/PQ tính theo n vectors"""
+    spec = factory_string(index_type, dimension, n)
+    logger.info(f"   Index type: {index_type} ({spec})")
+
+    index = faiss.index_factory(dimension, spec, faiss.METRIC_INNER_PRODUCT)
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    return index
+
+def train_index(index, embeddings: np.ndarray):
+    """Train IVF/PQ trên mẫu ngẫu nhiên tối đa INDEX_TRAIN_SAMPLE vectors (bỏ qua nếu không cần train)"""
+    if index.is_trained:
+        return
+
+    # Seed cố định để build lại cho cùng kết quả
+    n = len(embeddings)
+    rng = np.random.default_rng(0)
+    sample = embeddings
+    if n > INDEX_TRAIN_SAMPLE:
+        sample = embeddings[np.sort(rng.choice(n, INDEX_TRAIN_SAMPLE, replace=False))]
+    logger.info(f"   Train trên {len(sample)} vectors...")
+    index.train(sample)
+
+def build_index(embeddings: np.ndarray, index_type: str = "flat"):
+    """
+    Tạo index (inner product) theo index_type, train trên mẫu ngẫu nhiên
+    tối đa INDEX_TRAIN_SAMPLE vectors rồi add toàn bộ embeddings.
+    """
+    n, dimension = embeddings.shape
+    index = new_index(index_type, dimension, n)
+    train_index(index, embeddings)
+    index.add(embeddings)
+    set_search_params(index)
+    return index
+
+class IncrementalIndexBuilder:
+    """
+    Build index từ các batch embeddings đến dần (pipeline streaming).
+    Flat: add ngay từng batch. Index cần train (IVF/PQ): giữ INDEX_TRAIN_SAMPLE vectors đầu tiên
+    làm tập train (kích thước IVF/PQ tính theo số này), sau đó add thẳng từng batch.
+    """
+
+    def __init__(self, index_type: str = "flat"):
+        self.index_type = index_type
+        self.index = None
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, embeddings: np.ndarray):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.index is not None:
+            self.index.add(embeddings)
+            return
+
+        self._pending.append(embeddings)
+        self._pending_rows += len(embeddings)
+        if self.index_type == "flat" or self._pending_rows >= INDEX_TRAIN_SAMPLE:
+            self._flush()
+
+    def finish(self):
+        """Index hoàn chỉnh (None nếu không có vector nào)"""
+        if self.index is None and self._pending_rows:
+            self._flush()
+        if self.index is not None:
+            set_search_params(self.index)
+        return self.index
+
+    def _flush(self):
+        embeddings = np.concatenate(self._pending)
+        self._pending = []
+        self._pending_rows = 0
+
+        self.index = new_index(self.index_type, embeddings.shape[1], len(embeddings))
+        train_index(self.index, embeddings)
+        self.index.add(embeddings)
+
+def set_search_params(index, nprobe: int = FAISS_NPROBE, ef_search: int = HNSW_EF_SEARCH):
+    """Đặt nprobe (IVF) / efSearch (HNSW) lúc query; tham số không áp dụng cho index sẽ bị bỏ qua"""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+
+def search_parameters(index, selector, fraction: float):
+    """
+    SearchParameters chỉ xét các id do selector chọn (lọc ngay khi duyệt index, không lọc sau top-k).
+    IVF / HNSW: nprobe / efSearch hiện tại được nới theo 1 / fraction (tỉ lệ vector được chọn, tối đa
+    toàn bộ danh sách IVF) để số ứng viên thỏa điều kiện được duyệt tương đương search không lọc.
+    """
+    widen = 1.0 / max(fraction, 1e-6)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=min(ivf.nlist, math.ceil(ivf.nprobe * widen)))
+    hnsw = faiss.downcast_index(index)
+    if isinstance(hnsw, faiss.IndexHNSW):
+        ef_search = hnsw.hnsw.efSearch
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=min(MAX_FILTERED_EF_SEARCH, math.ceil(ef_search * widen)))
+    return faiss.SearchParameters(sel=selector)
+
+def rescore(queries: np.ndarray, indices: np.ndarray, vectors: np.ndarray, k: int) -> tuple:
+    """
+    Tính lại điểm inner product chính xác cho shortlist (indices từ index nén) bằng vectors float32
+    (thường là mmap: chỉ đọc các dòng trong shortlist) → (distances, indices) top-k, -1 nếu thiếu
+    """
+    ids = np.unique(indices[indices >= 0])
+    distances = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    found = np.full((len(queries), k), -1, dtype=np.int64)
+    if not len(ids):
+        return distances, found
+
+    scores = queries @ np.asarray(vectors[ids], dtype=np.float32).T  # (n_queries, len(ids))
+    for row, candidates in enumerate(indices):
+        candidates = candidates[candidates >= 0]
+        exact = scores[row, np.searchsorted(ids, candidates)]
+        order = np.argsort(-exact, kind="stable")[:k]
+        distances[row, :len(order)] = exact[order]
+        found[row, :len(order)] = candidates[order]
+    return distances, found
+
+def is_exact(index) -> bool:
+    """Flat index: kết quả chính xác và hỗ trợ remove_ids giữ nguyên thứ tự"""
+    return isinstance(index, faiss.IndexFlat)
+
+def enable_reconstruct(index):
+    """IVF: tạo direct map (id → vị trí trong list) để reconstruct theo id; gọi lúc build / load, không phải lúc search"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+def reconstruct_all(index) -> np.ndarray:
+    """Lấy lại toàn bộ vectors trong index (xấp xỉ nếu index nén PQ)"""
+    enable_reconstruct(index)
+    return index.reconstruct_n(0, index.ntotal)
+
+# ==================== BENCHMARK ====================
+def recall_at_k(ground_truth: np.ndarray, results: np.ndarray, k: int) -> float:
+    """Tỉ lệ trung bình top-k chính xác (ground truth) có mặt trong top-k của index"""
+    hits = sum(
+        len(set(truth[:k]) & set(found[:k]))
+        for truth, found in zip(ground_truth, results)
+    )
+    return hits / (len(ground_truth) * k)
+
+def _timed_search(index, queries: np.ndarray, k: int, vectors: np.ndarray = None, factor: int = 1) -> tuple:
+    """
+    Search từng query (như lúc serve) và trả về (indices, latency ms từng query).
+    vectors: shortlist k * factor từ index rồi re-score chính xác (tính cả vào latency)
+    """
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    latencies = np.empty(len(queries))
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        query = query.reshape(1, -1)
+        _, found = index.search(query, k * factor if vectors is not None else k)
+        if vectors is not None:
+            _, found = rescore(query, found, vectors, k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        indices[i] = found[0]
+    return indices, latencies
+
+def benchmark_index_types(embeddings: np.ndarray, queries: np.ndarray, k: int,
+                          index_types: list, nprobes: list, ef_searches: list,
+                          rescore_factor: int = 0) -> list:
+    """
+    So sánh recall@k và latency của các index type với IndexFlatIP (ground truth).
+    Mỗi index được build một lần, sau đó quét các giá trị nprobe/efSearch.
+    rescore_factor > 0: index nén (COMPRESSED_TYPES) được đo thêm với re-score chính xác
+    shortlist k * rescore_factor (memory_mb chỉ tính index, vectors float32 nằm trên đĩa / mmap).
+    Trả về list dict: index_type, param, recall, p50_ms, p95_ms, memory_mb, build_s
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+
+    flat = build_index(embeddings, "flat")
+    ground_truth, flat_latency = _timed_search(flat, queries, k)
+    rows = [{
+        "index_type": "flat",
+        "param": "-",
+        "recall": 1.0,
+        "p50_ms": float(np.percentile(flat_latency, 50)),
+        "p95_ms": float(np.percentile(flat_latency, 95)),
+        "memory_mb": len(faiss.serialize_index(flat)) / 2**20,
+        "build_s": 0.0
+    }]
+
+    for index_type in index_types:
+        if index_type == "flat":
+            continue
+
+        start = time.perf_counter()
+        index = build_index(embeddings, index_type)
+        build_s = time.perf_counter() - start
+        memory_mb = len(faiss.serialize_index(index)) / 2**20
+
+        if index_type == "hnsw":
+            sweep = [("efSearch", v) for v in ef_searches]
+        elif faiss.try_extract_index_ivf(index) is not None:
+            sweep = [("nprobe", v) for v in nprobes]
+        else:
+            sweep = [(None, None)]  # SQ: quét toàn bộ codes, không có tham số
+        rescore_runs = [(None, 1)]
+        if rescore_factor and index_type in COMPRESSED_TYPES:
+            rescore_runs.append((embeddings, rescore_factor))
+
+        for name, value in sweep:
+            set_search_params(
+                index,
+                nprobe=value if name == "nprobe" else None,
+                ef_search=value if name == "efSearch" else None
+            )
+            param = f"{name}={value}" if name else "-"
+            for vectors, factor in rescore_runs:
+                found, latency = _timed_search(index, queries, k, vectors, factor)
+                rows.append({
+                    "index_type": index_type,
+                    "param": param if vectors is None else f"{param} rescore×{factor}",
+                    "recall": recall_at_k(ground_truth, found, k),
+                    "p50_ms": float(np.percentile(latency, 50)),
+                    "p95_ms": float(np.percentile(latency, 95)),
+                    "memory_mb": memory_mb,
+                    "build_s": build_s
+                })
+
+    return rows
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from config import (
+    FAISS_MANIFEST_PATH,
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_ACROSS_PAGES,
+    SEMANTIC_CHUNKING,
+    SEMANTIC_BREAKPOINT_PERCENTILE,
+    SEMANTIC_BREAKPOINT_WINDOW,
+    SEMANTIC_MIN_CHUNK_SIZE,
+    EMBEDDING_MODEL,
+    EMBEDDING_BACKEND,
+    FAISS_INDEX_TYPE,
+    NUM_SHARDS
+)
+from embedding_models import model_spec
+from pdf_loader import pdf_source_name
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+def current_settings() -> dict:
+    """Các thiết lập ảnh hưởng tới vectors - đổi bất kỳ giá trị nào thì phải build lại toàn bộ"""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "chunk_across_pages": CHUNK_ACROSS_PAGES,
+        "semantic_chunking": SEMANTIC_CHUNKING,
+        "semantic_breakpoint_percentile": SEMANTIC_BREAKPOINT_PERCENTILE,
+        "semantic_breakpoint_window": SEMANTIC_BREAKPOINT_WINDOW,
+        "semantic_min_chunk_size": SEMANTIC_MIN_CHUNK_SIZE,
+        "embedding_model": EMBEDDING_MODEL,
+        "embedding_prefixes": model_spec(EMBEDDING_MODEL),
+        "embedding_backend": EMBEDDING_BACKEND,
+        "index_type": FAISS_INDEX_TYPE,
+        "num_shards": NUM_SHARDS
+    }
+
+def file_fingerprint(pdf_path: str) -> str:
+    """SHA-256 nội dung file PDF (đọc theo block 1 MB)"""
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_signature(pdf_path: str, known: dict = None) -> dict:
+    """
+    {"sha256", "size", "mtime_ns"} của file. known: entry manifest cũ - size + mtime không đổi
+    → dùng lại sha256 đã lưu, không đọc lại file (corpus hàng trăm file)
+    """
+    stat = os.stat(pdf_path)
+    signature = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if known and all(known.get(key) == value for key, value in signature.items()):
+        return {"sha256": known["sha256"], **signature}
+    return {"sha256": file_fingerprint(pdf_path), **signature}
+
+def page_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def page_hashes(documents: list) -> dict:
+    """{source: {page: hash}} cho danh sách Document trang"""
+    hashes = {}
+    for doc in documents:
+        source = doc.metadata["source"]
+        hashes.setdefault(source, {})[doc.metadata["page"]] = page_hash(doc.page_content)
+    return hashes
+
+def build_manifest(pdf_paths: list, hashes: dict) -> dict:
+    """
+    Tạo manifest mới sau khi build toàn bộ index
+    hashes: {source: {page: hash}} (page_hashes(documents) hoặc IngestPipeline.page_hashes)
+    """
+    files = {}
+    for pdf_path in pdf_paths:
+        if not Path(pdf_path).exists():
+            continue
+        source = pdf_source_name(pdf_path)
+        files[source] = {
+            **file_signature(pdf_path),
+            "pages": hashes.get(source, {})
+        }
+    return {
+        "version": MANIFEST_VERSION,
+        "settings": current_settings(),
+        "files": files
+    }
+
+def load_manifest():
+    """Load manifest; trả về None nếu không có hoặc không khớp thiết lập hiện tại"""
+    if not Path(FAISS_MANIFEST_PATH).exists():
+        return None
+
+    try:
+        with open(FAISS_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        logger.warning(f"⚠️ Manifest lỗi, bỏ qua: {str(e)}")
+        return None
+
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != current_settings():
+        logger.info("ℹ️ Thiết lập chunking/embedding đã đổi so với manifest")
+        return None
+
+    # JSON lưu key là string → chuyển số trang về int
+    for entry in manifest["files"].values():
+        entry["pages"] = {int(page): digest for page, digest in entry["pages"].items()}
+    return manifest
+
+def save_manifest(manifest: dict):
+    """Ghi manifest ra file tạm rồi thay thế, tránh để lại manifest ghi dở"""
+    Path(FAISS_MANIFEST_PATH).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = FAISS_MANIFEST_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, FAISS_MANIFEST_PATH)
+    logger.info(f"   Manifest: {FAISS_MANIFEST_PATH}")
+
+def find_changed_files(manifest: dict, pdf_paths: list) -> tuple:
+    """
+    So sánh fingerprint file với manifest (file có size + mtime không đổi không bị đọc lại).
+    Trả về (changed_paths, removed_sources, fingerprints) với fingerprints = {source: file_signature}
+    """
+    changed_paths = []
+    fingerprints = {}
+    configured_sources = set()
+
+    for pdf_path in pdf_paths:
+        source = pdf_source_name(pdf_path)
+        configured_sources.add(source)
+        if not Path(pdf_path).exists():
+            logger.warning(f"⚠️ Không tìm thấy {pdf_path}, giữ nguyên vectors cũ")
+            continue
+
+        known = manifest["files"].get(source, {})
+        fingerprints[source] = file_signature(pdf_path, known)
+        if known.get("sha256") != fingerprints[source]["sha256"]:
+            changed_paths.append(pdf_path)
+
+    removed_sources = set(manifest["files"]) - configured_sources
+    return changed_paths, removed_sources, fingerprints
+
+def diff_pages(manifest: dict, documents: list, changed_sources: set, removed_sources: set) -> tuple:
+    """
+    So sánh hash từng trang của các file đã load lại với manifest.
+    Trả về (changed_docs, stale_pages):
+      - changed_docs: Document trang mới hoặc có nội dung thay đổi → cần chunk + embed
+      - stale_pages: set (source, page) có vectors cũ cần xóa khỏi index
+    CHUNK_ACROSS_PAGES: chunk có thể vắt qua trang bên cạnh → file có trang thay đổi được chunk lại
+    toàn bộ (chunk không đổi vẫn lấy embedding từ cache)
+    """
+    new_hashes = page_hashes(documents)
+    changed_docs = []
+    stale_pages = set()
+
+    for doc in documents:
+        source, page = doc.metadata["source"], doc.metadata["page"]
+        old_pages = manifest["files"].get(source, {}).get("pages", {})
+        if old_pages.get(page) != new_hashes[source][page]:
+            changed_docs.append(doc)
+
+    # Trang cũ bị sửa hoặc không còn tồn tại (trang rỗng / file ngắn đi)
+    for source in changed_sources:
+        for page, digest in manifest["files"].get(source, {}).get("pages", {}).items():
+            if new_hashes.get(source, {}).get(page) != digest:
+                stale_pages.add((source, page))
+
+    if CHUNK_ACROSS_PAGES:
+        dirty_sources = {doc.metadata["source"] for doc in changed_docs} | {source for source, _ in stale_pages}
+        changed_docs = [doc for doc in documents if doc.metadata["source"] in dirty_sources]
+        for source in dirty_sources:
+            stale_pages.update((source, page) for page in manifest["files"].get(source, {}).get("pages", {}))
+
+    for source in removed_sources:
+        stale_pages.update((source, page) for page in manifest["files"][source]["pages"])
+
+    return changed_docs, stale_pages
+
+def update_manifest(manifest: dict, documents: list, fingerprints: dict, changed_sources: set, removed_sources: set) -> dict:
+    """Cập nhật manifest sau khi index đã được cập nhật tăng dần"""
+    hashes = page_hashes(documents)
+    for source in changed_sources:
+        manifest["files"][source] = {
+            **fingerprints[source],
+            "pages": hashes.get(source, {})
+        }
+    for source in removed_sources:
+        manifest["files"].pop(source, None)
+    return manifest
@@ -0,0 +1,141 @@
+"""
+Index theo version: mỗi lần train / cập nhật ghi trọn một thư mục mới
+FAISS_VERSIONS_DIR/<version>/{index.faiss, chunks, bm25, info.json[, vectors.f32]} rồi mới đổi con trỏ
+FAISS_VERSIONS_DIR/CURRENT (ghi file tạm + os.replace → nguyên tử). Process đang chạy không bao giờ
+đọc phải index ghi dở, version cũ vẫn nguyên vẹn cho tới khi bị dọn (giữ INDEX_KEEP_VERSIONS bản).
+Version chia shard (NUM_SHARDS > 1) gồm shards.json + mỗi shard một thư mục shard-XX cùng bố cục trên.
+Version đã từng publish có file PUBLISHED; thư mục không có (train bị kill giữa chừng) là rác, bị dọn khi publish.
+"""
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import NamedTuple
+from config import (
+    FAISS_VERSIONS_DIR,
+    INDEX_KEEP_VERSIONS,
+    FAISS_INDEX_PATH,
+    FAISS_CHUNKS_PATH,
+    FAISS_BM25_PATH,
+    FAISS_INFO_PATH,
+    FAISS_METADATA_PATH
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+POINTER_NAME = "CURRENT"
+SHARDS_NAME = "shards.json"
+PUBLISHED_NAME = "PUBLISHED"
+
+class IndexPaths(NamedTuple):
+    index: str
+    chunks: str
+    bm25: str
+    info: str
+    vectors: str = None  # float32 (n, d) để re-score index nén, None = bố cục cũ
+    version: str = None  # None = bố cục cũ (chưa có version)
+
+# Index build trước khi có version: đọc được, không ghi nữa
+LEGACY_PATHS = IndexPaths(FAISS_INDEX_PATH, FAISS_CHUNKS_PATH, FAISS_BM25_PATH, FAISS_INFO_PATH)
+
+def version_paths(version: str) -> IndexPaths:
+    return _paths_in(Path(FAISS_VERSIONS_DIR) / version, version)
+
+def shard_paths(paths: IndexPaths, shard: int) -> IndexPaths:
+    """Đường dẫn shard thứ shard trong version paths"""
+    return _paths_in(Path(paths.index).parent / f"shard-{shard:02d}", paths.version)
+
+def shard_count(paths: IndexPaths) -> int:
+    """Số shard của version (0 = index một khối, gồm cả bố cục cũ)"""
+    if paths.version is None:
+        return 0
+    try:
+        with open(Path(paths.index).parent / SHARDS_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)["shards"]
+    except FileNotFoundError:
+        return 0
+
+def write_shard_count(paths: IndexPaths, shards: int):
+    with open(Path(paths.index).parent / SHARDS_NAME, 'w', encoding='utf-8') as f:
+        json.dump({"shards": shards}, f)
+
+def _paths_in(root: Path, version: str) -> IndexPaths:
+    return IndexPaths(
+        str(root / "index.faiss"),
+        str(root / "chunks"),
+        str(root / "bm25"),
+        str(root / "info.json"),
+        str(root / "vectors.f32"),
+        version
+    )
+
+def current_version() -> str:
+    """Version CURRENT đang trỏ tới, None nếu chưa publish version nào"""
+    pointer = Path(FAISS_VERSIONS_DIR) / POINTER_NAME
+    try:
+        version = pointer.read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+def index_exists() -> bool:
+    """Đã có index + chunk store (version CURRENT, hoặc bố cục cũ / metadata pickle) trên đĩa chưa"""
+    if current_version() is not None:
+        return True
+    return Path(LEGACY_PATHS.index).exists() and (
+        Path(LEGACY_PATHS.chunks).exists() or Path(FAISS_METADATA_PATH).exists()
+    )
+
+def current_paths() -> IndexPaths:
+    """Đường dẫn của version hiện tại, chưa có version nào → bố cục cũ"""
+    version = current_version()
+    return version_paths(version) if version is not None else LEGACY_PATHS
+
+def new_version() -> IndexPaths:
+    """Thư mục cho version mới (tên theo thời gian → sắp xếp được), chưa publish"""
+    version = time.strftime("%Y%m%d-%H%M%S") + f"-{time.time_ns() % 1_000_000_000:09d}"
+    paths = version_paths(version)
+    Path(paths.index).parent.mkdir(parents=True, exist_ok=True)
+    return paths
+
+def publish(paths: IndexPaths):
+    """Đổi con trỏ CURRENT sang version đã ghi xong, rồi dọn version cũ"""
+    (Path(paths.index).parent / PUBLISHED_NAME).touch()
+    pointer = Path(FAISS_VERSIONS_DIR) / POINTER_NAME
+    tmp = pointer.with_name(POINTER_NAME + ".tmp")
+    tmp.write_text(paths.version, encoding="utf-8")
+    os.replace(tmp, pointer)
+    logger.info(f"   Version: {paths.version} (CURRENT)")
+    prune()
+
+def discard(paths: IndexPaths):
+    """Xóa version chưa publish (ghi lỗi giữa chừng)"""
+    if paths.version == current_version():
+        return
+    shutil.rmtree(Path(paths.index).parent, ignore_errors=True)
+
+def prune(keep: int = INDEX_KEEP_VERSIONS):
+    """
+    Xóa các version cũ, giữ keep version đã publish mới nhất (luôn gồm CURRENT) để rollback,
+    và xóa thư mục chưa publish cũ hơn CURRENT (build bị ngắt). Version còn được process khác
+    mmap (Windows không cho xóa) được bỏ qua, lần publish sau sẽ thử lại.
+    """
+    current = current_version()
+    published, orphans = [], []
+    for entry in Path(FAISS_VERSIONS_DIR).iterdir():
+        if not entry.is_dir() or entry.name == current:
+            continue
+        if (entry / PUBLISHED_NAME).exists():
+            published.append(entry.name)
+        elif current is not None and entry.name < current:
+            orphans.append(entry.name)  # Mới hơn CURRENT: có thể là build đang chạy
+
+    for version in orphans + sorted(published, reverse=True)[max(keep - 1, 0):]:
+        try:
+            shutil.rmtree(Path(FAISS_VERSIONS_DIR) / version)
+            logger.info(f"   Xóa version cũ: {version}")
+        except OSError as e:
+            logger.warning(f"   ⚠️ Chưa xóa được version {version}: {str(e)}")
@@ -0,0 +1,68 @@
+import threading
+from index_versions import current_version, version_paths
+from config import INDEX_WATCH_INTERVAL, SERVER_REQUEST_TIMEOUT
+import logging
+
+logger = logging.getLogger(__name__)
+
+class IndexWatcher:
+    """
+    Hot-swap index không downtime theo kiểu read-copy-update: thread nền kiểm tra con trỏ CURRENT
+    mỗi interval giây; khi train_rag.py publish version mới, một store mới (một khối hoặc chia shard)
+    được load đầy đủ trên thread này rồi on_swap(store) thay reference (một phép gán, không lock).
+    Query đang chạy giữ reference tới store cũ tới khi xong (store cũ được giải phóng khi không
+    còn ai dùng, worker process của store chia shard được dừng sau SERVER_REQUEST_TIMEOUT giây),
+    query mới dùng store mới; không query nào phải chờ hay thấy index load dở.
+    Version load lỗi (vd. khác model embedding) bị bỏ qua, tiếp tục dùng store hiện tại.
+    """
+
+    def __init__(self, vector_store, on_swap, interval: float = INDEX_WATCH_INTERVAL):
+        self.on_swap = on_swap
+        self.store = vector_store
+        self.interval = interval
+        self.loaded = vector_store.paths.version if vector_store.paths is not None else None
+        self.failed = None  # Version load lỗi, không thử lại tới khi CURRENT đổi
+        self.swaps = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+
+    def start(self) -> "IndexWatcher":
+        self._thread.start()
+        logger.info(f"👀 Theo dõi version index mới (mỗi {self.interval}s)")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def check(self) -> bool:
+        """Load + swap nếu CURRENT trỏ tới version mới, trả về True nếu đã swap"""
+        version = current_version()
+        if version is None or version in (self.loaded, self.failed):
+            return False
+
+        from sharded_store import load_vector_store
+        logger.info(f"🔄 Phát hiện index version mới: {version}")
+        try:
+            store = load_vector_store(version_paths(version))
+        except Exception as e:
+            self.failed = version
+            logger.error(f"❌ Không swap sang version {version}, giữ version {self.loaded}: {str(e)}")
+            return False
+
+        self.on_swap(store)
+        old, self.store = self.store, store
+        closer = threading.Timer(SERVER_REQUEST_TIMEOUT, old.close)
+        closer.daemon = True
+        closer.start()
+        self.loaded = version
+        self.swaps += 1
+        logger.info(f"✅ Đã chuyển sang index version {version} ({store.ntotal} vectors)")
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"❌ Lỗi theo dõi index: {str(e)}")
@@ -0,0 +1,228 @@
+import queue
+import threading
+import time
+from pdf_loader import iter_pdf_pages, log_extract_report
+from extraction_cache import ExtractionCache
+from semantic_chunker import SemanticChunker, SentenceSplitter, StreamingChunker
+from index_manifest import page_hash
+from config import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    INGEST_BATCH_SIZE,
+    INGEST_PAGE_QUEUE_SIZE,
+    INGEST_BATCH_QUEUE_SIZE,
+    SEMANTIC_CHUNKING,
+    SEMANTIC_SENTENCE_BATCH,
+    PDF_EXTRACT_CACHE_DIR
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()  # Đánh dấu stage trước đã xong
+POLL_INTERVAL = 0.1  # giây, chu kỳ kiểm tra tín hiệu dừng khi queue đầy/rỗng
+
+class StageStats:
+    """Số item và thời gian làm việc (không tính lúc chờ queue) của một stage"""
+
+    def __init__(self, name: str, unit: str):
+        self.name = name
+        self.unit = unit
+        self.items = 0
+        self.busy = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.items / self.busy if self.busy else 0.0
+
+class IngestPipeline:
+    """
+    Pipeline streaming: trang PDF → chunks → batch embeddings → index.add.
+    Trích xuất và chunking chạy trên các thread riêng, nối với nhau bằng queue giới hạn
+    (INGEST_PAGE_QUEUE_SIZE trang, INGEST_BATCH_QUEUE_SIZE batch) nên các stage chạy chồng lên nhau
+    và bộ nhớ không tăng theo kích thước corpus. Embedding chạy trên thread gọi batches().
+    semantic=True: thread chunking chỉ tách câu (batch SEMANTIC_SENTENCE_BATCH câu), SemanticChunker
+    embed câu và ghép chunk trên thread embedding.
+    Text trích xuất của từng file được cache (PDF_EXTRACT_CACHE_DIR): file không đổi không parse lại,
+    pipeline bị ngắt chạy lại sẽ tiếp tục từ file còn dở (embedding lấy từ embedding cache).
+
+        pipeline = IngestPipeline(pdf_files(), embedding_service)
+        vector_store.build_streaming(pipeline.batches())
+    """
+
+    def __init__(self, pdf_paths: list, embedding_service, batch_size: int = INGEST_BATCH_SIZE, workers: int = None,
+                 semantic: bool = SEMANTIC_CHUNKING):
+        self.pdf_paths = pdf_paths
+        self.embedding_service = embedding_service
+        self.batch_size = batch_size
+        self.workers = workers
+        self.semantic = SemanticChunker(embedding_service) if semantic else None
+
+        self.page_hashes = {}  # {source: {page: hash}} cho manifest
+        self.cache = ExtractionCache() if PDF_EXTRACT_CACHE_DIR else None
+        self.files = {}  # pdf_path → FileReport
+        self.stats = {
+            "extract": StageStats("Trích xuất PDF", "trang"),
+            "chunk": StageStats("Tách câu", "câu") if semantic else StageStats("Chunking", "chunks"),
+            "embed": StageStats("Embedding + ghép chunk" if semantic else "Embedding", "chunks"),
+            "index": StageStats("Index + chunk store", "vectors")
+        }
+        self.wall = 0.0
+
+        self._stop = threading.Event()
+        self._errors = []
+
+    # ==================== QUEUE ====================
+    def _put(self, q: queue.Queue, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _drain(self, q: queue.Queue):
+        while True:
+            item = self._get(q)
+            if item is _DONE:
+                return
+            yield item
+
+    def _run(self, stage, *queues):
+        """Chạy stage trên thread; lỗi → dừng cả pipeline, luôn báo _DONE cho stage sau"""
+        try:
+            stage(*queues)
+        except BaseException as e:
+            logger.error(f"❌ Lỗi pipeline: {str(e)}")
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            self._put(queues[-1], _DONE)
+
+    # ==================== STAGES ====================
+    def _extract(self, page_queue: queue.Queue):
+        stats = self.stats["extract"]
+        pages = iter_pdf_pages(self.pdf_paths, self.workers, self.cache, self.files)
+        try:
+            while True:
+                start = time.perf_counter()
+                doc = next(pages, None)
+                stats.busy += time.perf_counter() - start
+                if doc is None:
+                    return
+
+                source, page = doc.metadata["source"], doc.metadata["page"]
+                self.page_hashes.setdefault(source, {})[page] = page_hash(doc.page_content)
+                stats.items += 1
+                if not self._put(page_queue, doc):
+                    return
+        finally:
+            pages.close()  # Dừng sớm → đóng process pool trích xuất
+
+    def _chunk(self, page_queue: queue.Queue, batch_queue: queue.Queue):
+        """Chunks (hoặc câu, khi semantic) theo batch"""
+        stats = self.stats["chunk"]
+        chunker = SentenceSplitter() if self.semantic else StreamingChunker()
+        batch_size = SEMANTIC_SENTENCE_BATCH if self.semantic else self.batch_size
+        batch = []
+        for doc in self._drain(page_queue):
+            start = time.perf_counter()
+            chunks = chunker.feed(doc)
+            stats.busy += time.perf_counter() - start
+            stats.items += len(chunks)
+
+            batch.extend(chunks)
+            if len(batch) >= batch_size:
+                if not self._put(batch_queue, batch):
+                    return
+                batch = []
+
+        if self._stop.is_set():
+            return
+        chunks = chunker.flush()
+        stats.items += len(chunks)
+        batch.extend(chunks)
+        if batch:
+            self._put(batch_queue, batch)
+
+    def _embed(self, batch_queue: queue.Queue):
+        """Generator (chunks, embeddings) cho từng batch từ stage chunking"""
+        stats = self.stats["embed"]
+        for batch in self._drain(batch_queue):
+            start = time.perf_counter()
+            if self.semantic:
+                chunks, embeddings = self.semantic.group(batch)
+            else:
+                chunks = batch
+                embeddings = self.embedding_service.encode_passages(
+                    [chunk.page_content for chunk in chunks], verbose=False
+                )
+            stats.busy += time.perf_counter() - start
+            stats.items += len(chunks)
+            if chunks:
+                yield chunks, embeddings
+
+        # Chunk cuối còn mở của semantic chunker (chỉ khi các stage trước xong bình thường)
+        if self.semantic and not self._stop.is_set():
+            start = time.perf_counter()
+            chunks, embeddings = self.semantic.group([], final=True)
+            stats.busy += time.perf_counter() - start
+            stats.items += len(chunks)
+            if chunks:
+                yield chunks, embeddings
+
+    # ==================== CHẠY ====================
+    def batches(self):
+        """Generator (embeddings, records) cho FAISSVectorStore.build_streaming"""
+        if self.semantic:
+            logger.info(f"⚙️  Pipeline: semantic chunking, batch {SEMANTIC_SENTENCE_BATCH} câu, chunk size tối đa {CHUNK_SIZE}")
+        else:
+            logger.info(f"⚙️  Pipeline: batch {self.batch_size} chunks, chunk size {CHUNK_SIZE}, overlap {CHUNK_OVERLAP}")
+        page_queue = queue.Queue(maxsize=INGEST_PAGE_QUEUE_SIZE)
+        batch_queue = queue.Queue(maxsize=INGEST_BATCH_QUEUE_SIZE)
+        threads = [
+            threading.Thread(target=self._run, args=(self._extract, page_queue), name="ingest-extract", daemon=True),
+            threading.Thread(target=self._run, args=(self._chunk, page_queue, batch_queue), name="ingest-chunk", daemon=True)
+        ]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        index_stats = self.stats["index"]
+        try:
+            for batch_num, (chunks, embeddings) in enumerate(self._embed(batch_queue), 1):
+                records = [{"content": chunk.page_content, "metadata": chunk.metadata} for chunk in chunks]
+                start = time.perf_counter()
+                yield embeddings, records
+                index_stats.busy += time.perf_counter() - start
+                index_stats.items += len(records)
+
+                if batch_num % 10 == 0:
+                    logger.info(f"   Đã index: {index_stats.items} chunks ({self.stats['extract'].items} trang)")
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.wall = time.perf_counter() - started
+
+        if self._errors:
+            raise self._errors[0]
+
+    def log_stats(self):
+        log_extract_report(self.files)
+        logger.info(f"\n⏱️  PIPELINE ({self.wall:.1f}s tổng):")
+        for stats in self.stats.values():
+            logger.info(
+                f"  • {stats.name:<22} {stats.items:>7} {stats.unit:<7} "
+                f"{stats.busy:>7.1f}s  {stats.throughput:>8.1f} {stats.unit}/s"
+            )
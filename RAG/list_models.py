@@ -1,9 +1,14 @@
-import google.generativeai as genai
 from config import GEMINI_API_KEY
 
-genai.configure(api_key=GEMINI_API_KEY)
+def main():
+    import google.generativeai as genai  # Import khi chạy, không phải lúc load module
 
-models = genai.list_models()
-print("Available models:")
-for m in models:
-    print(m['name'])
+    genai.configure(api_key=GEMINI_API_KEY)
+
+    models = genai.list_models()
+    print("Available models:")
+    for m in models:
+        print(m.name)
+
+if __name__ == "__main__":
+    main()
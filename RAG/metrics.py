@@ -0,0 +1,181 @@
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from config import METRICS_WINDOW
+
+# Biên bucket (giây) của histogram latency
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUANTILES = (0.5, 0.95, 0.99)
+# Biên bucket kích thước batch query embedding (micro-batching)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class QueryTrace:
+    """
+    Thời gian từng stage của một query (ms).
+    with trace.span("embed"): ... → cộng dồn vào timings["embed"]
+    trace.mark("first_token") → thời điểm (tính từ lúc bắt đầu query)
+    """
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self.timings = {}
+        self.prompt_chars = 0
+        self.num_docs = 0
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+
+    def mark(self, name: str):
+        if name not in self.timings:
+            self.timings[name] = (time.perf_counter() - self._start) * 1000
+
+    def fork(self) -> "QueryTrace":
+        """Trace riêng cho từng câu hỏi của một batch: chung thời điểm bắt đầu và các stage đã đo"""
+        trace = QueryTrace()
+        trace._start = self._start
+        trace.timings = dict(self.timings)
+        return trace
+
+    def finish(self) -> dict:
+        self.timings["total"] = (time.perf_counter() - self._start) * 1000
+        return {
+            "timings_ms": {stage: round(ms, 3) for stage, ms in self.timings.items()},
+            "prompt_chars": self.prompt_chars,
+            "num_docs": self.num_docs
+        }
+
+class _Histogram:
+    def __init__(self, window: int):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # bucket cuối = +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)  # Cửa sổ trượt để tính p50/p95/p99
+
+    def observe(self, value: float):
+        i = 0
+        while i < len(LATENCY_BUCKETS) and value > LATENCY_BUCKETS[i]:
+            i += 1
+        self.buckets[i] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantiles(self) -> dict:
+        if not self.recent:
+            return {q: 0.0 for q in QUANTILES}
+        values = np.percentile(np.fromiter(self.recent, dtype=np.float64), [q * 100 for q in QUANTILES])
+        return dict(zip(QUANTILES, values.tolist()))
+
+class QueryMetrics:
+    """
+    Gom QueryTrace của mọi query: histogram latency theo stage (giây), p50/p95/p99 trên
+    METRICS_WINDOW query gần nhất, số query theo status, tổng prompt chars / số docs.
+    Xuất dạng text Prometheus (node_exporter textfile collector hoặc GET /metrics).
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._statuses = {}
+        self._prompt_chars = 0
+        self._docs = 0
+        self._batch_sizes = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self._batch_count = 0
+        self._batch_sum = 0
+
+    def observe(self, metrics: dict, status: str):
+        """metrics: kết quả QueryTrace.finish()"""
+        with self._lock:
+            for stage, ms in metrics["timings_ms"].items():
+                if stage not in self._stages:
+                    self._stages[stage] = _Histogram(self.window)
+                self._stages[stage].observe(ms / 1000)
+            self._statuses[status] = self._statuses.get(status, 0) + 1
+            self._prompt_chars += metrics["prompt_chars"]
+            self._docs += metrics["num_docs"]
+
+    def observe_batch(self, size: int):
+        """Kích thước một batch query embedding của QueryBatcher"""
+        i = 0
+        while i < len(BATCH_SIZE_BUCKETS) and size > BATCH_SIZE_BUCKETS[i]:
+            i += 1
+        with self._lock:
+            self._batch_sizes[i] += 1
+            self._batch_count += 1
+            self._batch_sum += size
+
+    def summary(self) -> dict:
+        """{stage: {"count", "p50_ms", "p95_ms", "p99_ms"}}"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": histogram.count,
+                    **{f"p{int(q * 100)}_ms": round(v * 1000, 3) for q, v in histogram.quantiles().items()}
+                }
+                for stage, histogram in self._stages.items()
+            }
+
+    def to_prometheus(self) -> str:
+        with self._lock:
+            lines = [
+                "# HELP rag_stage_duration_seconds Thời gian từng stage của query RAG",
+                "# TYPE rag_stage_duration_seconds histogram"
+            ]
+            for stage, histogram in self._stages.items():
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), histogram.buckets):
+                    cumulative += count
+                    lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines += [
+                f"# HELP rag_stage_duration_quantile_seconds p50/p95/p99 trên {self.window} query gần nhất",
+                "# TYPE rag_stage_duration_quantile_seconds gauge"
+            ]
+            for stage, histogram in self._stages.items():
+                for q, value in histogram.quantiles().items():
+                    lines.append(f'rag_stage_duration_quantile_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+
+            lines += ["# HELP rag_queries_total Số query theo status", "# TYPE rag_queries_total counter"]
+            for status, count in self._statuses.items():
+                lines.append(f'rag_queries_total{{status="{status}"}} {count}')
+
+            lines += [
+                "# TYPE rag_prompt_chars_total counter",
+                f"rag_prompt_chars_total {self._prompt_chars}",
+                "# TYPE rag_retrieved_docs_total counter",
+                f"rag_retrieved_docs_total {self._docs}"
+            ]
+
+            if self._batch_count:
+                lines += [
+                    "# HELP rag_query_embed_batch_size Số query mỗi lần encode (micro-batching)",
+                    "# TYPE rag_query_embed_batch_size histogram"
+                ]
+                cumulative = 0
+                for bound, count in zip(BATCH_SIZE_BUCKETS + ("+Inf",), self._batch_sizes):
+                    cumulative += count
+                    lines.append(f'rag_query_embed_batch_size_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"rag_query_embed_batch_size_sum {self._batch_sum}")
+                lines.append(f"rag_query_embed_batch_size_count {self._batch_count}")
+            return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Ghi file .prom qua file tạm + os.replace (collector không bao giờ đọc file ghi dở)"""
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(target.name + ".tmp")
+        tmp.write_text(self.to_prometheus(), encoding="utf-8")
+        os.replace(tmp, target)
@@ -1,64 +1,434 @@
+import glob
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from pypdf import PdfReader
 from langchain.schema import Document
-from config import PDF_FILE_1, PDF_FILE_2
+from extraction_cache import ExtractionCache
+from config import (
+    PDF_FILE_1,
+    PDF_FILE_2,
+    PDF_CORPUS,
+    PDF_EXTRACT_WORKERS,
+    PDF_PAGES_PER_SHARD,
+    INGEST_REPORT_PATH
+)
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def load_pdf_as_text(pdf_path: str) -> list:
+# Cache PdfReader trong mỗi process worker để không parse lại file cho từng shard
+# (chỉ giữ vài file gần nhất: corpus có hàng trăm file)
+_worker_readers = {}
+WORKER_READER_CACHE = 4
+SLOWEST_FILES = 10  # Số file chậm nhất hiện trong báo cáo trích xuất
+
+def pdf_source_name(pdf_path: str) -> str:
+    """Tên nguồn lưu trong metadata["source"] của mỗi trang (tên file)"""
+    return Path(pdf_path).name
+
+def corpus_files(corpus: str) -> list:
+    """
+    Các file PDF của corpus: thư mục (quét đệ quy *.pdf) hoặc glob (vd. E:/brochures/**/*.pdf),
+    theo thứ tự đường dẫn. Hai file trùng tên (cùng source) → giữ file đầu tiên.
+    """
+    if os.path.isdir(corpus):
+        paths = [str(path) for path in Path(corpus).rglob("*") if path.suffix.lower() == ".pdf" and path.is_file()]
+    else:
+        paths = [path for path in glob.glob(corpus, recursive=True) if os.path.isfile(path)]
+
+    files = {}
+    for path in sorted(paths):
+        source = pdf_source_name(path)
+        if source in files:
+            logger.warning(f"⚠️ Trùng tên {source}: bỏ qua {path} (đã có {files[source]})")
+            continue
+        files[source] = path
+    if not files:
+        logger.warning(f"⚠️ Không tìm thấy file PDF nào trong {corpus}")
+    return list(files.values())
+
+def pdf_files() -> list:
+    """Các file PDF cần ingest (PDF_CORPUS nếu có). Quét lại mỗi lần gọi, không quét lúc import"""
+    return corpus_files(PDF_CORPUS) if PDF_CORPUS else [PDF_FILE_1, PDF_FILE_2]
+
+class FileReport:
+    """Kết quả trích xuất một file PDF (báo cáo throughput / lỗi của lần ingest)"""
+
+    def __init__(self, pdf_path: str):
+        self.path = pdf_path
+        self.status = "pending"  # cached | extracted | partial (có shard lỗi) | failed
+        self.size = 0
+        self.total_pages = 0
+        self.pages = 0  # Trang có text
+        self.page_errors = 0
+        self.seconds = 0.0  # Thời gian xử lý trong worker (đếm trang + trích xuất)
+        self.error = None
+
+    @property
+    def throughput(self) -> float:
+        return self.total_pages / self.seconds if self.seconds else 0.0
+
+    def fail(self, error: str):
+        self.status = "failed"
+        self.error = error
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "source": pdf_source_name(self.path),
+            "status": self.status,
+            "size": self.size,
+            "total_pages": self.total_pages,
+            "pages": self.pages,
+            "page_errors": self.page_errors,
+            "seconds": round(self.seconds, 3),
+            "pages_per_s": round(self.throughput, 1),
+            "error": self.error
+        }
+
+def _make_document(pdf_path: str, page_num: int, text: str, total_pages: int) -> Document:
+    return Document(
+        page_content=text,
+        metadata={
+            "source": pdf_source_name(pdf_path),
+            "page": page_num + 1,
+            "total_pages": total_pages
+        }
+    )
+
+def _extract_pages(reader: PdfReader, start: int, end: int) -> tuple:
+    """
+    Trích xuất text các trang [start, end).
+    Trả về (pages, errors) với pages = [(page_num, text)], errors = [(page_num, message)]
+    """
+    pages = []
+    errors = []
+
+    for page_num in range(start, end):
+        try:
+            text = reader.pages[page_num].extract_text()
+            if text.strip():  # Chỉ lấy trang có nội dung
+                pages.append((page_num, text))
+        except Exception as e:
+            errors.append((page_num, str(e)))
+
+    return pages, errors
+
+def _worker_reader(pdf_path: str) -> PdfReader:
+    reader = _worker_readers.get(pdf_path)
+    if reader is None:
+        reader = PdfReader(pdf_path)
+        _worker_readers[pdf_path] = reader
+        while len(_worker_readers) > WORKER_READER_CACHE:
+            del _worker_readers[next(iter(_worker_readers))]
+    return reader
+
+def _extract_shard(pdf_path: str, start: int, end: int) -> tuple:
+    """Chạy trong process worker: trích xuất một shard trang của file PDF"""
+    return _extract_pages(_worker_reader(pdf_path), start, end)
+
+def _count_pages(pdf_path: str) -> tuple:
+    """Chạy trong process worker: (số trang, thời gian)"""
+    started = time.perf_counter()
+    total_pages = len(_worker_reader(pdf_path).pages)
+    return total_pages, time.perf_counter() - started
+
+def _extract_shard_timed(pdf_path: str, start: int, end: int) -> tuple:
+    """_extract_shard + thời gian xử lý trong worker → (pages, errors, giây)"""
+    started = time.perf_counter()
+    pages, errors = _extract_shard(pdf_path, start, end)
+    return pages, errors, time.perf_counter() - started
+
+def _resolve_workers(workers: int = None) -> int:
+    if workers is None:
+        workers = PDF_EXTRACT_WORKERS
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+def load_pdf_as_text(pdf_path: str, workers: int = 1) -> list:
     """
     Load PDF và trích xuất text (bỏ qua hình ảnh)
+    workers > 1: chia file thành các shard trang và trích xuất trên process pool
     """
+    if _resolve_workers(workers) > 1:
+        return load_pdfs_parallel([pdf_path], workers)
+
     try:
         logger.info(f"📖 Đang load PDF: {pdf_path}")
         reader = PdfReader(pdf_path)
         total_pages = len(reader.pages)
         logger.info(f"   Tổng trang: {total_pages}")
-        
-        documents = []
-        
-        for page_num, page in enumerate(reader.pages):
-            try:
-                text = page.extract_text()
-                if text.strip():  # Chỉ lấy trang có nội dung
-                    doc = Document(
-                        page_content=text,
-                        metadata={
-                            "source": pdf_path.split("\\")[-1],
-                            "page": page_num + 1,
-                            "total_pages": total_pages
-                        }
-                    )
-                    documents.append(doc)
-            except Exception as e:
-                logger.warning(f"   ⚠️ Lỗi trang {page_num + 1}: {str(e)}")
-                continue
-        
+
+        pages, errors = _extract_pages(reader, 0, total_pages)
+        for page_num, message in errors:
+            logger.warning(f"   ⚠️ Lỗi trang {page_num + 1}: {message}")
+
+        documents = [
+            _make_document(pdf_path, page_num, text, total_pages)
+            for page_num, text in pages
+        ]
+
         logger.info(f"✅ Load thành công: {len(documents)} trang")
         return documents
-    
+
     except Exception as e:
         logger.error(f"❌ Lỗi load PDF: {str(e)}")
         return []
 
-def load_all_pdfs() -> list:
-    """Load cả 2 file PDF"""
+def load_pdfs_parallel(pdf_paths: list, workers: int = None) -> list:
+    """
+    Load nhiều PDF song song trên process pool.
+    Mỗi file được chia thành các shard PDF_PAGES_PER_SHARD trang; shard của mọi file
+    chạy chung một pool. Kết quả được ghép theo thứ tự submit nên thứ tự Document
+    (file → trang) và metadata giống hệt khi load tuần tự.
+    """
+    workers = _resolve_workers(workers)
+
+    # (pdf_path, total_pages, start, end)
+    shards = []
+    for pdf_path in pdf_paths:
+        try:
+            logger.info(f"📖 Đang load PDF: {pdf_path}")
+            total_pages = len(PdfReader(pdf_path).pages)
+            logger.info(f"   Tổng trang: {total_pages}")
+        except Exception as e:
+            logger.error(f"❌ Lỗi load PDF: {str(e)}")
+            continue
+
+        for start in range(0, total_pages, PDF_PAGES_PER_SHARD):
+            end = min(start + PDF_PAGES_PER_SHARD, total_pages)
+            shards.append((pdf_path, total_pages, start, end))
+
+    if not shards:
+        return []
+
+    workers = min(workers, len(shards))
+    logger.info(f"⚡ Trích xuất song song: {len(shards)} shard, {workers} workers")
+
+    documents = []
+    loaded_pages = {pdf_path: 0 for pdf_path in pdf_paths}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_extract_shard, pdf_path, start, end)
+            for pdf_path, _, start, end in shards
+        ]
+
+        for (pdf_path, total_pages, start, end), future in zip(shards, futures):
+            try:
+                pages, errors = future.result()
+            except Exception as e:
+                logger.warning(f"   ⚠️ Lỗi trang {start + 1}-{end} ({pdf_path}): {str(e)}")
+                continue
+
+            for page_num, message in errors:
+                logger.warning(f"   ⚠️ Lỗi trang {page_num + 1} ({pdf_path}): {message}")
+
+            documents.extend(
+                _make_document(pdf_path, page_num, text, total_pages)
+                for page_num, text in pages
+            )
+            loaded_pages[pdf_path] += len(pages)
+
+    for pdf_path, count in loaded_pages.items():
+        logger.info(f"✅ Load thành công: {count} trang ({pdf_path})")
+
+    return documents
+
+def iter_pdf_pages(pdf_paths: list, workers: int = None, cache: ExtractionCache = None, report: dict = None):
+    """
+    Generator trả về từng Document trang theo thứ tự file → trang, không giữ cả corpus trong bộ nhớ.
+    workers > 1: mọi file dùng chung một process pool - đếm trang song song, rồi trích xuất các shard
+    PDF_PAGES_PER_SHARD trang của mọi file, tối đa 2 * workers shard chạy trước.
+    cache: file có size + mtime không đổi lấy text từ cache thay vì parse lại; file trích xuất xong
+    (không có shard lỗi) được ghi vào cache ngay.
+    report: dict pdf_path → FileReport, được điền trong lúc chạy (xem log_extract_report)
+    """
+    workers = _resolve_workers(workers)
+    report = {} if report is None else report
+
+    signatures = {}
+    cached = {}
+    for pdf_path in pdf_paths:
+        file_report = report[pdf_path] = FileReport(pdf_path)
+        try:
+            signatures[pdf_path] = ExtractionCache.signature(pdf_path)
+        except OSError as e:
+            file_report.fail(str(e))
+            logger.error(f"❌ Lỗi load PDF: {str(e)}")
+            continue
+        file_report.size = signatures[pdf_path][0]
+        entry = cache.get(pdf_path, signatures[pdf_path]) if cache is not None else None
+        if entry is not None:
+            cached[pdf_path] = entry
+
+    pending = [pdf_path for pdf_path in signatures if pdf_path not in cached]
+    if cached:
+        logger.info(f"♻️  {len(cached)}/{len(pdf_paths)} file không đổi (size + mtime) → dùng text đã trích xuất")
+    if not pending:
+        executor = None
+    elif workers > 1:
+        logger.info(f"⚡ Trích xuất song song: {len(pending)} file, {workers} workers")
+        executor = ProcessPoolExecutor(max_workers=workers)
+    else:
+        executor = None
+
+    try:
+        # (pdf_path, total_pages, start, end) của mọi file cần trích xuất
+        shards = []
+        counts = _map_ordered(executor, _count_pages, [(pdf_path,) for pdf_path in pending], 4 * workers)
+        for pdf_path, (result, error) in zip(pending, counts):
+            if error is not None:
+                report[pdf_path].fail(str(error))
+                logger.error(f"❌ Lỗi load PDF: {pdf_path}: {str(error)}")
+                continue
+            total_pages, seconds = result
+            report[pdf_path].total_pages = total_pages
+            report[pdf_path].seconds += seconds
+            shards.extend(
+                (pdf_path, total_pages, start, min(start + PDF_PAGES_PER_SHARD, total_pages))
+                for start in range(0, total_pages, PDF_PAGES_PER_SHARD)
+            )
+
+        results = zip(shards, _map_ordered(
+            executor, _extract_shard_timed, [(pdf_path, start, end) for pdf_path, _, start, end in shards], 2 * workers
+        ))
+        for pdf_path in pdf_paths:
+            file_report = report[pdf_path]
+            if pdf_path in cached:
+                total_pages, pages, page_errors = cached[pdf_path]
+                file_report.status = "cached"
+                file_report.total_pages = total_pages
+                file_report.pages = len(pages)
+                file_report.page_errors = page_errors
+                for page_num, text in pages:
+                    yield _make_document(pdf_path, page_num, text, total_pages)
+                continue
+            if file_report.status == "failed":
+                continue
+
+            file_report.status = "extracted"
+            extracted = []
+            for _ in range(0, file_report.total_pages, PDF_PAGES_PER_SHARD):
+                (_, total_pages, start, end), (result, error) = next(results)
+                if error is not None:
+                    file_report.status = "partial"
+                    file_report.error = f"Trang {start + 1}-{end}: {str(error)}"
+                    logger.warning(f"   ⚠️ Lỗi trang {start + 1}-{end} ({pdf_path}): {str(error)}")
+                    continue
+
+                pages, errors, seconds = result
+                file_report.seconds += seconds
+                file_report.page_errors += len(errors)
+                for page_num, message in errors:
+                    logger.warning(f"   ⚠️ Lỗi trang {page_num + 1} ({pdf_path}): {message}")
+                for page_num, text in pages:
+                    extracted.append((page_num, text))
+                    yield _make_document(pdf_path, page_num, text, total_pages)
+
+            file_report.pages = len(extracted)
+            # Shard lỗi (vd. worker chết) có thể không lặp lại → không cache để lần sau thử lại
+            if cache is not None and file_report.status == "extracted":
+                cache.put(pdf_path, signatures[pdf_path], file_report.total_pages, extracted, file_report.page_errors)
+            logger.info(f"✅ Load thành công: {file_report.pages} trang ({pdf_path}, {file_report.seconds:.1f}s)")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)  # Dừng sớm → hủy shard chưa chạy
+
+def _map_ordered(executor, fn, args_list: list, lookahead: int):
+    """
+    (kết quả, lỗi) của fn(*args) cho từng args theo thứ tự, tối đa lookahead việc chờ trên executor.
+    executor None → chạy tuần tự trong process hiện tại
+    """
+    if executor is None:
+        for args in args_list:
+            try:
+                yield fn(*args), None
+            except Exception as e:
+                yield None, e
+        return
+
+    pending = deque()
+    for args in args_list:
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= lookahead:
+            yield _outcome(pending.popleft())
+    while pending:
+        yield _outcome(pending.popleft())
+
+def _outcome(future) -> tuple:
+    try:
+        return future.result(), None
+    except Exception as e:
+        return None, e
+
+def incomplete_sources(report: dict) -> set:
+    """Source của các file trích xuất lỗi hoặc thiếu shard (report: pdf_path → FileReport)"""
+    return {
+        pdf_source_name(pdf_path)
+        for pdf_path, file_report in report.items()
+        if file_report.status in ("failed", "partial")
+    }
+
+def log_extract_report(report: dict, path: str = INGEST_REPORT_PATH):
+    """Log tổng kết trích xuất (throughput, file chậm nhất, file lỗi) và ghi báo cáo từng file ra JSON"""
+    files = list(report.values())
+    if not files:
+        return
+    counts = Counter(file_report.status for file_report in files)
+    extracted = [file_report for file_report in files if file_report.status in ("extracted", "partial")]
+
+    logger.info(f"\n📄 TRÍCH XUẤT {len(files)} FILE: {counts['extracted']} mới, {counts['cached']} từ cache, "
+                f"{counts['partial']} thiếu trang, {counts['failed']} lỗi")
+    seconds = sum(file_report.seconds for file_report in extracted)
+    if seconds:
+        pages = sum(file_report.total_pages for file_report in extracted)
+        logger.info(f"  • {pages} trang trong {seconds:.1f}s worker ({pages / seconds:.1f} trang/s)")
+        logger.info("  • Chậm nhất:")
+        for file_report in sorted(extracted, key=lambda file_report: -file_report.seconds)[:SLOWEST_FILES]:
+            logger.info(
+                f"      {pdf_source_name(file_report.path):<40} {file_report.total_pages:>6} trang "
+                f"{file_report.seconds:>7.1f}s {file_report.throughput:>8.1f} trang/s"
+            )
+    for file_report in files:
+        if file_report.error is not None:
+            logger.warning(f"  ⚠️ {file_report.path}: {file_report.error}")
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"files": [file_report.to_dict() for file_report in files]}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    logger.info(f"  • Báo cáo từng file: {path}")
+
+def load_pdfs(pdf_paths: list, workers: int = None) -> list:
+    """Load danh sách PDF theo thứ tự, song song nếu workers > 1"""
+    if _resolve_workers(workers) > 1:
+        return load_pdfs_parallel(pdf_paths, workers)
+
+    documents = []
+    for pdf_path in pdf_paths:
+        documents.extend(load_pdf_as_text(pdf_path))
+    return documents
+
+def load_all_pdfs(workers: int = None) -> list:
+    """
+    Load mọi file PDF của corpus (pdf_files())
+    workers: số process trích xuất (mặc định PDF_EXTRACT_WORKERS, 1 = tuần tự)
+    """
     logger.info("=" * 60)
     logger.info("🚀 ĐANG LOAD DỮ LIỆU TỪ PDF")
     logger.info("=" * 60)
-    
-    all_docs = []
-    
-    # Load file 1
-    docs_1 = load_pdf_as_text(PDF_FILE_1)
-    all_docs.extend(docs_1)
-    
-    # Load file 2
-    docs_2 = load_pdf_as_text(PDF_FILE_2)
-    all_docs.extend(docs_2)
-    
+
+    all_docs = load_pdfs(pdf_files(), workers)
+
     logger.info(f"\n📊 Tổng cộng: {len(all_docs)} trang text")
     logger.info("=" * 60 + "\n")
-    
+
     return all_docs
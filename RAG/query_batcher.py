@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from config import QUERY_BATCH_MAX_WAIT_MS, QUERY_BATCH_MAX_SIZE
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+class QueryBatcher:
+    """
+    Micro-batching query embedding cho các request đồng thời: mỗi thread gửi query vào hàng đợi
+    rồi chờ kết quả; một thread nền gom các query đến trong max_wait_ms (tối đa max_batch query),
+    encode trong một lần gọi EmbeddingService.encode_queries rồi trả vector về cho từng thread.
+    Chỉ có một thread đang chờ (CLI, server lúc vắng) → encode ngay, không chờ max_wait_ms.
+    Trong lúc model đang encode một batch, query mới tiếp tục dồn vào hàng đợi cho batch sau.
+    """
+
+    def __init__(self, embedding_service, metrics=None,
+                 max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS, max_batch: int = QUERY_BATCH_MAX_SIZE):
+        self.embedding_service = embedding_service
+        self.metrics = metrics  # QueryMetrics: histogram kích thước batch
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.queries = 0
+        self.largest = 0
+        self._callers = 0  # Số thread đang ở trong encode_queries
+        self._thread = threading.Thread(target=self._run, name="query-batcher", daemon=True)
+        self._thread.start()
+
+    def encode_queries(self, queries: list) -> np.ndarray:
+        """Như EmbeddingService.encode_queries, nhưng query được gom chung batch với các thread khác"""
+        if not queries:
+            return self.embedding_service.encode_queries([])
+
+        with self._lock:
+            self._callers += 1
+        try:
+            futures = []
+            for query in queries:
+                future = Future()
+                self._queue.put((query, future))
+                futures.append(future)
+            return np.stack([future.result() for future in futures])
+        finally:
+            with self._lock:
+                self._callers -= 1
+
+    def _collect(self, first) -> list:
+        """
+        Batch bắt đầu từ first: thêm query tới khi đủ max_batch hoặc hết max_wait.
+        Không có thread nào khác đang chờ kết quả → chỉ lấy query đã có sẵn, không chờ thêm
+        """
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                # Query đã chờ sẵn trong hàng đợi được lấy ngay, không tính vào cửa sổ chờ
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    alone = self._callers <= 1
+                if alone:
+                    break
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = self._collect(item)
+
+            try:
+                vectors = self.embedding_service.encode_queries([query for query, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+            with self._lock:
+                self.batches += 1
+                self.queries += len(batch)
+                self.largest = max(self.largest, len(batch))
+            if self.metrics is not None:
+                self.metrics.observe_batch(len(batch))
+
+    def close(self):
+        """Dừng thread nền sau khi encode xong các query đang chờ"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "queries": self.queries,
+                "mean_batch_size": round(self.queries / self.batches, 3) if self.batches else 0.0,
+                "max_batch_size": self.largest
+            }
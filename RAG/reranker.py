@@ -0,0 +1,116 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from sentence_transformers import CrossEncoder
+from answer_cache import normalize_question
+from config import (
+    RERANK_MODEL,
+    RERANK_TOP_K,
+    RERANK_BATCH_SIZE,
+    RERANK_MAX_LENGTH,
+    RERANK_CACHE_SIZE
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """
+    Rerank ứng viên retrieval bằng cross-encoder chạy local: chấm điểm các cặp (câu hỏi, chunk)
+    trong một lần gọi model rồi giữ lại RERANK_TOP_K chunk tốt nhất.
+    Điểm từng cặp được cache LRU trong bộ nhớ (key = câu hỏi đã chuẩn hóa + nội dung chunk)
+    nên câu hỏi lặp lại / chunk trùng giữa các câu hỏi không đi qua model lần nữa. Thread-safe.
+    """
+
+    def __init__(self, model_name: str = RERANK_MODEL, cache_size: int = RERANK_CACHE_SIZE):
+        logger.info("🎯 KHỞI TẠO RERANKER")
+        logger.info(f"   Model: {model_name}")
+
+        try:
+            self.model = CrossEncoder(model_name, max_length=RERANK_MAX_LENGTH)
+            logger.info("✅ Load model thành công\n")
+        except Exception as e:
+            logger.error(f"❌ Lỗi load reranker: {str(e)}")
+            raise
+
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._scores = OrderedDict()  # key → score
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(query: str, content: str) -> bytes:
+        return hashlib.blake2b(f"{query}\0{content}".encode("utf-8"), digest_size=16).digest()
+
+    def score(self, pairs: list) -> np.ndarray:
+        """Điểm cross-encoder cho các cặp (câu hỏi, nội dung chunk); chỉ các cặp chưa cache đi qua model"""
+        keys = [self._key(normalize_question(query), content) for query, content in pairs]
+        scores = np.zeros(len(pairs), dtype=np.float32)
+
+        missing = {}  # key → vị trí trong pairs (cặp trùng chỉ chấm một lần)
+        found = set()
+        with self._lock:
+            for i, key in enumerate(keys):
+                cached = self._scores.get(key)
+                if cached is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    self._scores.move_to_end(key)
+                    scores[i] = cached
+                    found.add(key)
+            # Hit / miss tính theo cặp khác nhau (cặp trùng trong cùng lần gọi đếm một lần)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            miss_keys = list(missing)
+            predicted = self.model.predict(
+                [pairs[missing[key][0]] for key in miss_keys],
+                batch_size=RERANK_BATCH_SIZE,
+                show_progress_bar=False,
+                convert_to_numpy=True
+            )
+            with self._lock:
+                for key, value in zip(miss_keys, predicted.tolist()):
+                    scores[missing[key]] = value
+                    self._scores[key] = value
+                while len(self._scores) > self.cache_size:
+                    self._scores.popitem(last=False)
+
+        return scores
+
+    def rerank(self, query: str, docs: list, top_k: int = RERANK_TOP_K) -> list:
+        """Sắp xếp lại kết quả search theo điểm cross-encoder, giữ top_k (thêm "rerank_score")"""
+        return self.rerank_batch([query], [docs], top_k)[0]
+
+    def rerank_batch(self, queries: list, batch_docs: list, top_k: int = RERANK_TOP_K) -> list:
+        """Rerank kết quả của nhiều câu hỏi, mọi cặp được chấm trong một lần gọi model"""
+        scores = self.score([
+            (query, doc["content"])
+            for query, docs in zip(queries, batch_docs)
+            for doc in docs
+        ])
+
+        results = []
+        start = 0
+        for docs in batch_docs:
+            doc_scores = scores[start:start + len(docs)]
+            start += len(docs)
+            order = np.argsort(-doc_scores, kind="stable")[:top_k]
+            results.append([
+                {**docs[i], "rank": rank, "rerank_score": round(float(doc_scores[i]), 4)}
+                for rank, i in enumerate(order.tolist(), 1)
+            ])
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._scores)
+            }
@@ -0,0 +1,65 @@
+SCALAR_TYPES = (str, int, float, bool)
+
+class SearchFilter:
+    """
+    Điều kiện lọc chunk theo metadata, áp dụng ngay trong lúc search (FAISS IDSelector + bitmap
+    cho BM25) nên top-k luôn đủ k kết quả thỏa điều kiện thay vì lọc sau khi đã lấy top-k:
+      - sources: tên file PDF (một tên hoặc list), vd. "vietnam_tourism_data.pdf"
+      - pages: (trang đầu, trang cuối), tính cả hai đầu; chunk nằm vắt qua khoảng này cũng được chọn
+      - where: {key metadata: giá trị hoặc list giá trị} khớp chính xác
+    Giá trị sai kiểu → ValueError nêu tên trường (server trả 400)
+    """
+
+    def __init__(self, sources=None, pages=None, where: dict = None):
+        if isinstance(sources, str):
+            sources = [sources]
+        if sources is not None and (
+            not isinstance(sources, (list, tuple, set)) or not all(isinstance(source, str) for source in sources)
+        ):
+            raise ValueError("sources: cần tên file hoặc list tên file")
+        self.sources = tuple(sorted(sources)) if sources else None
+
+        if pages is not None:
+            try:
+                if isinstance(pages, str):
+                    raise ValueError(pages)
+                first, last = pages
+                pages = (int(first), int(last))
+            except (TypeError, ValueError):
+                raise ValueError("pages: cần [trang đầu, trang cuối] là số nguyên") from None
+        self.pages = pages
+
+        if where is not None and not isinstance(where, dict):
+            raise ValueError("where: cần object {key metadata: giá trị}")
+        where = {
+            key: tuple(value) if isinstance(value, (list, tuple, set)) else (value,)
+            for key, value in (where or {}).items()
+        }
+        for key, values in where.items():
+            if not all(isinstance(value, SCALAR_TYPES) for value in values):
+                raise ValueError(f"where.{key}: cần chuỗi / số / boolean hoặc list các giá trị đó")
+        self.where = tuple(sorted(where.items()))
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        """SearchFilter từ body request {"sources", "pages", "where"}, None nếu không có điều kiện nào (ValueError nếu sai kiểu)"""
+        search_filter = cls(data.get("sources"), data.get("pages"), data.get("where"))
+        return search_filter if search_filter else None
+
+    @property
+    def key(self) -> tuple:
+        """Khóa hashable (cache bitmap theo điều kiện)"""
+        return self.sources, self.pages, self.where
+
+    def __bool__(self) -> bool:
+        return bool(self.sources or self.pages or self.where)
+
+    def __repr__(self) -> str:
+        parts = []
+        if self.sources:
+            parts.append(f"sources={list(self.sources)}")
+        if self.pages:
+            parts.append(f"pages={self.pages[0]}-{self.pages[1]}")
+        for key, values in self.where:
+            parts.append(f"{key}={list(values)}")
+        return f"SearchFilter({', '.join(parts)})"
@@ -1,52 +1,420 @@
+import re
+from bisect import bisect_right
+from collections import deque
+import numpy as np
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+from config import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHUNK_ACROSS_PAGES,
+    SEMANTIC_CHUNKING,
+    SEMANTIC_BREAKPOINT_PERCENTILE,
+    SEMANTIC_BREAKPOINT_WINDOW,
+    SEMANTIC_MIN_CHUNK_SIZE
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
-def semantic_chunk(documents: list) -> list:
-    """
-    Tách documents thành chunks theo ngữ nghĩa (semantic).
-    Sử dụng RecursiveCharacterTextSplitter với separators phù hợp cho Tiếng Việt.
-    """
-    logger.info("🔪 BẮT ĐẦU SEMANTIC CHUNKING")
-    logger.info(f"   Chunk size: {CHUNK_SIZE} ký tự")
-    logger.info(f"   Chunk overlap: {CHUNK_OVERLAP} ký tự ({int(CHUNK_OVERLAP/CHUNK_SIZE*100)}%)")
-    
-    # Separators theo thứ tự ưu tiên (semantic coherence)
-    separators = [
-        "\n\n",      # Ngắt đoạn văn (mạnh nhất)
-        "\n",        # Ngắt dòng
-        "。",        # Dấu chấm Trung Quốc (nếu có)
-        "！",        # Dấu chấm than
-        "？",        # Dấu chấm hỏi
-        ".",         # Dấu chấm English
-        " ",         # Khoảng trắng
-        ""           # Fallback: chia từ
-    ]
-    
-    text_splitter = RecursiveCharacterTextSplitter(
+# Separators theo thứ tự ưu tiên (semantic coherence)
+SEPARATORS = [
+    "\n\n",      # Ngắt đoạn văn (mạnh nhất)
+    "\n",        # Ngắt dòng
+    "。",        # Dấu chấm Trung Quốc (nếu có)
+    "！",        # Dấu chấm than
+    "？",        # Dấu chấm hỏi
+    ".",         # Dấu chấm English
+    " ",         # Khoảng trắng
+    ""           # Fallback: chia từ
+]
+
+# Dấu câu ở lại cuối chunk trước (khoảng trắng thì bị bỏ khi strip)
+TRAILING_SEPARATORS = {"。", "！", "？", "."}
+
+PAGE_JOINER = "\n"  # Nối trang liên tiếp của cùng file khi chunk qua ranh giới trang
+WHITESPACE = re.compile(r'\s+')
+
+# Ranh giới câu: khoảng trắng sau dấu kết câu, hoặc dòng trống (xuống dòng đơn trong PDF thường nằm giữa câu)
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?。！？])\s+|\n\s*\n\s*')
+
+def make_text_splitter() -> RecursiveCharacterTextSplitter:
+    """RecursiveCharacterTextSplitter với separators phù hợp cho Tiếng Việt"""
+    return RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
-        separators=separators,
+        separators=SEPARATORS,
         length_function=len
     )
-    
-    chunks = []
-    for i, doc in enumerate(documents):
+
+def iter_chunks(documents, text_splitter: RecursiveCharacterTextSplitter = None):
+    """
+    Chunking bằng LangChain, mỗi trang một lần gọi splitter (cách cũ).
+    Chỉ giữ lại làm mốc so sánh cho benchmark_chunking.py.
+    """
+    text_splitter = text_splitter or make_text_splitter()
+    for doc in documents:
         try:
-            split_docs = text_splitter.split_documents([doc])
-            chunks.extend(split_docs)
-            
-            if (i + 1) % 50 == 0:
-                logger.info(f"   Đã xử lý: {i + 1}/{len(documents)} trang")
-        
+            yield from text_splitter.split_documents([doc])
         except Exception as e:
             logger.warning(f"   ⚠️ Lỗi trang {doc.metadata.get('page')}: {str(e)}")
-            continue
-    
-    logger.info(f"✅ Tạo thành công: {len(chunks)} chunks")
+
+class StreamingChunker:
+    """
+    Chunker native, một lượt trên từng file: các trang của cùng source được nối thành một luồng text
+    (across_pages=True) nên đoạn văn kéo dài qua hai trang không bị cắt đôi.
+
+    Mỗi chunk dài tối đa chunk_size ký tự, cắt tại separator ưu tiên cao nhất có trong cửa sổ
+    (giống thứ tự của make_text_splitter), chunk sau bắt đầu lại ~chunk_overlap ký tự trước điểm cắt
+    (tại ranh giới từ). Điểm cắt chỉ phụ thuộc cửa sổ hiện tại nên chunk được tạo ngay khi đủ text,
+    không cần giữ cả file trong bộ nhớ.
+
+    Metadata của chunk = metadata trang chứa ký tự đầu tiên, thêm:
+      - page_end: trang chứa ký tự cuối
+      - char_start / char_end: vị trí [start, end) trong text của cả file (các trang nối bằng PAGE_JOINER)
+
+        chunker = StreamingChunker()
+        for doc in pages:
+            chunks = chunker.feed(doc)
+        chunks = chunker.flush()
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 separators: list = SEPARATORS, across_pages: bool = CHUNK_ACROSS_PAGES):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = separators
+        self.across_pages = across_pages
+        # Separator có thể vắt qua mép cửa sổ → cần thêm vài ký tự phía sau mới quyết định được điểm cắt
+        self._lookahead = max(len(separator) for separator in separators)
+        self._reset(None)
+
+    def _reset(self, source):
+        self._source = source
+        self._text = ""         # Text chưa chunk xong, bắt đầu tại vị trí _base của file
+        self._base = 0
+        self._length = 0        # Tổng độ dài text của file đã nhận
+        self._emitted_end = 0   # Vị trí cuối của chunk gần nhất (theo file)
+        self._carry = 0         # Độ dài phần overlap lặp lại ở đầu _text
+        self._page_starts = []  # Vị trí bắt đầu từng trang (theo file)
+        self._page_metadata = []
+
+    def feed(self, doc: Document) -> list:
+        """Nhận một trang (theo thứ tự file → trang), trả về các chunk đã hoàn chỉnh"""
+        chunks = []
+        source = doc.metadata.get("source")
+        if source != self._source or not self.across_pages:
+            chunks.extend(self.flush())
+            self._reset(source)
+
+        if self._length:
+            self._text += PAGE_JOINER
+            self._length += len(PAGE_JOINER)
+        self._page_starts.append(self._length)
+        self._page_metadata.append(doc.metadata)
+        self._text += doc.page_content
+        self._length += len(doc.page_content)
+
+        # Chỉ cắt khi cửa sổ đã đủ chunk_size: điểm cắt không đổi dù text phía sau còn tới
+        while len(self._text) >= self.chunk_size + self._lookahead:
+            chunks.extend(self._emit_next())
+        return chunks
+
+    def flush(self) -> list:
+        """Phần text còn lại của file hiện tại"""
+        chunks = []
+        while len(self._text) > self.chunk_size:
+            chunks.extend(self._emit_next())
+        if self._base + len(self._text.rstrip()) > self._emitted_end:
+            chunks.extend(self._emit(0, len(self._text)))
+        self._reset(None)
+        return chunks
+
+    def _emit_next(self) -> list:
+        cut, separator = self._cut_point()
+        chunks = self._emit(0, cut)
+
+        # Chunk sau lặp lại ~chunk_overlap ký tự cuối, bắt đầu tại ranh giới từ
+        # (cắt tại ranh giới đoạn văn thì không cần overlap)
+        start = cut
+        if separator != self.separators[0] and cut > self.chunk_overlap:
+            match = WHITESPACE.search(self._text, cut - self.chunk_overlap, cut)
+            if match and match.end() < cut:
+                start = match.end()
+        self._text = self._text[start:]
+        self._base += start
+        self._carry = cut - start
+        return chunks
+
+    def _cut_point(self) -> tuple:
+        """
+        (điểm cắt, separator) trong cửa sổ [0, chunk_size] theo separator ưu tiên cao nhất.
+        Điểm cắt phải nằm sau phần overlap mang sang, nếu không chunk chỉ lặp lại text cũ
+        """
+        lo = self._carry + 1
+        for separator in self.separators:
+            if not separator:
+                break
+            if separator in TRAILING_SEPARATORS:
+                pos = self._text.rfind(separator, lo, self.chunk_size)
+                if pos != -1:
+                    return pos + len(separator), separator
+            else:
+                # Separator bị bỏ khi strip nên được phép bắt đầu ngay tại mép cửa sổ
+                pos = self._text.rfind(separator, lo, self.chunk_size + len(separator))
+                if pos != -1:
+                    return pos, separator
+        return self.chunk_size, ""
+
+    def _emit(self, start: int, end: int) -> list:
+        piece = self._text[start:end]
+        content = piece.strip()
+        if not content:
+            return []
+
+        char_start = self._base + start + (len(piece) - len(piece.lstrip()))
+        char_end = char_start + len(content)
+        self._emitted_end = max(self._emitted_end, char_end)
+
+        first = bisect_right(self._page_starts, char_start) - 1
+        last = bisect_right(self._page_starts, char_end - 1) - 1
+        metadata = dict(self._page_metadata[first])
+        metadata["page_end"] = self._page_metadata[last].get("page")
+        metadata["char_start"] = char_start
+        metadata["char_end"] = char_end
+
+        # Trang đã nằm hoàn toàn trước text còn lại thì không cần giữ metadata nữa
+        if first > 0:
+            del self._page_starts[:first]
+            del self._page_metadata[:first]
+        return [Document(page_content=content, metadata=metadata)]
+
+def iter_native_chunks(documents, chunker: StreamingChunker = None):
+    """Generator: chunks từ luồng Document trang (file → trang), dùng StreamingChunker"""
+    chunker = chunker or StreamingChunker()
+    for doc in documents:
+        yield from chunker.feed(doc)
+    yield from chunker.flush()
+
+def semantic_chunk(documents: list) -> list:
+    """
+    Tách documents thành chunks theo ngữ nghĩa (semantic).
+    Dùng StreamingChunker với separators phù hợp cho Tiếng Việt.
+    """
+    logger.info("🔪 BẮT ĐẦU SEMANTIC CHUNKING")
+    logger.info(f"   Chunk size: {CHUNK_SIZE} ký tự")
+    logger.info(f"   Chunk overlap: {CHUNK_OVERLAP} ký tự ({int(CHUNK_OVERLAP/CHUNK_SIZE*100)}%)")
+
+    chunks = list(iter_native_chunks(documents))
+
+    logger.info(f"✅ Tạo thành công: {len(chunks)} chunks từ {len(documents)} trang")
     logger.info("=" * 60 + "\n")
-    
+
     return chunks
+
+# ==================== SEMANTIC CHUNKING ====================
+class Sentence:
+    """Một câu trong luồng text của file: vị trí [char_start, char_end), metadata trang chứa ký tự đầu"""
+    __slots__ = ("text", "glue", "segment", "char_start", "char_end", "metadata", "page_end")
+
+    def __init__(self, text, glue, segment, char_start, char_end, metadata, page_end):
+        self.text = text
+        self.glue = glue          # Khoảng trắng nối với câu trước khi ghép chunk
+        self.segment = segment    # Câu khác segment (khác file / khác trang khi không chunk qua trang) không ghép chung
+        self.char_start = char_start
+        self.char_end = char_end
+        self.metadata = metadata
+        self.page_end = page_end
+
+class SentenceSplitter:
+    """
+    Tách luồng trang (file → trang) thành câu theo SENTENCE_BOUNDARY, một lượt, giống StreamingChunker:
+    phần cuối trang chưa kết câu được giữ lại và nối với trang sau (across_pages=True).
+    Câu dài hơn max_chars (bảng, danh sách không dấu câu) bị cắt tại khoảng trắng.
+    """
+
+    def __init__(self, max_chars: int = CHUNK_SIZE, across_pages: bool = CHUNK_ACROSS_PAGES):
+        self.max_chars = max_chars
+        self.across_pages = across_pages
+        self._segment = 0
+        self._reset(None)
+
+    def _reset(self, source):
+        self._source = source
+        self._segment += 1
+        self._text = ""         # Phần chưa kết câu, bắt đầu tại vị trí _base của file
+        self._base = 0
+        self._length = 0
+        self._glue = ""
+        self._page_starts = []
+        self._page_metadata = []
+
+    def feed(self, doc: Document) -> list:
+        """Nhận một trang, trả về các câu đã kết thúc"""
+        sentences = []
+        source = doc.metadata.get("source")
+        if source != self._source or not self.across_pages:
+            sentences.extend(self.flush())
+            self._reset(source)
+
+        if self._length:
+            self._text += PAGE_JOINER
+            self._length += len(PAGE_JOINER)
+        self._page_starts.append(self._length)
+        self._page_metadata.append(doc.metadata)
+        self._text += doc.page_content
+        self._length += len(doc.page_content)
+
+        pos = 0
+        for match in SENTENCE_BOUNDARY.finditer(self._text):
+            sentences.extend(self._emit(pos, match.start()))
+            self._glue = "\n\n" if "\n" in match.group() else " "
+            pos = match.end()
+        # Phần chưa kết câu quá dài thì cắt bớt, không giữ text vô hạn
+        while len(self._text) - pos > self.max_chars:
+            cut = self._long_cut(pos)
+            sentences.extend(self._emit(pos, cut))
+            pos = cut
+        self._text = self._text[pos:]
+        self._base += pos
+        return sentences
+
+    def flush(self) -> list:
+        sentences = self._emit(0, len(self._text))
+        self._reset(None)
+        return sentences
+
+    def _long_cut(self, pos: int) -> int:
+        cut = self._text.rfind(" ", pos + 1, pos + self.max_chars + 1)
+        return cut if cut != -1 else pos + self.max_chars
+
+    def _emit(self, start: int, end: int) -> list:
+        sentences = []
+        while start < end:
+            stop = end if end - start <= self.max_chars else self._long_cut(start)
+            piece = self._text[start:stop]
+            text = piece.strip()
+            if text:
+                char_start = self._base + start + (len(piece) - len(piece.lstrip()))
+                char_end = char_start + len(text)
+                first = bisect_right(self._page_starts, char_start) - 1
+                last = bisect_right(self._page_starts, char_end - 1) - 1
+                sentences.append(Sentence(
+                    text, self._glue, self._segment, char_start, char_end,
+                    self._page_metadata[first], self._page_metadata[last].get("page")
+                ))
+                self._glue = " "
+            start = stop
+        return sentences
+
+class SemanticChunker:
+    """
+    Semantic chunking bằng embedding câu:
+      - mọi câu của một batch được embed trong một lần gọi EmbeddingService.encode_passages (có cache)
+      - điểm cắt = chỗ khoảng cách cosine giữa hai câu liền nhau vượt percentile SEMANTIC_BREAKPOINT_PERCENTILE
+        của window khoảng cách gần nhất trong cùng segment, tính cả khoảng cách đó (chủ đề đổi),
+        chỉ khi chunk đã dài ít nhất min_chars. Window không phụ thuộc cách chia batch nên cùng một
+        file luôn cho cùng các chunk (pipeline hay incremental, SEMANTIC_SENTENCE_BATCH bao nhiêu cũng vậy)
+      - chunk không vượt max_chars ký tự, không ghép câu khác file
+      - embedding chunk = trung bình embedding các câu (trọng số độ dài câu) rồi normalize,
+        không encode lại text chunk
+    Chunk cuối của batch chưa đóng được giữ lại và nối tiếp với batch sau (final=True để đóng).
+    """
+
+    def __init__(self, embedding_service, percentile: float = SEMANTIC_BREAKPOINT_PERCENTILE,
+                 min_chars: int = SEMANTIC_MIN_CHUNK_SIZE, max_chars: int = CHUNK_SIZE,
+                 window: int = SEMANTIC_BREAKPOINT_WINDOW):
+        self.embedding_service = embedding_service
+        self.percentile = percentile
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._open = []  # Câu của chunk đang mở
+        self._open_embeddings = None
+        self._open_thresholds = []  # Ngưỡng cắt giữa các câu của chunk đang mở
+        self._window = deque(maxlen=window)  # Khoảng cách gần nhất của segment hiện tại
+
+    def group(self, sentences: list, final: bool = False) -> tuple:
+        """Ghép câu thành chunks → (chunks, embeddings (n_chunks, dim))"""
+        items = self._open + list(sentences)
+        if not items:
+            return [], None
+
+        embeddings = self.embedding_service.encode_passages([s.text for s in sentences], verbose=False) if sentences else None
+        if self._open_embeddings is not None:
+            embeddings = self._open_embeddings if embeddings is None else np.vstack([self._open_embeddings, embeddings])
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        # Khoảng cách cosine giữa câu i - 1 và câu i (vectors đã normalize)
+        distances = 1.0 - np.einsum('ij,ij->i', embeddings[:-1], embeddings[1:])
+        same = np.array([items[i].segment == items[i - 1].segment for i in range(1, len(items))], dtype=bool)
+        thresholds = self._open_thresholds + [
+            self._threshold(same[i - 1], distances[i - 1]) for i in range(max(len(self._open), 1), len(items))
+        ]
+
+        groups = []
+        current = [0]
+        length = len(items[0].text)
+        for i in range(1, len(items)):
+            new_length = length + len(items[i].glue) + len(items[i].text)
+            if (not same[i - 1] or new_length > self.max_chars
+                    or (distances[i - 1] > thresholds[i - 1] and length >= self.min_chars)):
+                groups.append(current)
+                current = [i]
+                length = len(items[i].text)
+            else:
+                current.append(i)
+                length = new_length
+
+        if final:
+            groups.append(current)
+            self._open, self._open_embeddings, self._open_thresholds = [], None, []
+            self._window.clear()
+        else:
+            self._open = [items[i] for i in current]
+            self._open_embeddings = embeddings[current]
+            self._open_thresholds = thresholds[current[0]:current[-1]]
+
+        chunks = [self._make_chunk([items[i] for i in group]) for group in groups]
+        pooled = np.zeros((len(groups), embeddings.shape[1]), dtype=np.float32)
+        for row, group in enumerate(groups):
+            weights = np.array([len(items[i].text) for i in group], dtype=np.float32)
+            vector = weights @ embeddings[group]
+            pooled[row] = vector / (np.linalg.norm(vector) or 1.0)
+        return chunks, pooled
+
+    def _threshold(self, same_segment: bool, distance: float) -> float:
+        """Ngưỡng cắt tại một ranh giới câu: percentile của window sau khi thêm distance (sang segment mới → inf)"""
+        if not same_segment:
+            self._window.clear()
+            return np.inf
+        self._window.append(distance)
+        return np.percentile(self._window, self.percentile)
+
+    @staticmethod
+    def _make_chunk(sentences: list) -> Document:
+        content = sentences[0].text + "".join(s.glue + s.text for s in sentences[1:])
+        metadata = dict(sentences[0].metadata)
+        metadata["page_end"] = sentences[-1].page_end
+        metadata["char_start"] = sentences[0].char_start
+        metadata["char_end"] = sentences[-1].char_end
+        return Document(page_content=content, metadata=metadata)
+
+def chunk_and_embed(documents: list, embedding_service, semantic: bool = SEMANTIC_CHUNKING) -> tuple:
+    """
+    Chunk + embedding danh sách trang → (chunks, embeddings)
+    semantic=True: SemanticChunker (embedding chunk gộp từ embedding câu), False: semantic_chunk + encode_passages
+    """
+    if not semantic:
+        chunks = semantic_chunk(documents)
+        embeddings = embedding_service.encode_passages([chunk.page_content for chunk in chunks]) if chunks else None
+        return chunks, embeddings
+
+    logger.info("🔪 BẮT ĐẦU SEMANTIC CHUNKING (EMBEDDING CÂU)")
+    splitter = SentenceSplitter()
+    sentences = [sentence for doc in documents for sentence in splitter.feed(doc)]
+    sentences.extend(splitter.flush())
+    logger.info(f"   Câu: {len(sentences)}")
+
+    chunks, embeddings = SemanticChunker(embedding_service).group(sentences, final=True)
+    logger.info(f"✅ Tạo thành công: {len(chunks)} chunks từ {len(documents)} trang")
+    return chunks, embeddings
@@ -0,0 +1,287 @@
+"""
+RAG SERVER - HTTP API bất đồng bộ cho chatbot
+POST /query  {"question": "..."}  → câu trả lời + nguồn tham khảo
+POST /query/stream                → Server-Sent Events: từng đoạn câu trả lời, cuối cùng là kết quả đầy đủ
+GET  /health                      → trạng thái hệ thống, số request đang xử lý/chờ
+GET  /metrics                     → latency từng stage (histogram + p50/p95/p99) dạng text Prometheus
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web
+from config import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_WORKER_THREADS,
+    SERVER_MAX_CONCURRENT,
+    SERVER_MAX_QUEUE,
+    SERVER_REQUEST_TIMEOUT,
+    METRICS_PATH,
+    METRICS_DUMP_INTERVAL,
+    INDEX_HOT_SWAP
+)
+from startup import StartupTimer, load_services
+from search_filter import SearchFilter
+
+# ==================== LOGGING ====================
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+json_dumps = functools.partial(json.dumps, ensure_ascii=False)
+
+class RequestLimiter:
+    """
+    Backpressure: tối đa max_concurrent request chạy cùng lúc, max_queue request chờ.
+    Khi đầy, request mới bị từ chối ngay (503) thay vì xếp hàng vô hạn.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_pending = max_concurrent + max_queue
+        self.pending = 0  # đang chạy + đang chờ
+        self.active = 0
+        self.rejected = 0
+
+    def full(self) -> bool:
+        return self.pending >= self.max_pending
+
+    async def __aenter__(self):
+        self.pending += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self.pending -= 1
+            raise
+        self.active += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.active -= 1
+        self.pending -= 1
+        self._semaphore.release()
+
+class ServerState:
+    def __init__(self):
+        self.rag = None
+        self.vector_store = None
+        self.error = None
+        self.loader = None
+        self.metrics_writer = None
+        self.watcher = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=SERVER_WORKER_THREADS,
+            thread_name_prefix="rag-worker"
+        )
+        self.limiter = RequestLimiter(SERVER_MAX_CONCURRENT, SERVER_MAX_QUEUE)
+
+STATE_KEY = web.AppKey("state", ServerState)
+
+def load_rag(state: ServerState):
+    """Load embedding model + FAISS index (song song) một lần cho mọi request"""
+    try:
+        timer = StartupTimer()
+        _, state.vector_store, state.rag = load_services(timer)
+        logger.info("\n✅ Server sẵn sàng!\n")
+        timer.report()
+        if INDEX_HOT_SWAP:
+            from index_watcher import IndexWatcher
+            state.watcher = IndexWatcher(state.vector_store, functools.partial(swap_index, state)).start()
+    except Exception as e:
+        state.error = str(e)
+        logger.error(f"❌ Lỗi khởi tạo: {str(e)}")
+
+def swap_index(state: ServerState, vector_store):
+    """Index version mới từ IndexWatcher: request mới dùng ngay, request đang chạy giữ index cũ"""
+    state.rag.swap_vector_store(vector_store)
+    state.vector_store = vector_store
+
+async def _parse_question(request: web.Request) -> tuple:
+    """
+    (câu hỏi, SearchFilter hoặc None, lỗi filter hoặc None) từ body
+    {"question", "sources", "pages": [đầu, cuối], "where": {...}}. Body không phải JSON object → câu hỏi rỗng
+    """
+    try:
+        body = await request.json()
+        question = str(body.get("question", "")).strip()
+    except Exception:
+        return "", None, None
+
+    try:
+        return question, SearchFilter.from_dict(body), None
+    except ValueError as e:
+        return question, None, str(e)
+
+def _reject(state: ServerState, question: str, filter_error: str = None):
+    """Response lỗi nếu request không thể xử lý (đang load / filter sai / thiếu câu hỏi / quá tải), ngược lại None"""
+    if state.rag is None:
+        return web.json_response({"status": "loading" if state.error is None else "error"}, status=503)
+
+    if filter_error is not None:
+        return web.json_response({"status": "error", "error": f"Filter không hợp lệ - {filter_error}"}, status=400,
+                                 dumps=json_dumps)
+
+    if not question:
+        return web.json_response({"status": "error", "error": "Thiếu 'question'"}, status=400)
+
+    limiter = state.limiter
+    if limiter.full():
+        limiter.rejected += 1
+        return web.json_response(
+            {"status": "error", "error": "Server quá tải, thử lại sau"},
+            status=503,
+            headers={"Retry-After": "1"}
+        )
+    return None
+
+async def handle_query(request: web.Request) -> web.Response:
+    state = request.app[STATE_KEY]
+    question, search_filter, filter_error = await _parse_question(request)
+    rejected = _reject(state, question, filter_error)
+    if rejected is not None:
+        return rejected
+
+    async with state.limiter:
+        try:
+            result = await asyncio.wait_for(
+                state.rag.aquery(question, state.executor, search_filter),
+                timeout=SERVER_REQUEST_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱️ Timeout: {question}")
+            return web.json_response({"status": "error", "error": "Timeout"}, status=504)
+
+    status = 500 if result["status"] == "error" else 200
+    return web.json_response(result, status=status, dumps=json_dumps)
+
+async def handle_query_stream(request: web.Request) -> web.StreamResponse:
+    """
+    Stream câu trả lời dạng Server-Sent Events, mỗi event là một dòng "data: {json}":
+    {"event": "token", "text": ...} lặp lại, cuối cùng {"event": "done", ...kết quả như /query}
+    """
+    state = request.app[STATE_KEY]
+    question, search_filter, filter_error = await _parse_question(request)
+    rejected = _reject(state, question, filter_error)
+    if rejected is not None:
+        return rejected
+
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream; charset=utf-8",
+        "Cache-Control": "no-cache"
+    })
+    await response.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SERVER_REQUEST_TIMEOUT
+    async with state.limiter:
+        events = state.rag.aquery_stream(question, state.executor, search_filter)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), timeout=max(deadline - loop.time(), 0))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    logger.warning(f"⏱️ Timeout: {question}")
+                    event = {"event": "done", "status": "error", "question": question, "error": "Timeout"}
+                    await response.write(f"data: {json_dumps(event)}\n\n".encode("utf-8"))
+                    break
+                await response.write(f"data: {json_dumps(event)}\n\n".encode("utf-8"))
+        except ConnectionResetError:
+            logger.info(f"🔌 Client ngắt kết nối: {question}")
+            return response
+        finally:
+            await events.aclose()
+
+    await response.write_eof()
+    return response
+
+async def handle_health(request: web.Request) -> web.Response:
+    state = request.app[STATE_KEY]
+    limiter = state.limiter
+
+    if state.rag is not None:
+        status = "ok"
+    elif state.error is not None:
+        status = "error"
+    else:
+        status = "loading"
+
+    return web.json_response({
+        "status": status,
+        "error": state.error,
+        "vectors": state.vector_store.ntotal if state.vector_store else 0,
+        "index_version": state.vector_store.paths.version if state.vector_store else None,
+        "active": limiter.active,
+        "queued": limiter.pending - limiter.active,
+        "rejected": limiter.rejected,
+        "answer_cache": state.rag.cache_stats() if state.rag is not None else {},
+        "rerank_cache": state.rag.rerank_stats() if state.rag is not None else {},
+        "query_batching": state.rag.batching_stats() if state.rag is not None else {}
+    }, status=200 if status == "ok" else 503, dumps=json_dumps)
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    state = request.app[STATE_KEY]
+    text = state.rag.metrics.to_prometheus() if state.rag is not None else ""
+    return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+async def write_metrics_periodically(state: ServerState):
+    """Ghi METRICS_PATH mỗi METRICS_DUMP_INTERVAL giây cho node_exporter textfile collector"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
+        if state.rag is None:
+            continue
+        try:
+            await loop.run_in_executor(state.executor, state.rag.metrics.write_prometheus, METRICS_PATH)
+        except OSError as e:
+            logger.warning(f"⚠️ Không ghi được metrics: {str(e)}")
+
+async def on_startup(app: web.Application):
+    # Load trên thread nền: /health trả về "loading" trong lúc chờ model + index
+    state = app[STATE_KEY]
+    state.loader = asyncio.get_running_loop().run_in_executor(state.executor, load_rag, state)
+    state.metrics_writer = asyncio.create_task(write_metrics_periodically(state))
+
+async def on_cleanup(app: web.Application):
+    state = app[STATE_KEY]
+    state.metrics_writer.cancel()
+    if state.watcher is not None:
+        state.watcher.stop()
+    state.executor.shutdown(wait=False)
+    if state.vector_store is not None:
+        state.vector_store.close()
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app[STATE_KEY] = ServerState()
+    app.router.add_post("/query", handle_query)
+    app.router.add_post("/query/stream", handle_query_stream)
+    app.router.add_get("/health", handle_health)
+    app.router.add_get("/metrics", handle_metrics)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+def main():
+    logger.info("\n" + "="*60)
+    logger.info("🌐 RAG SERVER - DU LỊCH VIỆT NAM")
+    logger.info("="*60)
+
+    from vector_store import FAISSVectorStore
+    if not FAISSVectorStore.exists():
+        logger.error("\n❌ FAISS vector store chưa được tạo!")
+        logger.info("\n💡 Hãy chạy lệnh sau trước:")
+        logger.info("   python train_rag.py")
+        sys.exit(1)
+
+    web.run_app(create_app(), host=SERVER_HOST, port=SERVER_PORT)
+
+if __name__ == "__main__":
+    main()
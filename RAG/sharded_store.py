@@ -0,0 +1,411 @@
+"""
+Retrieval chia shard cho corpus lớn hơn một index: train_rag.py chia chunks round-robin thành
+NUM_SHARDS shard (chunk id toàn cục g nằm ở shard g % N, vị trí g // N), mỗi shard là một
+FAISSVectorStore đầy đủ (FAISS + chunk store + BM25) trong cùng một version.
+Khi serve, mỗi shard được load trong một worker process riêng; ShardedVectorStore gửi query tới mọi
+shard cùng lúc (các shard search song song trên các core), gộp top-k theo score và đọc nội dung
+chunk qua mmap ngay trong process chính.
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+import numpy as np
+from chunk_store import ChunkStore
+from index_versions import (
+    IndexPaths,
+    current_paths,
+    discard,
+    new_version,
+    publish,
+    shard_count,
+    shard_paths,
+    write_shard_count
+)
+from vector_store import FAISSVectorStore, _versions, hybrid_hits, rrf_fuse
+from config import (
+    FAISS_INDEX_TYPE,
+    NUM_SHARDS,
+    SHARD_THREADS,
+    TOP_K,
+    HYBRID_CANDIDATES
+)
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHARD_BUILD_QUEUE = 2  # Số batch chờ mỗi shard khi build (giới hạn bộ nhớ nếu một shard chậm)
+STOP_TIMEOUT = 5  # giây chờ worker thoát trước khi terminate
+
+_DONE = object()
+
+class _Worker(NamedTuple):
+    process: object
+    conn: object
+    lock: object  # Giữ trong một cặp send / recv: mỗi pipe có một request đang chờ tại một thời điểm
+
+def load_vector_store(paths: IndexPaths = None):
+    """Store của version paths (mặc định CURRENT): ShardedVectorStore nếu version chia shard, ngược lại FAISSVectorStore"""
+    paths = paths or current_paths()
+    store = ShardedVectorStore() if shard_count(paths) else FAISSVectorStore()
+    store.load(paths)
+    return store
+
+def load_chunk_stores(paths: IndexPaths = None) -> list:
+    """
+    ChunkStore (mmap) của version paths (mặc định CURRENT), không load FAISS: một store,
+    hoặc mỗi shard một store (chunk id toàn cục g ở store g % N, vị trí g // N)
+    """
+    paths = paths or current_paths()
+    num_shards = shard_count(paths)
+    if not num_shards:
+        return [ChunkStore.load(paths.chunks)]
+    return [ChunkStore.load(shard_paths(paths, shard).chunks) for shard in range(num_shards)]
+
+class ShardedVectorStore:
+    """Cùng API search với FAISSVectorStore, index nằm trong các worker process (xem đầu module)"""
+
+    def __init__(self):
+        self.paths = None
+        self.num_shards = 0
+        self.embedding_dimension = None
+        self.ntotal = 0
+        self.has_lexical = False  # Mọi shard đều có BM25 index (ngược lại hybrid search → dense)
+        self.version = next(_versions)
+        self._chunks = []  # ChunkStore (mmap) của từng shard
+        self._workers = []
+        self._pool = None  # Thread gửi / nhận request với từng shard (các shard chạy song song)
+        self._request_ids = itertools.count(1)
+        self._broken = None  # Lỗi pipe làm mất đồng bộ với worker → store không dùng được nữa
+
+    # ==================== BUILD ====================
+    def build_streaming(self, batches, num_shards: int = NUM_SHARDS, index_type: str = FAISS_INDEX_TYPE):
+        """
+        Chia các batch (embeddings, records) round-robin cho num_shards shard, mỗi shard build
+        trên một thread (FAISSVectorStore.build_streaming vào thư mục shard), rồi publish cả version.
+        Shard nào lỗi → hủy toàn bộ version.
+        """
+        logger.info(f"🔨 TẠO FAISS INDEX ({num_shards} SHARD, STREAMING)")
+
+        paths = new_version()
+        stores = [FAISSVectorStore() for _ in range(num_shards)]
+        queues = [queue.Queue(maxsize=SHARD_BUILD_QUEUE) for _ in range(num_shards)]
+        with ThreadPoolExecutor(max_workers=num_shards, thread_name_prefix="shard-build") as pool:
+            builds = [
+                pool.submit(store.build_streaming, _queued_batches(batch_queue), index_type, shard_paths(paths, shard))
+                for shard, (store, batch_queue) in enumerate(zip(stores, queues))
+            ]
+            try:
+                offset = 0
+                for embeddings, records in batches:
+                    shard_of = (offset + np.arange(len(records))) % num_shards
+                    offset += len(records)
+                    for shard in range(num_shards):
+                        rows = np.flatnonzero(shard_of == shard)
+                        if len(rows):
+                            _put(queues[shard], builds[shard], (embeddings[rows], [records[i] for i in rows]))
+                for batch_queue, build in zip(queues, builds):
+                    _put(batch_queue, build, _DONE)
+                for build in builds:
+                    build.result()
+            except BaseException as e:
+                for batch_queue, build in zip(queues, builds):
+                    try:
+                        _put(batch_queue, build, e)
+                    except BaseException:
+                        pass
+                pool.shutdown(wait=True)
+                discard(paths)
+                logger.error(f"❌ Lỗi tạo index chia shard: {str(e)}")
+                raise
+
+        try:
+            write_shard_count(paths, num_shards)
+            publish(paths)
+        except BaseException:
+            discard(paths)
+            raise
+
+        self.paths = paths
+        self.num_shards = num_shards
+        self.embedding_dimension = stores[0].embedding_dimension
+        self.ntotal = sum(store.ntotal for store in stores)
+        self.version = next(_versions)
+
+        logger.info(f"✅ Index {num_shards} shard: {self.ntotal} vectors "
+                    f"({', '.join(str(store.ntotal) for store in stores)})\n")
+
+    # ==================== LOAD / ĐÓNG ====================
+    def load(self, paths: IndexPaths = None):
+        """Khởi động một worker process cho mỗi shard của version (mặc định CURRENT), các shard load song song"""
+        logger.info("📂 LOAD FAISS INDEX (SHARDED)")
+
+        paths = paths or current_paths()
+        num_shards = shard_count(paths)
+        if not num_shards:
+            raise ValueError(f"Version {paths.version} không chia shard")
+        threads = SHARD_THREADS or max(1, (os.cpu_count() or 1) // num_shards)
+
+        # spawn (mặc định trên Windows): worker không kế thừa thread / OpenMP đang chạy của process chính
+        context = multiprocessing.get_context("spawn")
+        workers = []
+        try:
+            for shard in range(num_shards):
+                conn, child_conn = context.Pipe()
+                process = context.Process(
+                    target=_serve_shard,
+                    args=(shard_paths(paths, shard), shard, num_shards, threads, child_conn),
+                    name=f"shard-{shard:02d}",
+                    daemon=True
+                )
+                process.start()
+                child_conn.close()
+                workers.append(_Worker(process, conn, threading.Lock()))
+
+            infos = []
+            for shard, worker in enumerate(workers):
+                try:
+                    ok, info = worker.conn.recv()
+                except EOFError:
+                    ok, info = False, "worker thoát khi đang load"
+                if not ok:
+                    raise RuntimeError(f"Shard {shard}: {info}")
+                infos.append(info)
+        except BaseException as e:
+            _stop(workers)
+            logger.error(f"❌ Lỗi load: {str(e)}")
+            raise
+
+        self._workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=4 * num_shards, thread_name_prefix="shard-call")
+        self._broken = None
+        self._chunks = load_chunk_stores(paths)
+        self.ntotal = sum(ntotal for ntotal, _, _ in infos)
+        self.embedding_dimension = infos[0][1]
+        self.has_lexical = all(has_lexical for _, _, has_lexical in infos)
+        self.num_shards = num_shards
+        self.paths = paths
+        self.version = next(_versions)
+
+        logger.info(f"   Version: {paths.version}")
+        logger.info(f"   Shards: {num_shards} process x {threads} thread FAISS")
+        logger.info(f"   Vectors: {self.ntotal} ({', '.join(str(ntotal) for ntotal, _, _ in infos)})")
+        logger.info("✅ Load thành công\n")
+
+    def close(self):
+        """Dừng các worker process (store không còn được dùng)"""
+        workers, self._workers = self._workers, []
+        pool, self._pool = self._pool, None
+        _stop(workers)
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    # ==================== SEARCH ====================
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        self._call("set_search_params", nprobe, ef_search)
+
+    def search(self, query_embedding: np.ndarray, k: int = TOP_K, search_filter=None) -> list:
+        return self.search_batch(query_embedding.reshape(1, -1), k, search_filter)[0]
+
+    def search_batch(self, query_matrix: np.ndarray, k: int = TOP_K, search_filter=None) -> list:
+        """Top-k dense của từng shard, gộp theo similarity (cùng dạng kết quả với FAISSVectorStore.search_batch)"""
+        try:
+            results = []
+            for dense, _, _ in self._candidates(None, query_matrix, k, search_filter):
+                hits = []
+                for rank, (idx, similarity) in enumerate(dense.items(), 1):
+                    record = self._chunk(idx)
+                    hits.append({
+                        "rank": rank,
+                        "id": idx,
+                        "content": record["content"],
+                        "metadata": record["metadata"],
+                        "similarity": round(similarity, 4),
+                        "distance": round(similarity, 4)
+                    })
+                results.append(hits)
+            return results
+
+        except Exception as e:
+            logger.error(f"❌ Lỗi search: {str(e)}")
+            raise
+
+    def search_hybrid(self, query_text: str, query_embedding: np.ndarray, k: int = TOP_K, search_filter=None) -> list:
+        return self.search_hybrid_batch([query_text], query_embedding.reshape(1, -1), k, search_filter)[0]
+
+    def search_hybrid_batch(self, query_texts: list, query_matrix: np.ndarray, k: int = TOP_K,
+                            search_filter=None) -> list:
+        """
+        Ứng viên dense + BM25 từ mọi shard được gộp thành hai ranking toàn cục (top HYBRID_CANDIDATES
+        theo similarity / BM25 score) rồi RRF như FAISSVectorStore.search_hybrid_batch.
+        BM25 score tính theo IDF của từng shard (xấp xỉ IDF toàn corpus khi chunks chia đều).
+        """
+        if not self.has_lexical:
+            return self.search_batch(query_matrix, k, search_filter)
+
+        try:
+            results = []
+            n = max(k, HYBRID_CANDIDATES)
+            for dense, lexical, lexical_similarity in self._candidates(query_texts, query_matrix, n, search_filter):
+                top, fused = rrf_fuse(dense, lexical, k)
+                for idx in top:
+                    if idx not in dense:
+                        dense[idx] = lexical_similarity.get(idx)
+                results.append(hybrid_hits(top, fused, dense, lexical, self._chunk))
+            return results
+
+        except Exception as e:
+            logger.error(f"❌ Lỗi search: {str(e)}")
+            raise
+
+    def _candidates(self, query_texts, query_matrix: np.ndarray, n: int, search_filter) -> list:
+        """Ứng viên của mọi shard gộp theo từng query: list (dense top n, lexical top n, similarity của lexical)"""
+        queries = np.ascontiguousarray(query_matrix, dtype=np.float32).reshape(-1, self.embedding_dimension)
+        replies = self._call("candidates", query_texts, queries, n, search_filter)
+
+        merged = []
+        for per_shard in zip(*replies):
+            lexical_similarity = {}
+            for _, _, similarities in per_shard:
+                lexical_similarity.update(similarities)
+            merged.append((
+                _top([dense for dense, _, _ in per_shard], n),
+                _top([lexical for _, lexical, _ in per_shard], n),
+                lexical_similarity
+            ))
+        return merged
+
+    def _chunk(self, idx: int) -> dict:
+        return self._chunks[idx % self.num_shards][idx // self.num_shards]
+
+    def embeddings(self) -> np.ndarray:
+        """Vectors của mọi shard ghép lại theo id toàn cục (xem FAISSVectorStore.embeddings)"""
+        embeddings = np.empty((self.ntotal, self.embedding_dimension), dtype=np.float32)
+        for shard, part in enumerate(self._call("embeddings")):
+            embeddings[shard::self.num_shards] = part
+        return embeddings
+
+    def _call(self, op: str, *args) -> list:
+        """
+        Gửi request tới mọi shard song song (mỗi shard một thread của pool), chờ đủ kết quả.
+        Mỗi worker chỉ bị khóa trong cặp send / recv của chính nó nên các query đồng thời
+        xen kẽ nhau trên từng shard thay vì xếp hàng sau một khóa chung
+        """
+        if self._broken is not None:
+            raise RuntimeError(f"Vector store chia shard không dùng được: {self._broken}")
+        if not self._workers:
+            raise RuntimeError("Vector store chia shard chưa load hoặc đã đóng")
+
+        request_id = next(self._request_ids)
+        calls = [self._pool.submit(self._round_trip, worker, request_id, op, args) for worker in self._workers]
+        replies = [call.result() for call in calls]
+
+        errors = [f"shard {shard}: {result}" for shard, (ok, result) in enumerate(replies) if not ok]
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        return [result for _, result in replies]
+
+    def _round_trip(self, worker: _Worker, request_id: int, op: str, args: tuple) -> tuple:
+        """(ok, kết quả) của một request trên một worker, kiểm tra id để không nhận nhầm kết quả cũ"""
+        with worker.lock:
+            try:
+                worker.conn.send((request_id, op, args))
+                while True:
+                    reply_id, ok, result = worker.conn.recv()
+                    if reply_id == request_id:
+                        return ok, result
+                    # Mỗi pipe chỉ có một request đang chờ → id khác là kết quả sót của lần gọi bị ngắt
+                    logger.warning(f"⚠️ {worker.process.name}: bỏ kết quả cũ của request {reply_id}")
+            except (EOFError, OSError) as e:
+                self._broken = f"{worker.process.name}: {str(e)}"
+                raise RuntimeError(f"Worker shard không phản hồi: {self._broken}") from e
+
+def _top(rankings: list, n: int) -> dict:
+    """Gộp các dict id → score của các shard, giữ n score cao nhất (dict theo thứ tự rank)"""
+    scores = {}
+    for ranking in rankings:
+        scores.update(ranking)
+    return dict(sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:n])
+
+def _queued_batches(batch_queue: queue.Queue):
+    """Iterator batch của một shard khi build, tới _DONE (exception = nguồn lỗi → shard hủy build)"""
+    while True:
+        item = batch_queue.get()
+        if item is _DONE:
+            return
+        if isinstance(item, BaseException):
+            raise item
+        yield item
+
+def _put(batch_queue: queue.Queue, build, item):
+    """Đưa item cho shard đang build; shard đã dừng (lỗi) → ném lại lỗi của shard thay vì chờ mãi"""
+    while True:
+        try:
+            batch_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if build.done():
+                build.result()
+                return
+
+def _stop(workers: list):
+    for worker in workers:
+        with worker.lock:
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+    for worker in workers:
+        worker.process.join(STOP_TIMEOUT)
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.conn.close()
+
+def _serve_shard(paths: IndexPaths, shard: int, num_shards: int, threads: int, conn):
+    """Worker process của một shard: load FAISSVectorStore rồi trả lời các request (op, args) qua pipe"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - shard {shard} - %(levelname)s - %(message)s'
+    )
+    import faiss
+    faiss.omp_set_num_threads(threads)
+
+    store = FAISSVectorStore()
+    try:
+        store.load(paths)
+    except Exception as e:
+        conn.send((False, str(e)))
+        return
+    conn.send((True, (store.ntotal, store.embedding_dimension, store.bm25 is not None)))
+
+    def to_global(scores: dict) -> dict:
+        return {idx * num_shards + shard: score for idx, score in scores.items()}
+
+    def candidates(query_texts, queries, n, search_filter) -> list:
+        # Coordinator không có vectors: similarity của ứng viên BM25 đi kèm kết quả
+        return [
+            tuple(to_global(scores) for scores in per_query)
+            for per_query in store.candidates(query_texts, queries, n, search_filter)
+        ]
+
+    handlers = {
+        "candidates": candidates,
+        "embeddings": store.embeddings,
+        "set_search_params": store.set_search_params
+    }
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return  # Process chính đã thoát
+        if request is None:
+            return
+        request_id, op, args = request
+        try:
+            conn.send((request_id, True, handlers[op](*args)))
+        except Exception as e:
+            conn.send((request_id, False, f"{type(e).__name__}: {str(e)}"))
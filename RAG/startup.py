@@ -0,0 +1,77 @@
+"""
+Khởi động nhanh cho app.py / server.py / debug tools: các module nặng (torch + sentence-transformers,
+faiss, google.generativeai) chỉ được import khi cần, trên các thread nền chạy song song với việc
+load embedding model và index; thời gian từng bước được ghi lại để log bảng phân tích khởi động.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import logging
+
+logger = logging.getLogger(__name__)
+
+class StartupTimer:
+    """Thời gian (giây) từng bước khởi động, ghi được từ nhiều thread"""
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.timings = {}
+
+    @contextmanager
+    def span(self, step: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.timings[step] = self.timings.get(step, 0.0) + elapsed
+
+    def report(self):
+        """Log thời gian từng bước + tổng thời gian thực (các bước song song chồng lên nhau)"""
+        total = time.perf_counter() - self._start
+        logger.info("⏱️  THỜI GIAN KHỞI ĐỘNG")
+        with self._lock:
+            for step, seconds in self.timings.items():
+                logger.info(f"   {step:<24}{seconds:>8.2f}s")
+            serial = sum(self.timings.values())
+        logger.info(f"   {'Tổng':<24}{total:>8.2f}s (tuần tự: {serial:.2f}s)\n")
+
+def _load_embedding_service(timer: StartupTimer):
+    with timer.span("import embedding"):
+        from embedding_service import EmbeddingService
+    with timer.span("load embedding model"):
+        return EmbeddingService()
+
+def _load_vector_store(timer: StartupTimer):
+    with timer.span("import vector store"):
+        from sharded_store import load_vector_store
+    with timer.span("load index"):
+        return load_vector_store()
+
+def _import_rag(timer: StartupTimer):
+    with timer.span("import gemini"):
+        from gemini_rag import GeminiRAG
+        return GeminiRAG
+
+def load_services(timer: StartupTimer, with_rag: bool = True) -> tuple:
+    """
+    Load song song embedding model, FAISS index (+ import Gemini) trên các thread nền
+    → (embedding_service, vector_store, rag), rag = None nếu with_rag=False
+    """
+    with ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup") as pool:
+        embedding_future = pool.submit(_load_embedding_service, timer)
+        store_future = pool.submit(_load_vector_store, timer)
+        rag_future = pool.submit(_import_rag, timer) if with_rag else None
+        embedding_service = embedding_future.result()
+        vector_store = store_future.result()
+        rag_class = rag_future.result() if rag_future is not None else None
+
+    rag = None
+    if rag_class is not None:
+        with timer.span("init RAG"):
+            rag = rag_class(vector_store, embedding_service)
+    return embedding_service, vector_store, rag
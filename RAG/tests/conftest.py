@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Các module RAG import lẫn nhau theo tên file (chạy từ thư mục RAG)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,41 @@
+import numpy as np
+
+import config
+from answer_cache import AnswerCache, entity_tokens
+
+def _put(cache: AnswerCache, question: str, embedding: np.ndarray, answer: str):
+    cache.get(question, 1)  # Tra cứu trước như gemini_rag → cache gắn với index version 1
+    cache.put(question, embedding, {"answer": answer}, 1)
+
+def _embedding(*values) -> np.ndarray:
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_entity_tokens_keep_proper_names_and_numbers():
+    assert entity_tokens("Giá vé Vịnh Hạ Long năm 2024?") == {"giá", "vịnh", "hạ", "long", "2024"}
+    assert entity_tokens("Giá vé Vịnh Hạ Long?") != entity_tokens("Giá vé Vịnh Lan Hạ?")
+
+def test_semantic_hit_requires_same_entities():
+    cache = AnswerCache(semantic_size=10, similarity=0.95)
+    _put(cache, "Giá vé Vịnh Hạ Long bao nhiêu?", _embedding(1, 0), "Hạ Long")
+
+    # Embedding gần như trùng nhưng khác địa danh → không được dùng lại câu trả lời
+    assert cache.get_similar("Giá vé Vịnh Lan Hạ bao nhiêu?", _embedding(1, 0.01), 1) is None
+    assert cache.get_similar("Giá vé tham quan Vịnh Hạ Long là bao nhiêu?", _embedding(1, 0.1), 1) == {"answer": "Hạ Long"}
+    assert cache.get_similar("Giá vé Vịnh Hạ Long", _embedding(0, 1), 1) is None  # dưới ngưỡng
+    assert cache.stats()["semantic_hits"] == 1
+
+def test_near_miss_falls_through_to_matching_entry():
+    cache = AnswerCache(semantic_size=10, similarity=0.9)
+    _put(cache, "Giá vé Vịnh Lan Hạ?", _embedding(1, 0), "Lan Hạ")
+    _put(cache, "Giá vé Vịnh Hạ Long?", _embedding(1, 0.3), "Hạ Long")
+
+    assert cache.get_similar("Giá vé vào Vịnh Hạ Long bao nhiêu?", _embedding(1, 0.01), 1) == {"answer": "Hạ Long"}
+
+def test_semantic_tier_off_by_default():
+    assert config.ANSWER_CACHE_SEMANTIC_SIZE == 0
+    cache = AnswerCache()
+    _put(cache, "Giá vé Vịnh Hạ Long?", _embedding(1, 0), "Hạ Long")
+
+    assert cache.get_similar("Giá vé Vịnh Hạ Long nhé?", _embedding(1, 0), 1) is None
+    assert cache.get("Giá vé Vịnh Hạ Long", 1) == {"answer": "Hạ Long"}
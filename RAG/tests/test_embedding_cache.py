@@ -0,0 +1,41 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+def _vectors(n: int, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, 8)).astype(np.float32)
+
+def test_added_rows_are_found_without_reloading(tmp_path):
+    cache = EmbeddingCache("model", 8, str(tmp_path))
+    first, second = _vectors(3, 0), _vectors(2, 1)
+
+    _, keys, missing = cache.lookup(["a", "b", "c"])
+    assert len(missing) == 3
+    cache.add(keys, first)
+    embeddings, _, missing = cache.lookup(["c", "a"])
+    np.testing.assert_array_equal(embeddings, first[[2, 0]])
+
+    _, keys, _ = cache.lookup(["d", "e"])
+    cache.add(keys, second)
+    embeddings, _, missing = cache.lookup(["e", "a", "new"])
+
+    np.testing.assert_array_equal(embeddings[:2], [second[1], first[0]])
+    assert list(missing) == [cache.key("new")] and len(cache) == 5
+
+def test_reopen_and_ignore_partial_write(tmp_path):
+    cache = EmbeddingCache("model", 8, str(tmp_path))
+    vectors = _vectors(4, 0)
+    _, keys, _ = cache.lookup(["a", "b", "c", "d"])
+    cache.add(keys, vectors)
+    # Lần chạy bị ngắt: vectors đã ghi nhưng keys chưa
+    with open(cache.vectors_path, 'ab') as f:
+        f.write(_vectors(1, 1).tobytes())
+
+    reopened = EmbeddingCache("model", 8, str(tmp_path))
+    embeddings, _, missing = reopened.lookup(["d", "x"])
+    _, keys, _ = reopened.lookup(["x"])
+    reopened.add(keys, _vectors(1, 2))
+
+    assert len(reopened) == 5
+    np.testing.assert_array_equal(embeddings[0], vectors[3])
+    np.testing.assert_array_equal(EmbeddingCache("model", 8, str(tmp_path)).lookup(["x"])[0][0], _vectors(1, 2)[0])
@@ -0,0 +1,65 @@
+from langchain.schema import Document
+
+from index_manifest import diff_pages, page_hashes, update_manifest
+from pdf_loader import incomplete_sources, iter_pdf_pages
+
+def _page(source: str, page: int, text: str) -> Document:
+    return Document(page_content=text, metadata={"source": source, "page": page})
+
+def _manifest(documents: list) -> dict:
+    files = {
+        source: {"sha256": f"old-{source}", "size": 1, "mtime_ns": 1, "pages": pages}
+        for source, pages in page_hashes(documents).items()
+    }
+    return {"version": 1, "settings": {}, "files": files}
+
+def test_diff_pages_changed_and_removed(monkeypatch):
+    monkeypatch.setattr("index_manifest.CHUNK_ACROSS_PAGES", False)
+    manifest = _manifest([_page("a.pdf", 0, "một"), _page("a.pdf", 1, "hai"), _page("b.pdf", 0, "ba")])
+    documents = [_page("a.pdf", 0, "một"), _page("a.pdf", 1, "hai (sửa)")]
+
+    changed_docs, stale_pages = diff_pages(manifest, documents, {"a.pdf"}, {"b.pdf"})
+
+    assert [doc.metadata["page"] for doc in changed_docs] == [1]
+    assert stale_pages == {("a.pdf", 1), ("b.pdf", 0)}
+
+def test_diff_pages_across_pages_rechunks_whole_file(monkeypatch):
+    monkeypatch.setattr("index_manifest.CHUNK_ACROSS_PAGES", True)
+    manifest = _manifest([_page("a.pdf", 0, "một"), _page("a.pdf", 1, "hai"), _page("a.pdf", 2, "ba")])
+    documents = [_page("a.pdf", 0, "một"), _page("a.pdf", 1, "hai (sửa)")]
+
+    changed_docs, stale_pages = diff_pages(manifest, documents, {"a.pdf"}, set())
+
+    assert [doc.metadata["page"] for doc in changed_docs] == [0, 1]
+    assert stale_pages == {("a.pdf", 0), ("a.pdf", 1), ("a.pdf", 2)}
+
+def test_update_manifest():
+    manifest = _manifest([_page("a.pdf", 0, "một"), _page("b.pdf", 0, "ba")])
+    fingerprints = {"a.pdf": {"sha256": "new", "size": 2, "mtime_ns": 2}}
+
+    updated = update_manifest(manifest, [_page("a.pdf", 0, "mới")], fingerprints, {"a.pdf"}, {"b.pdf"})
+
+    assert set(updated["files"]) == {"a.pdf"}
+    assert updated["files"]["a.pdf"]["sha256"] == "new"
+    assert updated["files"]["a.pdf"]["pages"] == page_hashes([_page("a.pdf", 0, "mới")])["a.pdf"]
+
+def test_failed_extraction_keeps_old_vectors_and_manifest(tmp_path):
+    broken = tmp_path / "a.pdf"
+    broken.write_bytes(b"not a pdf")
+    manifest = _manifest([_page("a.pdf", 0, "một"), _page("a.pdf", 1, "hai")])
+    old_entry = dict(manifest["files"]["a.pdf"])
+
+    # Như train_rag.incremental_update: file lỗi bị loại khỏi changed_sources trước khi diff
+    files = {}
+    documents = list(iter_pdf_pages([str(broken)], workers=1, report=files))
+    skipped_sources = incomplete_sources(files)
+    changed_sources = {"a.pdf"} - skipped_sources
+    documents = [doc for doc in documents if doc.metadata["source"] not in skipped_sources]
+    changed_docs, stale_pages = diff_pages(manifest, documents, changed_sources, set())
+    fingerprints = {"a.pdf": {"sha256": "new", "size": 9, "mtime_ns": 9}}
+    updated = update_manifest(manifest, documents, fingerprints, changed_sources, set())
+
+    assert files[str(broken)].status == "failed"
+    assert skipped_sources == {"a.pdf"}
+    assert changed_docs == [] and stale_pages == set()
+    assert updated["files"]["a.pdf"] == old_entry
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+import index_versions
+from index_versions import PUBLISHED_NAME, current_version, new_version, publish
+from vector_store import FAISSVectorStore
+
+@pytest.fixture
+def versions_dir(tmp_path, monkeypatch):
+    root = tmp_path / "versions"
+    monkeypatch.setattr("index_versions.FAISS_VERSIONS_DIR", str(root))
+    return root
+
+def _publish_new() -> str:
+    paths = new_version()
+    publish(paths)
+    return paths.version
+
+def test_prune_keeps_published_versions_and_drops_orphans(versions_dir, monkeypatch):
+    monkeypatch.setattr(index_versions.prune, "__defaults__", (2,))
+    first = _publish_new()
+    orphan = new_version().version  # Build bị kill: thư mục có nhưng không publish
+    second = _publish_new()
+    third = _publish_new()
+
+    remaining = sorted(os.listdir(versions_dir))
+    assert current_version() == third
+    assert [name for name in remaining if name != "CURRENT"] == [second, third]
+    assert first not in remaining and orphan not in remaining
+    assert (versions_dir / third / PUBLISHED_NAME).exists()
+
+def test_failed_write_discards_version(versions_dir, monkeypatch):
+    published = _publish_new()
+    embeddings = np.eye(4, dtype=np.float32)
+    records = [{"content": f"chunk {i}", "metadata": {"source": "a.pdf", "page": i}} for i in range(4)]
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr("bm25_index.BM25Index.save", fail)
+    with pytest.raises(OSError):
+        FAISSVectorStore().build_streaming(iter([(embeddings, records)]), "flat")
+
+    assert current_version() == published
+    assert sorted(os.listdir(versions_dir)) == sorted(["CURRENT", published])
+
+def test_index_exists_checks_current_and_legacy_paths(versions_dir, tmp_path, monkeypatch):
+    legacy = index_versions.IndexPaths(*(str(tmp_path / name) for name in ("index.faiss", "chunks", "bm25", "info.json")))
+    monkeypatch.setattr("index_versions.LEGACY_PATHS", legacy)
+    monkeypatch.setattr("index_versions.FAISS_METADATA_PATH", str(tmp_path / "metadata.pkl"))
+    assert not index_versions.index_exists()
+
+    (tmp_path / "index.faiss").touch()
+    assert not index_versions.index_exists()  # index cũ thiếu chunk store
+    (tmp_path / "metadata.pkl").touch()
+    assert index_versions.index_exists()
+
+    os.remove(tmp_path / "index.faiss")
+    _publish_new()
+    assert index_versions.index_exists()
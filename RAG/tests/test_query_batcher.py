@@ -0,0 +1,58 @@
+import threading
+import time
+
+import numpy as np
+
+from query_batcher import QueryBatcher
+
+class FakeEncoder:
+    dimension = 4
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.batches = []
+
+    def encode_queries(self, queries: list) -> np.ndarray:
+        self.batches.append(list(queries))
+        time.sleep(self.delay)
+        return np.array([[len(query), 0, 0, 1] for query in queries], dtype=np.float32).reshape(-1, self.dimension)
+
+def test_single_caller_does_not_wait_for_window():
+    batcher = QueryBatcher(FakeEncoder(), max_wait_ms=500)
+    try:
+        start = time.perf_counter()
+        vectors = batcher.encode_queries(["hà nội"])
+        elapsed = time.perf_counter() - start
+    finally:
+        batcher.close()
+
+    assert vectors.shape == (1, 4) and vectors[0, 0] == len("hà nội")
+    assert elapsed < 0.25
+
+def test_concurrent_callers_share_batches():
+    encoder = FakeEncoder(delay=0.05)
+    batcher = QueryBatcher(encoder, max_wait_ms=20)
+    results = {}
+
+    def ask(i):
+        results[i] = batcher.encode_queries(["q" * (i + 1)])[0, 0]
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(16)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        batcher.close()
+
+    assert results == {i: i + 1 for i in range(16)}
+    assert len(encoder.batches) < 16
+    assert batcher.stats()["max_batch_size"] > 1
+
+def test_empty_input_returns_empty_matrix():
+    batcher = QueryBatcher(FakeEncoder())
+    try:
+        assert batcher.encode_queries([]).shape == (0, 4)
+    finally:
+        batcher.close()
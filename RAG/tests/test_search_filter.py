@@ -0,0 +1,75 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from chunk_store import ChunkStore
+from search_filter import SearchFilter
+
+RECORDS = [
+    {"content": "a1", "metadata": {"source": "a.pdf", "page": 1}},
+    {"content": "a2", "metadata": {"source": "a.pdf", "page": 2, "page_end": 4}},
+    {"content": "a5", "metadata": {"source": "a.pdf", "page": 5, "lang": "en"}},
+    {"content": "b1", "metadata": {"source": "b.pdf", "page": 1, "lang": "vi"}},
+    {"content": "b9", "metadata": {"source": "b.pdf", "page": 9, "tags": ["biển", "đảo"]}},
+    {"content": "x", "metadata": {"source": "c.pdf"}},
+]
+
+@pytest.fixture(params=["memory", "disk"])
+def store(request, tmp_path):
+    store = ChunkStore.from_records(RECORDS)
+    if request.param == "disk":
+        store.save(str(tmp_path / "chunks"))
+        store = ChunkStore.load(str(tmp_path / "chunks"))
+    return store
+
+def _selected(store, search_filter) -> list:
+    return [store[int(i)]["content"] for i in np.flatnonzero(store.mask(search_filter))]
+
+@pytest.mark.parametrize("search_filter, expected", [
+    (SearchFilter("a.pdf"), ["a1", "a2", "a5"]),
+    (SearchFilter(["b.pdf", "c.pdf"]), ["b1", "b9", "x"]),
+    (SearchFilter("none.pdf"), []),
+    (SearchFilter(pages=(3, 5)), ["a2", "a5"]),  # a2 vắt qua trang 2-4
+    (SearchFilter("a.pdf", pages=(1, 1)), ["a1"]),
+    (SearchFilter(where={"lang": "en"}), ["a5"]),
+    (SearchFilter(where={"lang": ["en", "vi"]}), ["a5", "b1"]),
+    (SearchFilter(where={"page": [1, 9]}), ["a1", "b1", "b9"]),
+    (SearchFilter(where={"page": "5"}), ["a5"]),  # Giá trị số gửi dạng chuỗi (JSON query string)
+    (SearchFilter(where={"missing": 1}), []),
+])
+def test_mask(store, search_filter, expected):
+    assert _selected(store, search_filter) == expected
+
+def test_mask_rejects_non_integer_for_int_column(store):
+    with pytest.raises(ValueError, match="where.page"):
+        store.mask(SearchFilter(where={"page": "năm"}))
+
+@pytest.mark.parametrize("body, field", [
+    ({"pages": [1]}, "pages"),
+    ({"pages": ["một", 2]}, "pages"),
+    ({"pages": 5}, "pages"),
+    ({"pages": "12"}, "pages"),
+    ({"sources": 3}, "sources"),
+    ({"where": [1, 2]}, "where"),
+    ({"where": {"page": {"gt": 5}}}, "where.page"),
+])
+def test_from_dict_rejects_malformed_fields(body, field):
+    with pytest.raises(ValueError, match=field):
+        SearchFilter.from_dict(body)
+
+def test_from_dict_empty_is_none():
+    assert SearchFilter.from_dict({"question": "?"}) is None
+    assert SearchFilter.from_dict({"sources": [], "where": {}}) is None
+
+def test_server_reports_bad_filter_field():
+    server = pytest.importorskip("server")
+
+    class Request:
+        async def json(self):
+            return {"question": "Hà Nội?", "pages": "10-20"}
+
+    question, search_filter, error = asyncio.run(server._parse_question(Request()))
+
+    assert question == "Hà Nội?" and search_filter is None
+    assert "pages" in error
@@ -0,0 +1,141 @@
+import hashlib
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from semantic_chunker import SemanticChunker, SentenceSplitter
+
+TOPICS = ["biển", "núi", "chùa", "phố", "ẩm thực"]
+
+class FakeEncoder:
+    """Vector câu = hướng của chủ đề + nhiễu cố định theo text (không cần model)"""
+
+    def encode_passages(self, texts: list, verbose: bool = True) -> np.ndarray:
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).normal(scale=0.4, size=16)
+            for topic_index, topic in enumerate(TOPICS):
+                if topic in text:
+                    vector[topic_index] += 1.0
+            vectors.append(vector / np.linalg.norm(vector))
+        return np.array(vectors, dtype=np.float32)
+
+def _pages(source: str, num_pages: int, seed: int) -> list:
+    rng = np.random.default_rng(seed)
+    pages, topic = [], 0
+    for page in range(num_pages):
+        sentences = []
+        for i in range(int(rng.integers(5, 15))):
+            if rng.random() < 0.15:
+                topic = int(rng.integers(len(TOPICS)))
+            sentences.append(f"Câu {page}-{i} về {TOPICS[topic]} {'x' * int(rng.integers(20, 120))}.")
+        pages.append(Document(page_content=" ".join(sentences), metadata={"source": source, "page": page}))
+    return pages
+
+def _sentences(documents: list) -> list:
+    splitter = SentenceSplitter(max_chars=400)
+    sentences = [sentence for doc in documents for sentence in splitter.feed(doc)]
+    return sentences + splitter.flush()
+
+def _chunk(sentences: list, batch_size: int) -> tuple:
+    chunker = SemanticChunker(FakeEncoder(), percentile=80, min_chars=150, max_chars=600, window=32)
+    chunks, embeddings = [], []
+    for start in range(0, len(sentences), batch_size):
+        batch_chunks, batch_embeddings = chunker.group(sentences[start:start + batch_size])
+        chunks.extend(batch_chunks)
+        if batch_chunks:
+            embeddings.append(batch_embeddings)
+    batch_chunks, batch_embeddings = chunker.group([], final=True)
+    chunks.extend(batch_chunks)
+    embeddings.append(batch_embeddings)
+    return chunks, np.vstack(embeddings)
+
+@pytest.fixture(scope="module")
+def sentences():
+    return _sentences(_pages("a.pdf", 12, 0) + _pages("b.pdf", 8, 1))
+
+def test_chunks_do_not_depend_on_batch_size(sentences):
+    expected, expected_embeddings = _chunk(sentences, len(sentences))
+    assert len(expected) > 10
+
+    for batch_size in (1, 7, 64, 333):
+        chunks, embeddings = _chunk(sentences, batch_size)
+        assert [(chunk.page_content, chunk.metadata) for chunk in chunks] == \
+            [(chunk.page_content, chunk.metadata) for chunk in expected]
+        np.testing.assert_allclose(embeddings, expected_embeddings, atol=1e-6)
+
+def test_file_chunks_do_not_depend_on_other_files(sentences):
+    """Incremental chỉ chunk lại file thay đổi → phải ra đúng các chunk của file đó khi build toàn bộ"""
+    chunks, _ = _chunk(sentences, 50)
+    alone, _ = _chunk(_sentences(_pages("b.pdf", 8, 1)), 50)
+
+    assert [chunk.page_content for chunk in chunks if chunk.metadata["source"] == "b.pdf"] == \
+        [chunk.page_content for chunk in alone]
+
+def test_chunk_limits(sentences):
+    chunks, embeddings = _chunk(sentences, 64)
+
+    assert all(len(chunk.page_content) <= 600 for chunk in chunks)
+    assert len({chunk.metadata["source"] for chunk in chunks}) == 2
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-5)
+
+# ==================== STREAMING CHUNKER ====================
+from bisect import bisect_right
+
+from semantic_chunker import PAGE_JOINER, StreamingChunker
+
+WORDS = ["Hà", "Nội", "biển", "Phú", "Quốc.", "núi!", "chùa?", "phố", "\n", "\n\n", "。", "  ", "đảo"]
+
+def _random_pages(rng, source: str) -> list:
+    pages = []
+    for page in range(int(rng.integers(1, 6))):
+        words = rng.choice(WORDS, size=int(rng.integers(0, 120)))
+        pages.append(Document(page_content=" ".join(words), metadata={"source": source, "page": page + 1}))
+    return pages
+
+@pytest.mark.parametrize("across_pages", [True, False])
+def test_streaming_chunker_offsets(across_pages):
+    rng = np.random.default_rng(42)
+    for _ in range(300):
+        chunk_size = int(rng.integers(20, 200))
+        chunker = StreamingChunker(chunk_size, int(rng.integers(0, chunk_size // 2)), across_pages=across_pages)
+        files = {source: _random_pages(rng, source) for source in ("a.pdf", "b.pdf")}
+        chunks = []
+        for pages in files.values():
+            for doc in pages:
+                chunks.extend(chunker.feed(doc))
+        chunks.extend(chunker.flush())
+
+        for source, pages in files.items():
+            file_chunks = [chunk for chunk in chunks if chunk.metadata["source"] == source]
+            # Text cả file như chunker nối: PAGE_JOINER giữa các trang, trừ khi chưa có text nào trước đó
+            text, starts = "", []
+            for doc in pages:
+                text += PAGE_JOINER if text else ""
+                starts.append(len(text))
+                text += doc.page_content
+            if across_pages:
+                texts = {None: text}
+            else:
+                texts = {doc.metadata["page"]: doc.page_content for doc in pages}
+
+            covered = {key: np.zeros(len(text), dtype=bool) for key, text in texts.items()}
+            for chunk in file_chunks:
+                key = None if across_pages else chunk.metadata["page"]
+                start, end = chunk.metadata["char_start"], chunk.metadata["char_end"]
+                assert texts[key][start:end] == chunk.page_content
+                assert len(chunk.page_content) <= chunk_size
+                covered[key][start:end] = True
+                if across_pages:
+                    assert chunk.metadata["page"] == bisect_right(starts, start)
+                    assert chunk.metadata["page_end"] == bisect_right(starts, end - 1)
+                else:
+                    assert chunk.metadata["page_end"] == chunk.metadata["page"]
+
+            # Mọi ký tự không phải khoảng trắng đều nằm trong ít nhất một chunk, chunk theo thứ tự
+            for key, text in texts.items():
+                assert all(covered[key][i] or text[i].isspace() for i in range(len(text)))
+            positions = [(chunk.metadata["page"], chunk.metadata["char_start"]) for chunk in file_chunks]
+            assert positions == sorted(positions)
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from search_filter import SearchFilter
+from sharded_store import ShardedVectorStore, load_vector_store
+from vector_store import FAISSVectorStore
+
+N, DIM, K = 600, 16, 10
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr("index_versions.FAISS_VERSIONS_DIR", str(tmp_path / "versions"))
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((N, DIM)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    records = [
+        {"content": f"chunk {i}", "metadata": {"source": ["a.pdf", "b.pdf"][i % 2], "page": i // 2}}
+        for i in range(N)
+    ]
+    queries = embeddings[:8] + 0.1 * rng.standard_normal((8, DIM)).astype(np.float32)
+    return embeddings, records, queries
+
+def _batches(embeddings, records, size=128):
+    for start in range(0, len(records), size):
+        yield embeddings[start:start + size], records[start:start + size]
+
+@pytest.fixture
+def stores(corpus):
+    embeddings, records, _ = corpus
+    flat = FAISSVectorStore()
+    flat.create_index(embeddings, records, "flat")
+    ShardedVectorStore().build_streaming(_batches(embeddings, records), 3, "flat")
+    sharded = load_vector_store()
+    yield flat, sharded
+    sharded.close()
+
+def _ids(results):
+    return [[hit["id"] for hit in hits] for hits in results]
+
+def test_top_k_merge_matches_flat(corpus, stores):
+    _, _, queries = corpus
+    flat, sharded = stores
+    assert isinstance(sharded, ShardedVectorStore) and sharded.ntotal == N
+
+    expected, merged = flat.search_batch(queries, K), sharded.search_batch(queries, K)
+
+    assert _ids(merged) == _ids(expected)
+    for hits, expected_hits in zip(merged, expected):
+        for hit, expected_hit in zip(hits, expected_hits):
+            assert hit["similarity"] == pytest.approx(expected_hit["similarity"], abs=1e-4)
+            assert hit["content"] == expected_hit["content"]
+            assert hit["metadata"] == expected_hit["metadata"]
+
+def test_filtered_top_k_matches_flat(corpus, stores):
+    _, _, queries = corpus
+    flat, sharded = stores
+    search_filter = SearchFilter("b.pdf", pages=(10, 200))
+
+    assert _ids(sharded.search_batch(queries, K, search_filter)) == _ids(flat.search_batch(queries, K, search_filter))
+
+def test_embeddings_in_global_id_order(corpus, stores):
+    embeddings, _, _ = corpus
+    _, sharded = stores
+
+    np.testing.assert_allclose(sharded.embeddings(), embeddings)
+
+def test_chunk_stores_in_global_id_order(corpus, stores):
+    from benchmark_embedding import sample_chunks
+    from sharded_store import load_chunk_stores
+
+    _, records, _ = corpus
+    chunk_stores = load_chunk_stores()
+    rows = np.sort(np.random.default_rng(0).choice(N, size=50, replace=False))
+
+    assert len(chunk_stores) == 3
+    assert [chunk_stores[g % 3][g // 3] for g in range(N)] == records
+    assert sample_chunks(50) == [records[row]["content"] for row in rows]
+
+def test_concurrent_queries_get_their_own_results(corpus, stores):
+    from concurrent.futures import ThreadPoolExecutor
+
+    _, _, queries = corpus
+    flat, sharded = stores
+    expected = _ids(flat.search_batch(queries, K))
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda i: _ids(sharded.search_batch(queries[i % 8:i % 8 + 1], K))[0], range(64)))
+
+    assert results == [expected[i % 8] for i in range(64)]
+
+def test_dead_worker_marks_store_broken(corpus, stores):
+    _, _, queries = corpus
+    _, sharded = stores
+    worker = sharded._workers[1]
+    worker.process.kill()
+    worker.process.join()
+
+    with pytest.raises(RuntimeError, match="không phản hồi"):
+        sharded.search_batch(queries, K)
+    with pytest.raises(RuntimeError, match="không dùng được"):
+        sharded.search_batch(queries, K)
+
+def test_stale_reply_is_discarded(corpus, stores):
+    _, _, queries = corpus
+    flat, sharded = stores
+    # Lần gọi bị ngắt sau khi gửi: kết quả của nó còn nằm trong pipe
+    sharded._workers[0].conn.send((-1, "set_search_params", (None, None)))
+
+    assert _ids(sharded.search_batch(queries, K)) == _ids(flat.search_batch(queries, K))
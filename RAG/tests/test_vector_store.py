@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import vector_store
+from vector_store import FAISSVectorStore, RRF_K, rrf_fuse
+
+def test_rrf_fuse_sums_reciprocal_ranks():
+    dense = {10: 0.9, 11: 0.8, 12: 0.7}
+    lexical = {12: 7.0, 13: 5.0}
+
+    top, fused = rrf_fuse(dense, lexical, 10)
+
+    assert fused[12] == pytest.approx(1 / (RRF_K + 3) + 1 / (RRF_K + 1))
+    assert fused[10] == pytest.approx(1 / (RRF_K + 1))
+    assert fused[13] == pytest.approx(1 / (RRF_K + 2))
+    assert top == [12, 10, 11, 13]  # 11 (dense hạng 2) trên 13 (lexical hạng 2) nhờ id nhỏ hơn khi hòa
+
+def test_rrf_fuse_truncates_and_breaks_ties_by_id():
+    top, _ = rrf_fuse({5: 0.9, 3: 0.5}, {4: 1.0, 2: 0.5}, 3)
+    assert top == [4, 5, 2]
+
+def test_rrf_fuse_empty():
+    assert rrf_fuse({}, {}, 5) == ([], {})
+
+@pytest.fixture
+def store():
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((300, 16)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    records = [
+        {"content": f"chunk {i} " + ("vịnh hạ long" if i % 50 == 0 else "khác"), "metadata": {"source": "a.pdf", "page": i}}
+        for i in range(300)
+    ]
+    store = FAISSVectorStore()
+    store.create_index(embeddings, records, "ivf_flat")
+    store.build_lexical_index()
+    return store, embeddings
+
+def test_hybrid_hits_have_similarity(store, monkeypatch):
+    store, embeddings = store
+    monkeypatch.setattr(vector_store, "USE_SIMILARITY_THRESHOLD", False)
+
+    hits = store.search_hybrid("hạ long", embeddings[7], 10)
+
+    lexical_only = [hit for hit in hits if hit["bm25_score"] is not None and hit["id"] != 7]
+    assert lexical_only
+    for hit in hits:
+        assert hit["similarity"] == pytest.approx(float(embeddings[hit["id"]] @ embeddings[7]), abs=1e-4)
+
+def test_hybrid_threshold_applies_to_lexical_hits(store, monkeypatch):
+    store, embeddings = store
+    monkeypatch.setattr(vector_store, "USE_SIMILARITY_THRESHOLD", True)
+    monkeypatch.setattr(vector_store, "SIMILARITY_THRESHOLD", 0.3)
+
+    hits = store.search_hybrid("hạ long", embeddings[7], 10)
+
+    assert hits and all(hit["similarity"] >= 0.3 for hit in hits)
@@ -4,12 +4,24 @@ Semantic chunking + Google Embeddings + FAISS + Gemini
 """
 
 import logging
-from pdf_loader import load_all_pdfs
-from semantic_chunker import semantic_chunk
+from pathlib import Path
+from pdf_loader import incomplete_sources, iter_pdf_pages, log_extract_report, pdf_files, pdf_source_name
+from extraction_cache import ExtractionCache
+from semantic_chunker import chunk_and_embed
 from embedding_service import EmbeddingService
 from vector_store import FAISSVectorStore
-from config import FAISS_INDEX_PATH, FAISS_METADATA_PATH
-from pathlib import Path
+from sharded_store import ShardedVectorStore
+from ingest_pipeline import IngestPipeline
+from index_manifest import (
+    build_manifest,
+    diff_pages,
+    find_changed_files,
+    load_manifest,
+    save_manifest,
+    update_manifest
+)
+from config import FAISS_INDEX_TYPE, INCREMENTAL_INDEXING, NUM_SHARDS, PDF_EXTRACT_CACHE_DIR
+from index_versions import current_paths
 
 # ==================== LOGGING ====================
 logging.basicConfig(
@@ -18,65 +30,142 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def log_cache_stats(embedding_service: EmbeddingService):
+    stats = embedding_service.cache_stats()
+    if stats:
+        logger.info(f"  • Embedding cache: {stats['hits']} hit / {stats['misses']} miss "
+                    f"(hit rate {stats['hit_rate']:.1%}, {stats['size']} vectors)")
+
+def incremental_update(manifest: dict) -> bool:
+    """Chỉ load lại, chunk và embed các trang đã thay đổi so với manifest"""
+    logger.info("♻️  CẬP NHẬT INDEX TĂNG DẦN (INCREMENTAL)")
+    logger.info("-" * 60)
+
+    # ========== BƯỚC 1: PHÁT HIỆN FILE THAY ĐỔI ==========
+    changed_paths, removed_sources, fingerprints = find_changed_files(manifest, pdf_files())
+    if not changed_paths and not removed_sources:
+        if not Path(current_paths().bm25).exists():
+            # Index build trước khi có BM25 → build BM25 từ chunk store hiện có, lưu thành version mới
+            vector_store = FAISSVectorStore()
+            vector_store.load()
+            vector_store.save()
+        logger.info("✅ Không có thay đổi, index đã cập nhật")
+        return True
+
+    logger.info(f"   File thay đổi: {len(changed_paths)}")
+    logger.info(f"   File bị bỏ: {len(removed_sources)}")
+
+    # ========== BƯỚC 2: LOAD + SO SÁNH TỪNG TRANG ==========
+    files = {}
+    cache = ExtractionCache() if PDF_EXTRACT_CACHE_DIR else None
+    documents = list(iter_pdf_pages(changed_paths, cache=cache, report=files))
+    log_extract_report(files)
+    # File lỗi / thiếu trang: giữ vectors + entry manifest cũ → lần chạy sau vẫn thấy thay đổi và thử lại
+    skipped_sources = incomplete_sources(files)
+    if skipped_sources:
+        logger.warning(f"⚠️ Bỏ qua {len(skipped_sources)} file trích xuất lỗi, giữ nguyên vectors cũ")
+    changed_sources = {pdf_source_name(pdf_path) for pdf_path in changed_paths} - skipped_sources
+    documents = [doc for doc in documents if doc.metadata["source"] not in skipped_sources]
+    changed_docs, stale_pages = diff_pages(manifest, documents, changed_sources, removed_sources)
+    logger.info(f"   Trang mới/thay đổi: {len(changed_docs)}")
+    logger.info(f"   Trang cần xóa vectors: {len(stale_pages)}")
+
+    # ========== BƯỚC 3: XÓA VECTORS CŨ ==========
+    vector_store = FAISSVectorStore()
+    vector_store.load()
+    removed = vector_store.remove_pages(stale_pages)
+
+    # ========== BƯỚC 4: CHUNK + EMBED PHẦN THAY ĐỔI ==========
+    chunks = []
+    embedding_service = None
+    if changed_docs:
+        embedding_service = EmbeddingService()
+        chunks, embeddings = chunk_and_embed(changed_docs, embedding_service)
+    if chunks:
+        vector_store.add(embeddings, [
+            {
+                "content": chunk.page_content,
+                "metadata": chunk.metadata
+            }
+            for chunk in chunks
+        ])
+
+    # ========== BƯỚC 5: LƯU INDEX + MANIFEST ==========
+    vector_store.save()
+    save_manifest(update_manifest(manifest, documents, fingerprints, changed_sources, removed_sources))
+
+    logger.info("\n📊 THỐNG KÊ INCREMENTAL:")
+    logger.info(f"  • Trang re-index: {len(changed_docs)}")
+    logger.info(f"  • Vectors xóa: {removed}")
+    logger.info(f"  • Chunks embed mới: {len(chunks)}")
+    logger.info(f"  • Vector store size: {vector_store.ntotal}")
+    if embedding_service:
+        log_cache_stats(embedding_service)
+
+    return True
+
 def main():
     logger.info("\n" + "🚀"*30)
     logger.info("KHỞI TẠO HỆ THỐNG RAG CHO DỮ LIỆU DU LỊCH VIỆT NAM")
     logger.info("🚀"*30 + "\n")
-    
+
     try:
-        # ========== BƯỚC 1: LOAD PDF ==========
-        logger.info("📖 BƯỚC 1: LOAD DỮ LIỆU TỪ PDF")
-        logger.info("-" * 60)
-        documents = load_all_pdfs()
-        
-        # ========== BƯỚC 2: SEMANTIC CHUNKING ==========
-        logger.info("📖 BƯỚC 2: SEMANTIC CHUNKING")
-        logger.info("-" * 60)
-        chunks = semantic_chunk(documents)
-        
-        # ========== BƯỚC 3: EMBEDDING ==========
-        logger.info("📖 BƯỚC 3: EMBEDDING CHUNKS")
+        if INCREMENTAL_INDEXING and FAISS_INDEX_TYPE != "flat":
+            # Index ANN không xóa vectors tại chỗ được → build lại (embedding lấy từ cache)
+            logger.info(f"ℹ️ Index {FAISS_INDEX_TYPE} không hỗ trợ incremental → build lại toàn bộ index\n")
+        elif INCREMENTAL_INDEXING and NUM_SHARDS > 1:
+            logger.info(f"ℹ️ Index chia {NUM_SHARDS} shard không hỗ trợ incremental → build lại toàn bộ index\n")
+        elif INCREMENTAL_INDEXING:
+            manifest = load_manifest()
+            if manifest and FAISSVectorStore.exists():
+                return incremental_update(manifest)
+            logger.info("ℹ️ Chưa có manifest hợp lệ → build lại toàn bộ index\n")
+
+        # ========== BƯỚC 1-4: LOAD PDF → CHUNKING → EMBEDDING → FAISS INDEX ==========
+        # Các stage chạy chồng lên nhau theo từng batch, không giữ cả corpus trong bộ nhớ
+        logger.info("📖 BƯỚC 1-4: LOAD PDF → CHUNKING → EMBEDDING → FAISS INDEX (STREAMING)")
         logger.info("-" * 60)
         embedding_service = EmbeddingService()
-        chunk_texts = [chunk.page_content for chunk in chunks]
-        embeddings = embedding_service.embed_documents(chunk_texts)
-        
-        # ========== BƯỚC 4: TẠO VECTOR STORE ==========
-        logger.info("📖 BƯỚC 4: TẠO FAISS VECTOR STORE")
-        logger.info("-" * 60)
-        
-        metadata = [
-            {
-                "content": chunk.page_content,
-                "metadata": chunk.metadata
-            }
-            for chunk in chunks
-        ]
-        
-        vector_store = FAISSVectorStore()
-        vector_store.create_index(embeddings, metadata)
-        
-        # ========== BƯỚC 5: LƯU INDEX ==========
-        logger.info("📖 BƯỚC 5: LƯU INDEX")
+        files = pdf_files()
+        pipeline = IngestPipeline(files, embedding_service)
+
+        if NUM_SHARDS > 1:
+            vector_store = ShardedVectorStore()
+            vector_store.build_streaming(pipeline.batches(), NUM_SHARDS)
+        else:
+            vector_store = FAISSVectorStore()
+            vector_store.build_streaming(pipeline.batches())
+        pipeline.log_stats()
+
+        # ========== BƯỚC 5: LƯU MANIFEST ==========
+        logger.info("📖 BƯỚC 5: LƯU MANIFEST")
         logger.info("-" * 60)
-        vector_store.save()
-        
+        save_manifest(build_manifest(files, pipeline.page_hashes))
+
         # ========== HOÀN TẤT ==========
         logger.info("\n" + "✅"*30)
         logger.info("HOÀN TẤT HUẤN LUYỆN HỆ THỐNG RAG!")
         logger.info("✅"*30)
-        
+
         logger.info("\n📊 THỐNG KÊ:")
-        logger.info(f"  • Tổng PDF pages: {len(documents)}")
-        logger.info(f"  • Tổng chunks: {len(chunks)}")
-        logger.info(f"  • Embedding dimension: {embeddings.shape[1]}")
-        logger.info(f"  • Vector store size: {vector_store.index.ntotal}")
+        logger.info(f"  • Tổng PDF pages: {pipeline.stats['extract'].items}")
+        logger.info(f"  • Tổng chunks: {pipeline.stats['index'].items}")
+        logger.info(f"  • Embedding dimension: {vector_store.embedding_dimension}")
+        logger.info(f"  • Vector store size: {vector_store.ntotal}")
+        logger.info(f"  • Index type: {FAISS_INDEX_TYPE}")
+        logger.info(f"  • Shards: {max(NUM_SHARDS, 1)}")
+        log_cache_stats(embedding_service)
         logger.info(f"\n💾 Lưu tại:")
-        logger.info(f"  • Index: {FAISS_INDEX_PATH}")
-        logger.info(f"  • Metadata: {FAISS_METADATA_PATH}")
-        
+        logger.info(f"  • Version: {vector_store.paths.version}")
+        if NUM_SHARDS > 1:
+            logger.info(f"  • Shards: {Path(vector_store.paths.index).parent}")
+        else:
+            logger.info(f"  • Index: {vector_store.paths.index}")
+            logger.info(f"  • Chunks: {vector_store.paths.chunks}")
+            logger.info(f"  • BM25: {vector_store.paths.bm25}")
+
         return True
-    
+
     except Exception as e:
         logger.error(f"\n❌ LỖI HUẤN LUYỆN: {str(e)}")
         return False
@@ -1,27 +1,110 @@
 import faiss
+import itertools
+import json
 import pickle
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
 import numpy as np
 from pathlib import Path
+from chunk_store import ChunkStore, ChunkStoreWriter
+from bm25_index import BM25Index
+from embedding_models import index_signature
+from index_versions import IndexPaths, LEGACY_PATHS, current_paths, discard, index_exists, new_version, publish
+from index_factory import (
+    COMPRESSED_TYPES,
+    IncrementalIndexBuilder,
+    build_index,
+    enable_reconstruct,
+    is_exact,
+    reconstruct_all,
+    rescore,
+    search_parameters,
+    set_search_params
+)
 from config import (
-    FAISS_INDEX_PATH, 
+    FAISS_INDEX_TYPE,
     FAISS_METADATA_PATH,
     TOP_K,
     USE_SIMILARITY_THRESHOLD,
-    SIMILARITY_THRESHOLD
+    SIMILARITY_THRESHOLD,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    FILTER_CACHE_SIZE,
+    EXACT_RESCORE,
+    RESCORE_FACTOR
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Version tăng mỗi khi nội dung index đổi (duy nhất trong cả process, kể cả giữa các store)
+_versions = itertools.count(1)
+
+class _Selection(NamedTuple):
+    """Các chunk thỏa một SearchFilter trên một version index"""
+    mask: np.ndarray  # Bitmap bool (n) - BM25
+    count: int
+    params: object  # faiss.SearchParameters với IDSelectorBitmap - dense search
+    keepalive: tuple  # Bitmap đã pack + selector mà params trỏ tới (phải sống cùng params)
+
+def _keeps_vectors(index_type: str) -> bool:
+    return EXACT_RESCORE and index_type in COMPRESSED_TYPES
+
+def rrf_fuse(dense: dict, lexical: dict, k: int) -> tuple:
+    """Reciprocal Rank Fusion hai ranking (dict id → score theo thứ tự rank) → (top-k ids, id → rrf score)"""
+    fused = {}
+    for ranking in (dense, lexical):
+        for rank, idx in enumerate(ranking, 1):
+            fused[idx] = fused.get(idx, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(fused, key=lambda idx: (-fused[idx], idx))[:k], fused
+
+def hybrid_hits(top: list, fused: dict, dense: dict, lexical: dict, chunk) -> list:
+    """Kết quả hybrid search của một query, chunk(id) → {"content", "metadata"}"""
+    hits = []
+    for rank, idx in enumerate(top, 1):
+        record = chunk(idx)
+        similarity = dense.get(idx)
+        hits.append({
+            "rank": rank,
+            "id": idx,
+            "content": record["content"],
+            "metadata": record["metadata"],
+            "similarity": None if similarity is None else round(similarity, 4),
+            "distance": None if similarity is None else round(similarity, 4),
+            "rrf_score": round(fused[idx], 6),
+            "bm25_score": round(lexical[idx], 4) if idx in lexical else None
+        })
+    return hits
+
 class FAISSVectorStore:
     def __init__(self):
         self.index = None
-        self.metadata = []
+        self.metadata = ChunkStore.from_records([])  # store[i] = {"content", "metadata"}
         self.embedding_dimension = None
+        self.bm25 = None  # BM25Index trên cùng chunks, None = chưa build (hybrid search → dense)
+        self.vectors = None  # float32 (n, d) để re-score index nén (mmap sau khi lưu / load), None = không re-score
+        self.paths = None  # IndexPaths đã load / lưu gần nhất (paths.version = version trên đĩa)
+        self.version = next(_versions)
+        self._selections = OrderedDict()  # (version, filter key) → _Selection, LRU
+        self._selections_lock = threading.Lock()
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def close(self):
+        """Giải phóng tài nguyên ngoài process (store một khối không có, xem ShardedVectorStore)"""
+
+    @staticmethod
+    def exists() -> bool:
+        """Đã có index + chunk store (version CURRENT, hoặc bố cục cũ / metadata pickle) trên đĩa chưa"""
+        return index_exists()
     
-    def create_index(self, embeddings: np.ndarray, metadata: list):
+    def create_index(self, embeddings: np.ndarray, metadata: list, index_type: str = FAISS_INDEX_TYPE):
         """
         Tạo FAISS index từ embeddings
+        index_type: flat (chính xác) hoặc ANN: ivf_flat | ivf_pq | hnsw | opq_ivf_pq | sq8 | sq_fp16
         """
         logger.info("🔨 TẠO FAISS INDEX")
         logger.info(f"   Embeddings shape: {embeddings.shape}")
@@ -31,88 +114,418 @@ class FAISSVectorStore:
             embeddings = embeddings.astype(np.float32)
             self.embedding_dimension = embeddings.shape[1]
             
-            # Tạo index (L2 distance - cosine similarity)
-            self.index = faiss.IndexFlatIP(self.embedding_dimension)
-            self.index.add(embeddings)
+            # Inner product trên vectors đã normalize = cosine similarity
+            self.index = build_index(embeddings, index_type)
+            enable_reconstruct(self.index)
+            self.vectors = embeddings if _keeps_vectors(index_type) else None
             
-            self.metadata = metadata
+            self.metadata = ChunkStore.from_records(metadata)
+            self.bm25 = None
+            self.version = next(_versions)
             
             logger.info(f"✅ Index tạo thành công: {self.index.ntotal} vectors\n")
         
         except Exception as e:
             logger.error(f"❌ Lỗi tạo index: {str(e)}")
             raise
+
+    def build_streaming(self, batches, index_type: str = FAISS_INDEX_TYPE, paths: IndexPaths = None):
+        """
+        Tạo và lưu index từ iterator các batch (embeddings, records) mà không giữ toàn bộ
+        trong bộ nhớ: vectors được add dần vào index, records ghi thẳng vào chunk store trên đĩa.
+        Kết quả là một version mới, chỉ được publish (CURRENT) khi đã ghi xong.
+        paths: ghi vào thư mục cho trước (một shard của version đang build) và không publish
+        """
+        logger.info("🔨 TẠO FAISS INDEX (STREAMING)")
+        
+        publishing = paths is None
+        if publishing:
+            paths = new_version()
+        else:
+            Path(paths.index).parent.mkdir(parents=True, exist_ok=True)
+        builder = IncrementalIndexBuilder(index_type)
+        writer = ChunkStoreWriter(paths.chunks)
+        vectors = open(paths.vectors, 'wb') if _keeps_vectors(index_type) else None
+        try:
+            for embeddings, records in batches:
+                builder.add(embeddings)
+                writer.append(records)
+                if vectors is not None:
+                    vectors.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+            
+            index = builder.finish()
+            if index is None:
+                raise ValueError("Không có chunk nào để tạo index")
+            enable_reconstruct(index)
+            
+            self.metadata = writer.close()
+            if vectors is not None:
+                vectors.close()
+            faiss.write_index(index, paths.index)
+            self._write_info(paths.info)
+            self.build_lexical_index()
+            self.bm25.save(paths.bm25)
+            if publishing:
+                publish(paths)
+        except BaseException as e:
+            # Lỗi ở bất kỳ bước ghi nào → không để lại version ghi dở
+            writer.abort()
+            if vectors is not None:
+                vectors.close()
+            discard(paths)
+            logger.error(f"❌ Lỗi tạo index: {str(e)}")
+            raise
+        
+        self.index = index
+        self.embedding_dimension = index.d
+        self.vectors = self._load_vectors(paths.vectors)
+        self.paths = paths
+        self.version = next(_versions)
+        
+        logger.info(f"   Index: {paths.index}")
+        logger.info(f"   Chunks: {paths.chunks}")
+        logger.info(f"   BM25: {paths.bm25}")
+        logger.info(f"✅ Index tạo + lưu thành công: {self.index.ntotal} vectors\n")
     
+    def add(self, embeddings: np.ndarray, metadata: list):
+        """Thêm vectors mới vào cuối index hiện có"""
+        if self.index is None:
+            self.create_index(embeddings, metadata)
+            return
+
+        self.index.add(embeddings.astype(np.float32))
+        if self.vectors is not None:
+            self.vectors = np.concatenate([self.vectors, embeddings.astype(np.float32)])
+        self.metadata = self.metadata.extend(metadata)
+        self.bm25 = None
+        self.version = next(_versions)
+        logger.info(f"➕ Thêm {len(metadata)} vectors (tổng: {self.index.ntotal})")
+
+    def remove_pages(self, page_keys: set) -> int:
+        """
+        Xóa vectors của các trang (source, page) khỏi index.
+        IndexFlat dồn các vector còn lại giữ nguyên thứ tự nên metadata được lọc tương ứng.
+        """
+        if not is_exact(self.index):
+            raise ValueError("Chỉ xóa được vectors trên flat index, hãy build lại index ANN")
+
+        stale_ids = self.metadata.rows_for_pages(page_keys)
+        if not len(stale_ids):
+            return 0
+
+        removed = self.index.remove_ids(stale_ids.astype(np.int64))
+        keep = np.ones(len(self.metadata), dtype=bool)
+        keep[stale_ids] = False
+        self.metadata = self.metadata.select(np.flatnonzero(keep))
+        self.bm25 = None
+        self.version = next(_versions)
+
+        logger.info(f"➖ Xóa {removed} vectors của {len(page_keys)} trang cũ (còn: {self.index.ntotal})")
+        return removed
+
+    def build_lexical_index(self):
+        """Build BM25 index từ nội dung chunk store (doc id = id vector trong FAISS)"""
+        logger.info(f"🔤 Build BM25 index: {len(self.metadata)} chunks")
+        self.bm25 = BM25Index.build(self.metadata.content(i) for i in range(len(self.metadata)))
+        logger.info(f"   Terms: {self.bm25.num_terms}")
+
     def save(self):
-        """Lưu index và metadata"""
+        """Lưu index và metadata thành version mới rồi publish (version đang được đọc không bị ghi đè)"""
         logger.info("💾 LƯU FAISS INDEX")
         
+        paths = new_version()
         try:
-            Path(FAISS_INDEX_PATH).parent.mkdir(parents=True, exist_ok=True)
-            
-            faiss.write_index(self.index, FAISS_INDEX_PATH)
-            with open(FAISS_METADATA_PATH, 'wb') as f:
-                pickle.dump(self.metadata, f)
+            faiss.write_index(self.index, paths.index)
+            if self.vectors is not None:
+                np.ascontiguousarray(self.vectors, dtype=np.float32).tofile(paths.vectors)
+            self._write_info(paths.info)
+            self.metadata.save(paths.chunks)
+            if self.bm25 is None:
+                self.build_lexical_index()
+            self.bm25.save(paths.bm25)
+            publish(paths)
+            if self.vectors is not None:
+                self.vectors = self._load_vectors(paths.vectors)
+            self.paths = paths
             
-            logger.info(f"   Index: {FAISS_INDEX_PATH}")
-            logger.info(f"   Metadata: {FAISS_METADATA_PATH}")
+            logger.info(f"   Index: {paths.index}")
+            logger.info(f"   Chunks: {paths.chunks}")
+            logger.info(f"   BM25: {paths.bm25}")
             logger.info("✅ Lưu thành công\n")
         
         except Exception as e:
+            discard(paths)
             logger.error(f"❌ Lỗi lưu: {str(e)}")
             raise
     
-    def load(self):
-        """Load index từ disk"""
+    def load(self, paths: IndexPaths = None):
+        """Load index từ disk (mặc định version CURRENT)"""
         logger.info("📂 LOAD FAISS INDEX")
         
         try:
-            if not Path(FAISS_INDEX_PATH).exists():
-                raise FileNotFoundError(f"Index không tồn tại: {FAISS_INDEX_PATH}")
+            paths = paths or current_paths()
+            if not Path(paths.index).exists():
+                raise FileNotFoundError(f"Index không tồn tại: {paths.index}")
             
-            self.index = faiss.read_index(FAISS_INDEX_PATH)
-            with open(FAISS_METADATA_PATH, 'rb') as f:
-                self.metadata = pickle.load(f)
+            self._check_info(paths.info)
+            self.index = faiss.read_index(paths.index)
+            enable_reconstruct(self.index)
+            self.vectors = self._load_vectors(paths.vectors)
+            if paths.version is None and not Path(paths.chunks).exists() and Path(FAISS_METADATA_PATH).exists():
+                self._migrate_pickle_metadata()
+            self.metadata = ChunkStore.load(paths.chunks)
+            self.bm25 = self._load_lexical_index(paths.bm25)
             
             self.embedding_dimension = self.index.d
+            self.paths = paths
+            self.version = next(_versions)
+            set_search_params(self.index)
             
+            if paths.version is not None:
+                logger.info(f"   Version: {paths.version}")
             logger.info(f"   Vectors: {self.index.ntotal}")
             logger.info(f"   Dimension: {self.embedding_dimension}")
+            if self.vectors is not None:
+                logger.info(f"   Re-score chính xác: shortlist k x {RESCORE_FACTOR} (vectors float32 mmap)")
             logger.info("✅ Load thành công\n")
         
         except Exception as e:
             logger.error(f"❌ Lỗi load: {str(e)}")
             raise
     
-    def search(self, query_embedding: np.ndarray, k: int = TOP_K) -> list:
+    @staticmethod
+    def _write_info(path: str):
+        """Ghi model + prefix scheme embedding của index (info.json)"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(index_signature(), f, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def _check_info(path: str):
+        """
+        Từ chối index build bằng model / prefix khác config hiện tại (query sẽ nằm ở không gian vector khác).
+        Index cũ chưa có info.json được coi là build bằng EMBEDDING_MODEL hiện tại, không prefix.
+        """
+        expected = index_signature()
+        if Path(path).exists():
+            with open(path, 'r', encoding='utf-8') as f:
+                info = json.load(f)
+        else:
+            info = {"embedding_model": expected["embedding_model"], "query_prefix": "", "passage_prefix": ""}
+
+        mismatched = [key for key in expected if info.get(key) != expected[key]]
+        if mismatched:
+            details = ", ".join(f"{key}: {info.get(key)!r} ≠ {expected[key]!r}" for key in mismatched)
+            raise ValueError(f"Index không khớp embedding hiện tại ({details}) → chạy lại train_rag.py")
+
+    def _load_vectors(self, path: str):
+        """Map vectors float32 để re-score (chỉ các dòng trong shortlist được đọc), None nếu không có"""
+        if path is None or not Path(path).exists():
+            return None
+        vectors = np.memmap(path, dtype=np.float32, mode='r').reshape(-1, self.index.d)
+        if len(vectors) != self.index.ntotal:
+            logger.warning(f"   ⚠️ Vectors re-score ({len(vectors)}) không khớp index ({self.index.ntotal}), bỏ qua")
+            return None
+        return vectors
+
+    def _load_lexical_index(self, path: str):
+        """BM25 index đã lưu, None nếu chưa có hoặc không khớp chunk store (cần train lại)"""
+        if not Path(path).exists():
+            logger.warning(f"   ⚠️ Chưa có BM25 index ({path}), hybrid search dùng dense")
+            return None
+
+        bm25 = BM25Index.load(path)
+        if len(bm25) != len(self.metadata):
+            logger.warning(f"   ⚠️ BM25 index ({len(bm25)} chunks) không khớp chunk store ({len(self.metadata)}), bỏ qua")
+            return None
+        return bm25
+
+    def _migrate_pickle_metadata(self):
+        """Chuyển metadata pickle (định dạng cũ) sang chunk store một lần duy nhất"""
+        logger.info(f"   Chuyển {FAISS_METADATA_PATH} → {LEGACY_PATHS.chunks}")
+        with open(FAISS_METADATA_PATH, 'rb') as f:
+            records = pickle.load(f)
+        ChunkStore.from_records(records).save(LEGACY_PATHS.chunks)
+
+    def embeddings(self) -> np.ndarray:
+        """Toàn bộ vectors (n, d) theo id: vectors float32 nếu có, ngược lại tái tạo từ index"""
+        if self.vectors is not None:
+            return np.asarray(self.vectors, dtype=np.float32)
+        if not is_exact(self.index):
+            logger.warning("⚠️ Index không phải flat → vectors tái tạo là xấp xỉ")
+        return reconstruct_all(self.index)
+
+    def set_search_params(self, nprobe: int = None, ef_search: int = None):
+        """Chỉnh nprobe (IVF) / efSearch (HNSW) lúc query để đổi recall lấy tốc độ"""
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+        with self._selections_lock:
+            self._selections.clear()  # SearchParameters đã cache mang nprobe / efSearch cũ
+
+    def _selection(self, search_filter) -> _Selection:
+        """Bitmap + FAISS IDSelector của SearchFilter, cache FILTER_CACHE_SIZE filter gần nhất"""
+        key = (self.version, search_filter.key)
+        with self._selections_lock:
+            selection = self._selections.get(key)
+            if selection is not None:
+                self._selections.move_to_end(key)
+                return selection
+
+        mask = self.metadata.mask(search_filter)
+        count = int(np.count_nonzero(mask))
+        bits = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bits))
+        params = search_parameters(self.index, selector, count / max(len(mask), 1))
+        selection = _Selection(mask, count, params, (bits, selector))
+        logger.debug(f"{search_filter}: {count}/{len(mask)} chunks")
+
+        with self._selections_lock:
+            self._selections[key] = selection
+            while len(self._selections) > FILTER_CACHE_SIZE:
+                self._selections.popitem(last=False)
+        return selection
+
+    def _dense_search(self, queries: np.ndarray, k: int, selection: _Selection) -> tuple:
+        """
+        index.search, chỉ trên các id được chọn nếu có selection.
+        Index nén có vectors: lấy shortlist k * RESCORE_FACTOR từ codes rồi re-score chính xác → top-k
+        """
+        fetch = k if self.vectors is None else k * RESCORE_FACTOR
+        if selection is None:
+            distances, indices = self.index.search(queries, fetch)
+        else:
+            distances, indices = self.index.search(queries, fetch, params=selection.params)
+        if self.vectors is None:
+            return distances, indices
+        return rescore(queries, indices, self.vectors, k)
+
+    def search(self, query_embedding: np.ndarray, k: int = TOP_K, search_filter=None) -> list:
         """
         Semantic search với FAISS
         Trả về top K results với similarity score
+        search_filter: SearchFilter (source / khoảng trang / metadata), lọc ngay trong lúc search
+        """
+        return self.search_batch(query_embedding.reshape(1, -1), k, search_filter)[0]
+
+    def search_batch(self, query_matrix: np.ndarray, k: int = TOP_K, search_filter=None) -> list:
+        """
+        Search nhiều query trong một lần gọi index.search.
+        query_matrix: (n_queries, d) → list n_queries danh sách kết quả (cùng dạng với search)
         """
         try:
-            query_embedding = query_embedding.astype(np.float32).reshape(1, -1)
+            queries = np.ascontiguousarray(query_matrix, dtype=np.float32).reshape(-1, self.index.d)
+            selection = self._selection(search_filter) if search_filter else None
+            if selection is not None and not selection.count:
+                return [[] for _ in range(len(queries))]
             
-            # FAISS tính L2 distance, ta chuyển sang cosine similarity
-            distances, indices = self.index.search(query_embedding, k)
+            # Inner product trên vectors đã normalize = cosine similarity
+            distances, indices = self._dense_search(queries, k, selection)
+            
+            # FAISS trả -1 khi index có ít hơn k vectors; bật/tắt threshold
+            valid = indices >= 0
+            if USE_SIMILARITY_THRESHOLD:
+                valid &= distances >= SIMILARITY_THRESHOLD
+            
+            # Chỉ decode mỗi chunk trúng một lần, kể cả khi nhiều query cùng trả về nó
+            chunks = {int(idx): self.metadata[int(idx)] for idx in np.unique(indices[valid])}
+            scores = np.round(distances.astype(np.float64), 4).tolist()
             
             results = []
-            for i, (idx, distance) in enumerate(zip(indices[0], distances[0])):
-                similarity = float(distance)   
-                
-                # Bật/tắt threshold
-                if USE_SIMILARITY_THRESHOLD and similarity < SIMILARITY_THRESHOLD:
-                    continue
-                
-                results.append({
-                    "rank": i + 1,
-                    "content": self.metadata[idx]["content"],
-                    "metadata": self.metadata[idx]["metadata"],
-                    "similarity": round(similarity, 4),
-                    "distance": round(distance, 4)
-                })
+            for row, ids, row_valid in zip(scores, indices.tolist(), valid):
+                results.append([
+                    {
+                        "rank": j + 1,
+                        "id": ids[j],
+                        "content": chunks[ids[j]]["content"],
+                        "metadata": dict(chunks[ids[j]]["metadata"]),
+                        "similarity": row[j],
+                        "distance": row[j]
+                    }
+                    for j in np.flatnonzero(row_valid).tolist()
+                ])
             
             return results
         
         except Exception as e:
             logger.error(f"❌ Lỗi search: {str(e)}")
             raise
+
+    def search_hybrid(self, query_text: str, query_embedding: np.ndarray, k: int = TOP_K, search_filter=None) -> list:
+        """Hybrid search một query (xem search_hybrid_batch)"""
+        return self.search_hybrid_batch([query_text], query_embedding.reshape(1, -1), k, search_filter)[0]
+
+    def search_hybrid_batch(self, query_texts: list, query_matrix: np.ndarray, k: int = TOP_K,
+                            search_filter=None) -> list:
+        """
+        Hybrid search: top HYBRID_CANDIDATES theo dense (một lần gọi index.search cho cả batch)
+        và theo BM25, gộp bằng Reciprocal Rank Fusion: score = sum 1 / (RRF_K + rank).
+        Kết quả cùng dạng với search_batch, thêm "rrf_score" và "bm25_score" (None nếu không khớp từ khóa).
+        search_filter: cả hai nhánh chỉ xét chunk thỏa điều kiện (IDSelector cho FAISS, bitmap cho BM25).
+        Chưa có BM25 index → search_batch.
+        """
+        if self.bm25 is None:
+            return self.search_batch(query_matrix, k, search_filter)
+
+        try:
+            queries = np.ascontiguousarray(query_matrix, dtype=np.float32).reshape(-1, self.index.d)
+            candidates = self.candidates(query_texts, queries, max(k, HYBRID_CANDIDATES), search_filter)
+
+            results = []
+            for dense, lexical, lexical_similarity in candidates:
+                top, fused = rrf_fuse(dense, lexical, k)
+                for idx in top:
+                    if idx not in dense:
+                        dense[idx] = lexical_similarity.get(idx)
+                results.append(hybrid_hits(top, fused, dense, lexical, self.metadata.__getitem__))
+
+            return results
+
+        except Exception as e:
+            logger.error(f"❌ Lỗi search: {str(e)}")
+            raise
+
+    def candidates(self, query_texts, queries: np.ndarray, n: int, search_filter=None) -> list:
+        """
+        Ứng viên của từng query trước khi gộp: list (dense, lexical, lexical_similarity)
+        - dense, lexical: dict id → score theo thứ tự rank (dense: similarity top n; lexical: BM25 top n,
+          rỗng nếu query_texts là None hoặc chưa có BM25 index)
+        - lexical_similarity: id → cosine similarity của các ứng viên BM25
+        USE_SIMILARITY_THRESHOLD áp dụng cho cả hai nhánh; ứng viên BM25 không tính được similarity
+        (index không reconstruct được) được giữ lại.
+        """
+        selection = self._selection(search_filter) if search_filter else None
+        if selection is not None and not selection.count:
+            return [({}, {}, {}) for _ in range(len(queries))]
+        distances, indices = self._dense_search(queries, n, selection)
+        mask = selection.mask if selection is not None else None
+
+        candidates = []
+        for i, (row_distances, row_ids) in enumerate(zip(distances, indices)):
+            valid = row_ids >= 0
+            if USE_SIMILARITY_THRESHOLD:
+                valid &= row_distances >= SIMILARITY_THRESHOLD
+            dense = dict(zip(row_ids[valid].tolist(), row_distances[valid].tolist()))
+            lexical, lexical_similarity = {}, {}
+            if query_texts is not None and self.bm25 is not None:
+                lexical_ids, lexical_scores = self.bm25.search(query_texts[i], n, mask)
+                lexical = dict(zip(lexical_ids.tolist(), lexical_scores.tolist()))
+                missing = [idx for idx in lexical if idx not in dense]
+                lexical_similarity = dict(zip(missing, self.similarities(queries[i], missing))) if missing else {}
+                if USE_SIMILARITY_THRESHOLD:
+                    lexical = {
+                        idx: score for idx, score in lexical.items()
+                        if idx in dense or lexical_similarity[idx] is None
+                        or lexical_similarity[idx] >= SIMILARITY_THRESHOLD
+                    }
+                lexical_similarity = {idx: lexical_similarity.get(idx, dense.get(idx)) for idx in lexical}
+            candidates.append((dense, lexical, lexical_similarity))
+        return candidates
+
+    def similarities(self, query: np.ndarray, ids: list) -> list:
+        """Cosine similarity query với các vector trong index (None nếu index không reconstruct được, vd. PQ)"""
+        if self.vectors is not None:
+            return (self.vectors[np.array(ids, dtype=np.int64)] @ query).astype(np.float64).tolist()
+        try:
+            # Chỉ đọc index: direct map của IVF đã được tạo lúc build / load (enable_reconstruct)
+            vectors = self.index.reconstruct_batch(np.array(ids, dtype=np.int64))
+        except RuntimeError:
+            return [None] * len(ids)
+        return (vectors @ query).astype(np.float64).tolist()